@@ -1,12 +1,16 @@
 import os
 from src.extractor import create_extractor
 from src.sql_chain import create_agent
+from src import instrumentation
 from dotenv import load_dotenv
 import chainlit as cl
 import json
+import logging
+from copy import deepcopy
 # Loading the environment variables
 load_dotenv(".env")
 # Create the extractor and agent
+logger = logging.getLogger(__name__)
 
 model = os.getenv('OPENAI_MODEL')
 # Check if model exists, if not, set it to default
@@ -47,6 +51,9 @@ async def on_chat_start():
             cl.user_session.set("openai_api_key", res.get("output"))
             try:
                 os.environ["OPENAI_API_KEY"] = res.get("output")
+                if ag is not None:
+                    # The agent of the previous key no longer watches the examples file
+                    ag.examples.stop()
                 ex = create_extractor()
                 ag = create_agent(llm_model=model)
                 interactive_key_done= True
@@ -91,7 +98,7 @@ def validate_func(properties:dict):  # Auto validate as much as possible
     validated, need_input = ex.validate_chainlit(properties)
     return validated, need_input
 
-def human_validate_func(human, validated, user_prompt):
+def human_validate_func(human, validated, user_prompt, extracted):
     """
 
     Parameters
@@ -99,10 +106,11 @@ def human_validate_func(human, validated, user_prompt):
     human - Human validated properties in the form of a list of dictionaries
     validated - Validated properties in the form of a dictionary
     user_prompt - The user prompt
+    extracted - The properties extracted from the user prompt, before validation
 
     Returns
     -------
-    The cleaned prompt with updated values
+    The cleaned prompt with updated values, and its template bindings for ask
     """
     for item in human:
         # Iterate through key-value pairs in the current dictionary
@@ -118,35 +126,37 @@ def human_validate_func(human, validated, user_prompt):
                 validated[key] = [value]
     val_list = [validated]
 
-    return ex.build_prompt_chainlit(val_list, user_prompt)
+    return ex.build_prompt_chainlit(val_list, user_prompt, extracted, return_bindings=True)
 
-def no_human(validated, user_prompt):
+def no_human(validated, user_prompt, extracted):
     """
     In case there is no need for human validation, this function will be called
     Parameters
     ----------
     validated
     user_prompt
+    extracted
 
     Returns
     -------
-    Updated prompt
+    Updated prompt, and its template bindings for ask
     """
-    return ex.build_prompt_chainlit([validated], user_prompt)
+    return ex.build_prompt_chainlit([validated], user_prompt, extracted, return_bindings=True)
 
 
-def ask(text):
+def ask(text, bindings=None):
     """
     Calls the SQL Agent to get the final answer
     Parameters
     ----------
     text
+    bindings - The template bindings of text, from the same message
 
     Returns
     -------
     The final answer
     """
-    ans, const = ag.ask(text)
+    ans, const = ag.ask(text, bindings=bindings)
     return {"output": ans["output"]}, 12
 
 
@@ -156,8 +166,8 @@ async def Cleaner(text):  # just for printing
 
 
 @cl.step
-async def LLM(cleaned_prompt):  # just for printing
-    ans, const = ask(cleaned_prompt)
+async def LLM(cleaned_prompt, bindings=None):  # just for printing
+    ans, const = ask(cleaned_prompt, bindings)
     return ans, const
 
 
@@ -179,46 +189,54 @@ async def main(message: cl.Message):
             content=f"Please set the OpenAI API key first by starting a new chat.",
         ).send()
         return
-    user_prompt = message.content # Get the user prompt
-    # extracted_values = extract_func(user_prompt)
-    #
-    # json_formatted = json.dumps(extracted_values, indent=4)
-    extracted_values = await Extractor(user_prompt)
-    json_formatted = json.dumps(extracted_values, indent=4)
-    # Print the extracted values in json format
-    await cl.Message(author="Extractor", content=f"Extracted properties:\n```json\n{json_formatted}\n```").send()
-    # Try to validate everything
-    validated, need_input = validate_func(extracted_values)
-    await cl.Message(author="Validator", content=f"Extracted properties will now be validated against the database.").send()
-    if need_input:
-        # If we need validation, we will ask the user to select the correct value
-        for element in need_input:
-            key = next(iter(element))  # Get the first key in the dictionary
-            # Present user with options to choose from
-            actions = [
-                cl.Action(name="option", value=value, label=value)
-                for value in element['top_matches']
-            ]
-            actions.append(cl.Action(name="No Update", value="", description="No Update"))
-            await cl.Message(author="Resolver", content=f"Need to identify the correct value for {key}: ").send()
-            res = await cl.AskActionMessage(author="Resolver",
-                content=f"Which one do you mean for {key}?", 
-                actions=actions
-            ).send()
-            selected_value = res.get("value") if res else ""
-            element[key] = selected_value
-            element.pop("top_matches")
-            await Choice("Options were "+ ", ".join([action.label for action in actions]))
-        # Get the cleaned prompt
-        cleaned_prompt = human_validate_func(need_input, validated, user_prompt)
-    else:
-        cleaned_prompt = no_human(validated, user_prompt)
-    # Print the cleaned prompt
-    cleaner_message = cl.Message(author="Cleaner", content=f"New prompt is as follows:\n{cleaned_prompt}")
-    await cleaner_message.send()
-
-    # Call the SQL agent to get the final answer
-    # ans, const = ask(cleaned_prompt)  # Get the final answer from some function
-    await cl.Message(content=f"I will now query the database for information.").send()
-    ans, const = await LLM(cleaned_prompt)
-    await cl.Message(content=f"This is the final answer: \n\n{ans['output']}").send()
+    # Timed per stage when instrumentation is on, like main_cli.query, see src/instrumentation.py
+    with instrumentation.request("chainlit") as breakdown:
+        user_prompt = message.content # Get the user prompt
+        # extracted_values = extract_func(user_prompt)
+        #
+        # json_formatted = json.dumps(extracted_values, indent=4)
+        extracted_values = await Extractor(user_prompt)
+        # The state of one message stays in this handler, ex and ag are shared by all the sessions
+        extracted = deepcopy(extracted_values)
+        json_formatted = json.dumps(extracted_values, indent=4)
+        # Print the extracted values in json format
+        await cl.Message(author="Extractor", content=f"Extracted properties:\n```json\n{json_formatted}\n```").send()
+        # Try to validate everything
+        validated, need_input = validate_func(extracted_values)
+        await cl.Message(author="Validator", content=f"Extracted properties will now be validated against the database.").send()
+        if need_input:
+            # If we need validation, we will ask the user to select the correct value
+            for element in need_input:
+                key = next(iter(element))  # Get the first key in the dictionary
+                # Present user with options to choose from
+                actions = [
+                    cl.Action(name="option", value=value, label=value)
+                    for value in element['top_matches']
+                ]
+                actions.append(cl.Action(name="No Update", value="", description="No Update"))
+                await cl.Message(author="Resolver", content=f"Need to identify the correct value for {key}: ").send()
+                # The user's choice is timed apart, not to count it as the time of a stage
+                with instrumentation.span("chainlit.user_choice"):
+                    res = await cl.AskActionMessage(author="Resolver",
+                        content=f"Which one do you mean for {key}?", 
+                        actions=actions
+                    ).send()
+                selected_value = res.get("value") if res else ""
+                element[key] = selected_value
+                element.pop("top_matches")
+                await Choice("Options were "+ ", ".join([action.label for action in actions]))
+            # Get the cleaned prompt
+            cleaned_prompt, bindings = human_validate_func(need_input, validated, user_prompt, extracted)
+        else:
+            cleaned_prompt, bindings = no_human(validated, user_prompt, extracted)
+        # Print the cleaned prompt
+        cleaner_message = cl.Message(author="Cleaner", content=f"New prompt is as follows:\n{cleaned_prompt}")
+        await cleaner_message.send()
+
+        # Call the SQL agent to get the final answer
+        # ans, const = ask(cleaned_prompt)  # Get the final answer from some function
+        await cl.Message(content=f"I will now query the database for information.").send()
+        ans, const = await LLM(cleaned_prompt, bindings)
+        await cl.Message(content=f"This is the final answer: \n\n{ans['output']}").send()
+    if breakdown is not None:
+        logger.info("Timings: %s", json.dumps(breakdown.to_dict()))
@@ -0,0 +1,80 @@
+"""
+Compare process_json_files with the bulk loader on a synthetic corpus.
+
+    python -m benchmarks.bench_bulk_ingest --games 10 --workers 4
+
+Each path loads the same corpus into its own database file: process_json_files, the bulk loader on one
+core and, with --workers, the bulk loader parsing on a process pool. The script checks that every table
+ends up with the same rows and prints games/sec and rows/sec for each path.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_corpus
+
+
+def table_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    # The storage of the full-text index (shadow tables) depends on how the rows were batched, its content does not
+    tables = [row[0] for row in conn.execute("SELECT name FROM pragma_table_list WHERE schema = 'main' AND "
+                                             "type IN ('table', 'virtual') AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    rows = {table: conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall() for table in tables}
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leagues', type=int, default=2)
+    parser.add_argument('--seasons', type=int, default=2)
+    parser.add_argument('--games', type=int, default=5, help='Games per league and season')
+    parser.add_argument('--batch-games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=0, help='Also run the bulk loader with a parsing pool')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        orm_db = os.path.join(tmp, "orm.db")
+        corpus = os.path.join(tmp, "SoccerNet")
+        games = generate_corpus(corpus, leagues=args.leagues, seasons=args.seasons, games=args.games)
+
+        # process_json_files writes to the DATABASE_PATH database
+        os.environ["DATABASE_PATH"] = orm_db
+        from sqlalchemy import create_engine
+        from src.database import process_json_files
+        from src.ingest import bulk_process_json_files
+
+        start = time.perf_counter()
+        process_json_files(corpus)
+        orm_seconds = time.perf_counter() - start
+
+        runs = {"bulk": 1}
+        if args.workers > 1:
+            runs[f"bulk, {args.workers} workers"] = args.workers
+        results = {}
+        for name, workers in runs.items():
+            db_path = os.path.join(tmp, f"bulk-{workers}.db")
+            bulk_engine = create_engine(f"sqlite:///{db_path}")
+            stats = bulk_process_json_files(corpus, engine=bulk_engine, batch_games=args.batch_games,
+                                            workers=workers)
+            results[name] = (stats, table_rows(db_path))
+
+        orm_rows = table_rows(orm_db)
+        rows = sum(len(r) for r in orm_rows.values())
+
+    print(f"\n{games} games, {rows} rows")
+    print(f"{'process_json_files':28} {orm_seconds:8.2f}s {games / orm_seconds:8.1f} games/sec "
+          f"{rows / orm_seconds:10.0f} rows/sec")
+    for name, (stats, bulk_rows) in results.items():
+        # Only the bulk loader keeps a manifest
+        mismatched = [table for table in orm_rows
+                      if table != "ingest_manifest" and orm_rows[table] != bulk_rows.get(table)]
+        print(f"{name:28} {stats['seconds']:8.2f}s {games / stats['seconds']:8.1f} games/sec "
+              f"{stats['rows_per_sec']:10.0f} rows/sec  {orm_seconds / stats['seconds']:5.1f}x  "
+              + ("identical rows" if not mismatched else f"MISMATCH in {', '.join(mismatched)}"))
+
+
+if __name__ == "__main__":
+    main()
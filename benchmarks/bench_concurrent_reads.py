@@ -0,0 +1,127 @@
+"""
+Read throughput of concurrent sessions while an ingestion is writing.
+
+    python -m benchmarks.bench_concurrent_reads --readers 8 --seconds 5
+
+A synthetic database is loaded twice: once opened the way the modules used to (create_engine with the default
+rollback journal) and once through src.connection (WAL, busy_timeout, cache and mmap pragmas, read-only pooled
+engine for the readers). For each, a writer process keeps committing batches of commentary rows while reader
+threads run agent-style queries. The script reports queries/sec, "database is locked" errors and how many
+commits the writer got through while the readers were running.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.synthetic import generate_corpus
+
+QUERIES = [
+    "SELECT COUNT(*) FROM events WHERE label = 'Goal'",
+    "SELECT t.name, COUNT(*) FROM games g JOIN teams t ON g.home_team_id = t.id GROUP BY t.name",
+    "SELECT p.name, COUNT(*) FROM player_events pe JOIN players p ON pe.player_id = p.hash "
+    "WHERE pe.type = 3 GROUP BY p.name ORDER BY 2 DESC LIMIT 10",
+    "SELECT period, COUNT(*) FROM captions WHERE game_id = 1 GROUP BY period",
+]
+
+
+def writer(db_path, use_factory, stop, commits, rows_per_commit, interval):
+    if use_factory:
+        from src.connection import get_engine
+        engine = get_engine(db_path)
+    else:
+        engine = create_engine(f"sqlite:///{db_path}")
+    rows = [(1, 1, float(i), float(i + 1), "synthetic commentary written during the benchmark")
+            for i in range(rows_per_commit)]
+    while not stop.is_set():
+        with engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO commentary (game_id, period, event_time_start, event_time_end, "
+                                 "description) VALUES (?, ?, ?, ?, ?)", rows)
+        commits.value += 1
+        # Time the ingestion spends parsing the next batch
+        time.sleep(interval)
+
+
+def readers(engine, count, seconds):
+    done = [0] * count
+    locked = [0] * count
+    deadline = time.perf_counter() + seconds
+
+    def read(index):
+        while time.perf_counter() < deadline:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(QUERIES[done[index] % len(QUERIES)])).fetchall()
+                done[index] += 1
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                locked[index] += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / seconds, sum(locked)
+
+
+def load(db_path, corpus):
+    from src.ingest import bulk_process_json_files
+    engine = create_engine(f"sqlite:///{db_path}")
+    bulk_process_json_files(corpus, engine=engine)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--games', type=int, default=10, help='Games per league and season')
+    parser.add_argument('--rows-per-commit', type=int, default=5000)
+    parser.add_argument('--write-interval', type=float, default=0.05, help='Seconds between writer commits')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "SoccerNet")
+        generate_corpus(corpus, games=args.games)
+        from src.connection import get_engine
+
+        results = {}
+        for name, use_factory in (("default engine", False), ("src.connection", True)):
+            db_path = os.path.join(tmp, f"{name.split()[0]}.db")
+            load(db_path, corpus)
+            if use_factory:
+                get_engine(db_path).dispose()  # Switches the file to WAL
+                engine = get_engine(db_path, read_only=True)
+            else:
+                engine = create_engine(f"sqlite:///{db_path}")
+            idle, _ = readers(engine, args.readers, args.seconds)
+
+            stop = multiprocessing.Event()
+            commits = multiprocessing.Value("i", 0)
+            process = multiprocessing.Process(target=writer, args=(db_path, use_factory, stop, commits,
+                                                                   args.rows_per_commit, args.write_interval))
+            process.start()
+            time.sleep(0.5)
+            start_commits = commits.value
+            busy, locked = readers(engine, args.readers, args.seconds)
+            written = commits.value - start_commits
+            stop.set()
+            process.join()
+            engine.dispose()
+            results[name] = (idle, busy, locked, written)
+
+    print(f"\n{args.readers} readers, {args.seconds:.0f}s per run")
+    print(f"{'':16} {'idle q/s':>10} {'writing q/s':>12} {'locked errors':>14} {'writer commits':>15}")
+    for name, (idle, busy, locked, written) in results.items():
+        print(f"{name:16} {idle:>10.0f} {busy:>12.0f} {locked:>14} {written:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Lookup latency of Retriever.fuzzy_string as the vocabulary grows, thefuzz.process.extract against FuzzyIndex.
+
+    python -m benchmarks.bench_fuzzy --sizes 10000 50000 200000 --queries 200 --workers -1
+
+The queries are names of the vocabulary, with and without a typo, and first names or surnames alone. Every
+lookup is checked to return the same matches as the former implementation.
+
+The second table is the validation of one prompt naming 1 to 16 entities on the largest vocabulary, one
+lookup per entity against all of them in one batch (Retriever.fuzzy_strings) on --workers threads.
+
+The third table is abbreviated names ("E. Hazard", "Hazard", "Eden Hazard" for "Eden Alexander Hazard") on
+the largest vocabulary, fuzzy matched and looked up in the NameVariantIndex first, and how many of them each
+resolves to the name they abbreviate.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from thefuzz import process
+
+from benchmarks.bench_vocabulary import FIRST, LAST
+from src.matching import FuzzyIndex, select_matches
+from src.name_variants import NameVariantIndex
+
+
+def vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    names = {}
+    i = 0
+    while len(names) < size:
+        middle = f" {rng.choice(LAST)}" if i % 3 == 0 else ""
+        # Random letters stand in for the variety of real names
+        suffix = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(0, 4)))
+        names[f"{rng.choice(FIRST)}{middle} {rng.choice(LAST)}{suffix}"] = None
+        i += 1
+    return list(names)
+
+
+def queries(names, count, seed=0):
+    rng = random.Random(seed)
+
+    def typo(name):
+        i = rng.randrange(len(name) - 1)
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+    result = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            result.append(rng.choice(names))
+        elif kind == 1:
+            result.append(typo(rng.choice(names)))
+        elif kind == 2:
+            result.append(typo(typo(rng.choice(names))))
+        else:
+            result.append(rng.choice(FIRST + LAST))
+    return result
+
+
+def fuzzy_strings(index, prompts, limit=3, threshold=80, workers=1):
+    # Retriever.fuzzy_strings on an index
+    matches = index.extract_many(prompts, limit=limit, score_cutoff=threshold - 0.5, workers=workers)
+    low = [i for i, found in enumerate(matches) if not any(match[1] >= threshold for match in found)]
+    if low:
+        for i, found in zip(low, index.extract_many([prompts[i] for i in low], limit=limit, workers=workers)):
+            matches[i] = found
+    return [select_matches(found, threshold) for found in matches]
+
+
+def abbreviations(names, count, seed=0):
+    # (abbreviation, name) pairs, the initial and surname, the surname or the first name and surname
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        name = rng.choice(names)
+        words = name.split()
+        kind = i % 3
+        if kind == 0:
+            result.append((f"{words[0][0]}. {' '.join(words[1:])}", name))
+        elif kind == 1:
+            result.append((words[-1], name))
+        else:
+            result.append((f"{words[0]} {words[-1]}", name))
+    return result
+
+
+def variant_strings(variants, index, prompts, limit=3):
+    # Retriever.fuzzy_strings with name_variants
+    results = []
+    for prompt in prompts:
+        names = variants.lookup(prompt)
+        if len(names) == 1:
+            results.append(names[0])
+        elif names and len(names) <= limit:
+            results.append(names)
+        else:
+            results.append(fuzzy_strings(index, [prompt])[0])
+    return results
+
+
+def timed(function, prompts):
+    times, results = [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        results.append(function(prompt))
+        times.append((time.perf_counter() - start) * 1000)
+    return times, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=-1, help='Threads of the batched lookups, -1 for all cores')
+    parser.add_argument('--repeat', type=int, default=5, help='Prompts timed per number of entities')
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'build s':>8} {'extract ms':>11} {'index ms':>9} {'p95 ms':>7} {'speedup':>8}  same")
+    for size in args.sizes:
+        names = vocabulary(size)
+        prompts = queries(names, args.queries)
+        start = time.perf_counter()
+        index = FuzzyIndex(names)
+        build = time.perf_counter() - start
+
+        legacy_times, expected = timed(lambda prompt: select_matches(process.extract(prompt, names, limit=3)),
+                                       prompts)
+        index_times, results = timed(lambda prompt: fuzzy_strings(index, [prompt])[0], prompts)
+        legacy_ms, index_ms = statistics.median(legacy_times), statistics.median(index_times)
+        p95 = statistics.quantiles(index_times, n=20)[-1]
+        same = sum(a == b for a, b in zip(expected, results))
+        print(f"{size:8} {build:8.2f} {legacy_ms:11.2f} {index_ms:9.2f} {p95:7.2f} {legacy_ms / index_ms:7.1f}x"
+              f"  {same}/{len(prompts)}")
+
+    print(f"\n{'entities':>8} {'one by one ms':>14} {'batch ms':>9}  same")
+    for entities in (1, 2, 4, 8, 16):
+        batches = [prompts[i:i + entities] for i in range(0, entities * args.repeat, entities)]
+        one_times, expected = timed(lambda batch: [fuzzy_strings(index, [name])[0] for name in batch], batches)
+        batch_times, results = timed(lambda batch: fuzzy_strings(index, batch, workers=args.workers), batches)
+        print(f"{entities:8} {statistics.median(one_times):14.2f} {statistics.median(batch_times):9.2f}"
+              f"  {expected == results}")
+
+    start = time.perf_counter()
+    variants = NameVariantIndex((name, i) for i, name in enumerate(names))
+    build = time.perf_counter() - start
+    pairs = abbreviations(names, args.queries)
+    prompts = [prompt for prompt, _ in pairs]
+    fuzzy_times, fuzzy_results = timed(lambda prompt: fuzzy_strings(index, [prompt])[0], prompts)
+    variant_times, variant_results = timed(lambda prompt: variant_strings(variants, index, [prompt])[0], prompts)
+    print(f"\nabbreviated names, variant index built in {build:.2f} s")
+    print(f"{'':9} {'median ms':>10} {'p95 ms':>7}  resolved")
+    for name, times, results in (("fuzzy", fuzzy_times, fuzzy_results), ("variants", variant_times, variant_results)):
+        resolved = sum(result == expected for result, (_, expected) in zip(results, pairs))
+        print(f"{name:9} {statistics.median(times):10.2f} {statistics.quantiles(times, n=20)[-1]:7.2f}"
+              f"  {resolved}/{len(pairs)}")
+
+
+if __name__ == "__main__":
+    main()
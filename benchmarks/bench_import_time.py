@@ -0,0 +1,84 @@
+"""
+Import time of the src modules, measured with python -X importtime in a fresh interpreter per run.
+
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --module src.database --repeat 10 --top 10
+
+Each import runs in an empty working directory with DATABASE_PATH and OPENAI_API_KEY unset, so the report
+also shows whether a module fails without configuration or writes files when it is imported.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = ["src.database", "src.extractor", "src.sql_chain"]
+UNSET = ["DATABASE_PATH", "OPENAI_API_KEY"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Return [(depth, name, self_us, cumulative_us)] from the -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def import_once(module):
+    env = {key: value for key, value in os.environ.items() if key not in UNSET}
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, env=env,
+                                capture_output=True, text=True)
+        written = sorted(os.listdir(cwd))
+    entries = parse_importtime(result.stderr)
+    error = None
+    if result.returncode != 0:
+        error = [line for line in result.stderr.splitlines() if not line.startswith("import time:")][-1]
+    return entries, written, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', help='Module to import, can be repeated')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='Slowest direct imports to list per module')
+    args = parser.parse_args()
+
+    for module in args.module or MODULES:
+        times, children = [], {}
+        written, error = [], None
+        for _ in range(args.repeat):
+            entries, written, error = import_once(module)
+            if error:
+                break
+            index = next(i for i, entry in enumerate(entries) if entry[1] == module)
+            root_depth, _, _, cumulative = entries[index]
+            times.append(cumulative / 1000)
+            # A module is reported after its imports, its direct imports are the entries one level deeper
+            # between it and the previous entry at its own level
+            for depth, name, _, cumulative in reversed(entries[:index]):
+                if depth <= root_depth:
+                    break
+                if depth == root_depth + 1:
+                    children.setdefault(name, []).append(cumulative / 1000)
+        print(f"\n{module}")
+        if error:
+            print(f"  import failed: {error}")
+            continue
+        print(f"  best {min(times):8.1f} ms   median {statistics.median(times):8.1f} ms   ({args.repeat} runs)")
+        print(f"  files written on import: {', '.join(written) if written else 'none'}")
+        slowest = sorted(children.items(), key=lambda item: -min(item[1]))[:args.top]
+        for name, values in slowest:
+            print(f"    {min(values):8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Ingestion benchmark suite on a synthetic corpus: process_json_files, fill_Augmented_Team, fill_Augmented_League
+and, for comparison, bulk_process_json_files.
+
+    python -m benchmarks.bench_ingest_suite --leagues 3 --seasons 2 --games 20 --output ingest.json
+    python -m benchmarks.bench_ingest_suite --leagues 3 --seasons 2 --games 20 --baseline ingest.json
+
+Every stage runs in a fresh interpreter so its peak memory is its own. The report has games/sec and rows/sec
+per stage, the peak RSS and the size of the database after the stage. With --baseline the results are compared
+to an earlier --output file of the same corpus and the script exits with status 1 if a stage got slower or
+used more memory than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_streaming_memory import peak_rss_kb
+from benchmarks.synthetic import generate_corpus, generate_augmented_names
+
+# (stage, database) in the order they run, the augmented names are added to the process_json_files database
+STAGES = [("process_json_files", "orm.db"), ("fill_Augmented_Team", "orm.db"), ("fill_Augmented_League", "orm.db"),
+          ("bulk_process_json_files", "bulk.db")]
+
+
+def count_rows(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    tables = [row[0] for row in conn.execute("SELECT name FROM pragma_table_list WHERE schema = 'main' AND "
+                                             "type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables)
+    conn.close()
+    return rows
+
+
+def database_mb(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, db_path + "-wal") if os.path.exists(path)) / 2 ** 20
+
+
+def run_stage(stage, data_dir, db_path):
+    # Runs in the child process, the ORM functions write to DATABASE_PATH
+    os.environ["DATABASE_PATH"] = db_path
+    from src import database, ingest
+    corpus = os.path.join(data_dir, "SoccerNet")
+    rows = count_rows(db_path)
+    start = time.perf_counter()
+    if stage == "process_json_files":
+        database.process_json_files(corpus)
+    elif stage == "fill_Augmented_Team":
+        database.fill_Augmented_Team(os.path.join(data_dir, "augmented_teams.csv"))
+    elif stage == "fill_Augmented_League":
+        database.fill_Augmented_League(os.path.join(data_dir, "augmented_leagues.csv"))
+    else:
+        ingest.bulk_process_json_files(corpus)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "rows": count_rows(db_path) - rows, "peak_mb": peak_rss_kb() / 1024}))
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against baseline, as printable lines."""
+    regressions = []
+    for stage, result in results.items():
+        before = baseline.get(stage)
+        if not before:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append(f"{stage}: {result['seconds']:.2f}s, was {before['seconds']:.2f}s")
+        if result["peak_mb"] > before["peak_mb"] * (1 + tolerance):
+            regressions.append(f"{stage}: peak {result['peak_mb']:.0f} MB, was {before['peak_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leagues', type=int, default=2)
+    parser.add_argument('--seasons', type=int, default=2)
+    parser.add_argument('--games', type=int, default=10, help='Games per league and season')
+    parser.add_argument('--players', type=int, default=18, help='Squad size per team and game')
+    parser.add_argument('--annotations', type=int, default=60, help='Caption annotations per game')
+    parser.add_argument('--v2-annotations', type=int, default=120, help='Labels-v2 annotations per game')
+    parser.add_argument('--segments', type=int, default=200, help='ASR segments per half')
+    parser.add_argument('--skip', action='append', default=[], choices=[stage for stage, _ in STAGES])
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--baseline', help='Results of an earlier run (--output) to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown, 0.25 is 25%%')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_stage(*args.child)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        games = generate_corpus(os.path.join(tmp, "SoccerNet"), leagues=args.leagues, seasons=args.seasons,
+                                games=args.games, players=args.players, annotations=args.annotations,
+                                v2_annotations=args.v2_annotations, segments=args.segments)
+        generate_augmented_names(tmp, leagues=args.leagues, games=args.games)
+        for stage, db_name in STAGES:
+            if stage in args.skip:
+                continue
+            db_path = os.path.join(tmp, db_name)
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_ingest_suite", "--child", stage, tmp,
+                                     db_path], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            result["database_mb"] = database_mb(db_path)
+            results[stage] = result
+
+    print(f"\n{games} games ({args.leagues} leagues x {args.seasons} seasons x {args.games}), "
+          f"{args.segments} ASR segments per half")
+    print(f"{'stage':26} {'seconds':>8} {'games/sec':>10} {'rows':>9} {'rows/sec':>10} {'peak MB':>8} {'db MB':>7}")
+    for stage, result in results.items():
+        loads_games = stage.endswith("process_json_files")
+        games_per_sec = f"{games / result['seconds']:10.1f}" if loads_games else f"{'':>10}"
+        print(f"{stage:26} {result['seconds']:8.2f} {games_per_sec} {result['rows']:9} "
+              f"{result['rows'] / result['seconds']:10.0f} {result['peak_mb']:8.1f} {result['database_mb']:7.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"games": games, "arguments": {key: value for key, value in vars(args).items()
+                                                     if key not in ("output", "baseline", "child")},
+                       "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["games"] != games:
+            print(f"\nBaseline has {baseline['games']} games, not comparable")
+            sys.exit(2)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        print("\n" + ("\n".join(f"REGRESSION {line}" for line in regressions) if regressions
+                      else f"No regressions against {args.baseline}"))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Entity extraction of the README questions, LocalExtractor against the LLM.
+
+    python -m benchmarks.bench_local_extraction --players 20000 [--db data/games.db] [--llm]
+
+Without --db the questions run on a database with the teams and leagues of data/dataset/augmented_*.csv, their
+augmented names, the players of the questions and --players generated ones. Each extraction is compared to the
+entities a reader finds in the question (EXPECTED below, the text as written), and the table shows whether
+the auto mode kept the local result or would ask the LLM. --llm also runs the LLM extraction (needs
+OPENAI_API_KEY) for its latency and accuracy.
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_vocabulary import FIRST, LAST
+
+QUESTIONS = [
+    ("Is Manchester United in the database?",
+     {"team_name": ["Manchester United"]}),
+    ("Give me the total home goals for Bayern M in the 2014-15 season.",
+     {"team_name": ["Bayern M"], "year_season": ["2014-15"], "in_game_event": ["goals"]}),
+    ("Calculate home advantage for Real Madrid in the 2015-16 season",
+     {"team_name": ["Real Madrid"], "year_season": ["2015-16"]}),
+    ("How many goals did Messi score in the 15-16 season?",
+     {"person_name": ["Messi"], "year_season": ["15-16"], "in_game_event": ["goals"]}),
+    ("How many yellow-cards did Enzo Perez get in the 15-2016 season?",
+     {"person_name": ["Enzo Perez"], "year_season": ["15-2016"], "in_game_event": ["yellow-cards"]}),
+    ("List all teams that played a game against Napoli in 2016-17 season in seriea? Do not limit the number of "
+     "results", {"team_name": ["Napoli"], "year_season": ["2016-17"], "league": ["seriea"]}),
+    ("Give all the teams in the league ucl in the 2015-2016 season?",
+     {"league": ["ucl"], "year_season": ["2015-2016"]}),
+    ("Give me all games in epl with yellow cards in the first half in the 2015-2016 season",
+     {"league": ["epl"], "in_game_event": ["yellow cards"], "year_season": ["2015-2016"]}),
+    ("What teams and leagues has Adnan Januzaj play in?",
+     {"person_name": ["Adnan Januzaj"]}),
+    ("List ALL players that started a game for Las Palmas in the 2016-2017 season? Do NOT limit the number of "
+     "results .", {"team_name": ["Las Palmas"], "year_season": ["2016-2017"]}),
+    ("Did Ajax or Manchester United win the most games in the 2014-15 season?",
+     {"team_name": ["Ajax", "Manchester United"], "year_season": ["2014-15"]}),
+    ("How many yellow and red cards were given in the UEFA Champions League in the 2015-2016 season?",
+     {"in_game_event": ["yellow", "red cards"], "league": ["UEFA Champions League"], "year_season": ["2015-2016"]}),
+    ("Are Messi and C. Ronaldo in the database?",
+     {"person_name": ["Messi", "C. Ronaldo"]}),
+    ("How many goals did E. Hazard score in the game between Bournemouth and Chelsea in the 2015-2016 season?",
+     {"person_name": ["E. Hazard"], "team_name": ["Bournemouth", "Chelsea"], "year_season": ["2015-2016"],
+      "in_game_event": ["goals"]}),
+    ("How many yellow cards were given in the game between Bayern Munich and Shakhtar Donetsk in the 2014-15 UEFA "
+     "Champions League, and did anyone receive a red card?",
+     {"in_game_event": ["yellow cards", "red card"], "team_name": ["Bayern Munich", "Shakhtar Donetsk"],
+      "year_season": ["2014-15"], "league": ["UEFA Champions League"]}),
+    ("Make a list of when corners happened in the English Premier League (EPL) 2015-2016 season. Aggregate by a "
+     "period of 15 minutes.", {"in_game_event": ["corners"], "league": ["English Premier League", "EPL"],
+                               "year_season": ["2015-2016"]}),
+    ("What league is Manchester United, Arsenal, Bournemouth, Real Madrid, Chelsea, and Liverpool in?",
+     {"team_name": ["Manchester United", "Arsenal", "Bournemouth", "Real Madrid", "Chelsea", "Liverpool"]}),
+    ('How many players have "Aleksandar" as their first name in the database, and how many goals have they scored '
+     'in total?', {"person_name": ["Aleksandar"], "in_game_event": ["goals"]}),
+    ("What did the commentary say about the game between Arsenal and Southampton in the 2016-17 season?",
+     {"team_name": ["Arsenal", "Southampton"], "year_season": ["2016-17"]}),
+    ("Have Mesut Ozil, Pablo Insua, or Alex Pike played for West Ham or Barcelona?",
+     {"person_name": ["Mesut Ozil", "Pablo Insua", "Alex Pike"], "team_name": ["West Ham", "Barcelona"]}),
+]
+EXPECTED_PLAYERS = ["Lionel Messi", "Cristiano Ronaldo", "Enzo Pérez", "Adnan Januzaj", "Eden Hazard", "Mesut Özil",
+                    "Pablo Insúa", "Alex Pike", "Aleksandar Mitrović", "Aleksandar Dragović"]
+EVENT_LABELS = ["Goal", "Yellow card", "Red card", "Yellow->red card", "Corner", "Substitution", "Shots on target",
+                "Shots off target", "Foul", "Offside", "Penalty", "Clearance", "Kick-off", "Throw-in", "Ball out of play",
+                "Direct free-kick", "Indirect free-kick"]
+SEASONS = ["2014-2015", "2015-2016", "2016-2017"]
+
+
+def create_database(path, players, dataset="data/dataset", seed=0):
+    from src.connection import get_engine
+    from src.database import init_db
+
+    engine = init_db(get_engine(path))
+    with open(os.path.join(dataset, "augmented_teams.csv")) as f:
+        team_aliases = [(row["name"], row["augmented_name"].strip()) for row in csv.DictReader(f)]
+    with open(os.path.join(dataset, "augmented_leagues.csv")) as f:
+        league_aliases = [(row["name"], row["augmented_name"].strip())
+                          for row in csv.DictReader(f, skipinitialspace=True)]
+    teams = {name: i for i, name in enumerate(dict.fromkeys(name for name, _ in team_aliases), start=1)}
+    leagues = {name: i for i, name in enumerate(dict.fromkeys(name for name, _ in league_aliases), start=1)}
+    rng = random.Random(seed)
+    names = EXPECTED_PLAYERS + [f"{rng.choice(FIRST)} {rng.choice(LAST)}{i}" for i in range(players)]
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO teams (id, name) VALUES (?, ?)", [(i, name) for name, i in teams.items()])
+        conn.exec_driver_sql("INSERT INTO augmented_teams (team_id, augmented_name) VALUES (?, ?)",
+                             [(teams[name], alias) for name, alias in team_aliases])
+        conn.exec_driver_sql("INSERT INTO leagues (id, name) VALUES (?, ?)",
+                             [(i, name) for name, i in leagues.items()])
+        conn.exec_driver_sql("INSERT INTO augmented_leagues (league_id, augmented_name) VALUES (?, ?)",
+                             [(leagues[name], alias) for name, alias in league_aliases])
+        conn.exec_driver_sql("INSERT INTO players (hash, name) VALUES (?, ?)",
+                             [(f"h{i}", name) for i, name in enumerate(names)])
+        conn.exec_driver_sql("INSERT INTO games (id, season, league_id) VALUES (?, ?, ?)",
+                             [(i, season, 1) for i, season in enumerate(SEASONS, start=1)])
+        conn.exec_driver_sql("INSERT INTO events (game_id, label) VALUES (?, ?)", [(1, label) for label in EVENT_LABELS])
+    engine.dispose()
+
+
+def same(properties, expected):
+    from src.local_extraction import fold
+
+    def entities(properties):
+        merged = {}
+        for item in properties or []:
+            for name, values in item.items():
+                merged.setdefault(name, set()).update(fold(str(value))[0] for value in values or [])
+        return {name: values for name, values in merged.items() if values}
+
+    return entities(properties) == entities([expected])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing SoccerNet database, instead of the generated one')
+    parser.add_argument('--players', type=int, default=20000, help='Generated players besides those of the questions')
+    parser.add_argument('--llm', action='store_true', help='Also run the LLM extraction')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from src.extractor import PromptCleaner, load_json
+    from src.sql_database import get_database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "questions.db")
+            create_database(path, args.players)
+        db = get_database(f"sqlite:///{path}")
+        cleaner = PromptCleaner(db, load_json("src/conf/schema.json"), extraction="local", cache=False)
+        start = time.perf_counter()
+        cleaner.local_extractor.get_automaton()
+        build = time.perf_counter() - start
+
+        rows = []
+        for question, expected in QUESTIONS:
+            local_times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                properties, certain = cleaner.local_extractor.extract(question)
+                local_times.append((time.perf_counter() - start) * 1000)
+            llm_ms, llm_ok = None, None
+            if args.llm:
+                cleaner.extraction = "llm"
+                start = time.perf_counter()
+                llm_properties = cleaner.extract(question)
+                llm_ms = (time.perf_counter() - start) * 1000
+                llm_ok = same(llm_properties, expected)
+                cleaner.extraction = "local"
+            rows.append((question, certain, same(properties, expected), min(local_times), llm_ms, llm_ok, properties))
+        db._engine.dispose()
+
+    print(f"Automaton built in {build:.2f} s\n")
+    print(f"{'#':>3} {'auto':>5} {'local ok':>8} {'local ms':>9} {'llm ms':>8} {'llm ok':>6}  local result")
+    for i, (question, certain, ok, local_ms, llm_ms, llm_ok, properties) in enumerate(rows, start=1):
+        llm = f"{llm_ms:8.0f} {str(llm_ok):>6}" if llm_ms is not None else f"{'-':>8} {'-':>6}"
+        print(f"{i:3} {'local' if certain else 'llm':>5} {str(ok):>8} {local_ms:9.2f} {llm}  {properties}")
+
+    local = [row for row in rows if row[1]]
+    print(f"\nauto mode: {len(local)}/{len(rows)} questions extracted locally, "
+          f"{sum(row[2] for row in local)}/{len(local)} of them as expected, "
+          f"median {statistics.median(row[3] for row in rows):.2f} ms")
+    print(f"local mode: {sum(row[2] for row in rows)}/{len(rows)} as expected")
+    if args.llm:
+        print(f"llm mode: {sum(row[5] for row in rows)}/{len(rows)} as expected, "
+              f"median {statistics.median(row[4] for row in rows):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
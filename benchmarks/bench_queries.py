@@ -0,0 +1,129 @@
+"""
+Run every few-shot query in src/conf/sqls.json before and after create_indexes.
+
+    python -m benchmarks.bench_queries --games 20 --output query_plans.json
+    python -m benchmarks.bench_queries --db data/games.db  # Works on a copy of a real database
+
+The placeholders in the examples ('<team>', <season>, X, ...) are bound to values that exist in the database.
+For each query the script records EXPLAIN QUERY PLAN and the best wall-clock time of --repeat runs, without and
+with the managed index set.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_corpus
+
+
+def sample_values(conn):
+    """Values from the database to bind the placeholders of the examples to."""
+    def one(sql):
+        row = conn.execute(sql).fetchone()
+        return row[0] if row else None
+
+    game_id, season, league_id, team_id, away_team_id = conn.execute(
+        "SELECT id, season, league_id, home_team_id, away_team_id FROM games ORDER BY id LIMIT 1").fetchone()
+    player_hash = one("SELECT player_id FROM player_events WHERE type = 3 ORDER BY id LIMIT 1") \
+        or one("SELECT hash FROM players LIMIT 1")
+    return {
+        "game_id": game_id, "season": season, "league_id": league_id,
+        "team": one(f"SELECT name FROM teams WHERE id = {team_id}"),
+        "team2": one(f"SELECT name FROM teams WHERE id = {away_team_id}"),
+        "league": one(f"SELECT name FROM leagues WHERE id = {league_id}"),
+        "player": one(f"SELECT name FROM players WHERE hash = '{player_hash}'"),
+        "player_hash": player_hash,
+    }
+
+
+def bind(query, values):
+    quote = "'{}'".format
+    replacements = {
+        "'name'": quote(values["player"]), "'hash'": quote(values["player_hash"]),
+        "'<team>'": quote(values["team"]), "'<season>'": quote(values["season"]), "<season>": quote(values["season"]),
+        "'<league>'": quote(values["league"]), "<league>": quote(values["league"]),
+        "'<league_name>'": quote(values["league"]), "'<leauge>'": quote(values["league"]),
+        "<leauge_id>": str(values["league_id"]), "'<player>'": quote(values["player"]),
+        "<player>": quote(values["player"]), "<player_hash>": quote(values["player_hash"]),
+        "'<team2>'": quote(values["team2"]), "'<keyword>'": "'penalty'",
+        "'<event>'": "'Goal'", "<event>": "'Goal'", "<game_id>": str(values["game_id"]),
+        "start_time": "60", "duration": "30",
+    }
+    pattern = "|".join(sorted(map(re.escape, replacements), key=len, reverse=True))
+    query = re.sub(pattern, lambda match: replacements[match.group(0)], query)
+    return re.sub(r"\bX\b", str(values["game_id"]), query)
+
+
+def measure(conn, query, repeat):
+    try:
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(query).fetchall()
+            best = min(best, time.perf_counter() - start)
+        return {"ms": best * 1000, "plan": plan}
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing database to copy instead of a synthetic one')
+    parser.add_argument('--games', type=int, default=20, help='Synthetic games per league and season')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--examples', default='src/conf/sqls.json')
+    parser.add_argument('--output', help='Write plans and timings as JSON')
+    args = parser.parse_args()
+
+    with open(args.examples) as f:
+        examples = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "games.db")
+        os.environ["DATABASE_PATH"] = db_path
+        from src.connection import get_engine
+        from src.database import create_indexes, drop_indexes
+        if args.db:
+            shutil.copy(args.db, db_path)
+            drop_indexes(get_engine(db_path))
+        else:
+            from src.ingest import bulk_process_json_files
+            corpus = os.path.join(tmp, "SoccerNet")
+            generate_corpus(corpus, leagues=3, seasons=3, games=args.games)
+            bulk_process_json_files(corpus, engine=get_engine(db_path), indexes=False)
+
+        conn = sqlite3.connect(db_path)
+        values = sample_values(conn)
+        queries = [bind(example["query"], values) for example in examples]
+        before = [measure(conn, query, args.repeat) for query in queries]
+        conn.close()
+        create_indexes(get_engine(db_path))
+        conn = sqlite3.connect(db_path)
+        after = [measure(conn, query, args.repeat) for query in queries]
+        conn.close()
+
+    results = []
+    print(f"{'#':>3} {'before ms':>10} {'after ms':>10} {'speedup':>8}  plan after")
+    for i, (example, query, b, a) in enumerate(zip(examples, queries, before, after), start=1):
+        results.append({"input": example["input"], "query": query, "before": b, "after": a})
+        if "error" in b or "error" in a:
+            print(f"{i:>3} {'error':>10} {'':>10} {'':>8}  {b.get('error') or a.get('error')}")
+            continue
+        plan = "; ".join(a["plan"])
+        print(f"{i:>3} {b['ms']:>10.3f} {a['ms']:>10.3f} {b['ms'] / max(a['ms'], 1e-6):>7.1f}x  "
+              f"{plan[:90] + '...' if len(plan) > 90 else plan}")
+    timed = [(r["before"]["ms"], r["after"]["ms"]) for r in results if "ms" in r["before"] and "ms" in r["after"]]
+    print(f"\ntotal: {sum(b for b, _ in timed):.2f} ms before, {sum(a for _, a in timed):.2f} ms after "
+          f"({len(timed)} of {len(results)} queries ran)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cold start of the database handles of main_cli.py: the SQLDatabase created by create_extractor and the one
+created by SqlChain, against the shared SoccerDatabase of src.sql_database.
+
+    python -m benchmarks.bench_startup [--db data/games.db] --repeat 5
+
+Each run is a fresh interpreter, timed from after the imports to when both handles exist, then for the
+agent's first and second description of the tables of a question (get_table_info). Without --db the run uses
+an empty database with the tables of init_db.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES = ["games", "players", "player_events", "teams"]
+
+FORMER = """
+from langchain_community.utilities import SQLDatabase
+from src.connection import engine_from_uri
+def handles(uri):
+    return [SQLDatabase(engine_from_uri(uri, read_only=True)) for _ in range(2)]
+"""
+SHARED = """
+from src.sql_database import get_database
+def handles(uri):
+    return [get_database(uri) for _ in range(2)]
+"""
+TIMED = """
+import time
+start = time.perf_counter()
+extractor_db, agent_db = handles({uri!r})
+created = time.perf_counter()
+agent_db.get_table_info({tables!r})
+first = time.perf_counter()
+agent_db.get_table_info({tables!r})
+second = time.perf_counter()
+print(created - start, first - created, second - first, len(agent_db.get_usable_table_names()))
+"""
+
+
+def run(setup, uri):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    code = setup + TIMED.format(uri=uri, tables=TABLES)
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    *times, tables = result.stdout.split()
+    return [float(t) * 1000 for t in times], int(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing SoccerNet database, instead of an empty one')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            from src.connection import get_engine
+            from src.database import init_db
+
+            path = os.path.join(tmp, "startup.db")
+            init_db(get_engine(path)).dispose()
+        uri = f"sqlite:///{os.path.abspath(path)}"
+        print(f"{'':18} {'handles ms':>10} {'1st info ms':>11} {'2nd info ms':>11} {'tables':>7}")
+        for name, setup in (("SQLDatabase x2", FORMER), ("get_database", SHARED)):
+            runs = [run(setup, uri) for _ in range(args.repeat)]
+            times = [statistics.median(run[0][i] for run in runs) for i in range(3)]
+            print(f"{name:18} {times[0]:10.1f} {times[1]:11.1f} {times[2]:11.2f} {runs[0][1]:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Peak memory of the bulk loader with and without stream=True, for growing ASR files.
+
+    python -m benchmarks.bench_streaming_memory --segments 10000 100000 400000
+
+Every load runs in a fresh interpreter so its peak RSS is measured on its own. With streaming the
+peak should stay flat as the files grow, without it the peak grows with the largest file.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import generate_corpus
+
+
+def load(corpus, db_path, stream, batch_rows):
+    # Runs in the child process
+    from sqlalchemy import create_engine
+    from src.ingest import bulk_process_json_files
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    bulk_process_json_files(corpus, engine=engine, stream=stream, batch_rows=batch_rows)
+    print(peak_rss_kb())
+
+
+def peak_rss_kb():
+    # ru_maxrss carries over the parent's peak through fork and exec on Linux, VmHWM starts fresh at exec
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss_mb(corpus, db_path, stream, batch_rows):
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_streaming_memory", "--child", corpus, db_path,
+                             str(int(stream)), str(batch_rows)], capture_output=True, text=True, check=True).stdout
+    return int(output.split()[-1]) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, nargs='+', default=[10000, 100000, 400000],
+                        help='ASR segments per half')
+    parser.add_argument('--batch-rows', type=int, default=20000)
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        corpus, db_path, stream, batch_rows = args.child
+        load(corpus, db_path, stream == "1", int(batch_rows))
+        return
+
+    print(f"{'segments':>10} {'file MB':>8} {'json.load MB':>13} {'stream MB':>10}")
+    for segments in args.segments:
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = os.path.join(tmp, "SoccerNet")
+            generate_corpus(corpus, leagues=1, seasons=1, games=1, segments=segments)
+            asr_mb = max(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(corpus)
+                         for file in files) / 2 ** 20
+            loaded = peak_rss_mb(corpus, os.path.join(tmp, "load.db"), False, args.batch_rows)
+            streamed = peak_rss_mb(corpus, os.path.join(tmp, "stream.db"), True, args.batch_rows)
+        print(f"{segments:>10} {asr_mb:>8.1f} {loaded:>13.1f} {streamed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare keyword search over commentary and captions with LIKE scans and with the text_search FTS5 index.
+
+    python -m benchmarks.bench_text_search --games 20 --segments 400
+    python -m benchmarks.bench_text_search --db data/games.db --term "penalty" --term "red card"
+
+Each term is searched as a phrase. LIKE matches substrings and FTS5 whole tokens, so the hit counts can
+differ for terms that are also part of longer words.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_corpus
+
+LIKE_SQL = """SELECT game_id, period, description FROM commentary WHERE description LIKE ?
+              UNION ALL
+              SELECT game_id, period, description FROM captions WHERE description LIKE ?"""
+MATCH_SQL = "SELECT game_id, period, description FROM text_search WHERE text_search MATCH ?"
+DEFAULT_TERMS = ["penalty", "keeper", "offside", "yellow card", "header goes over"]
+
+
+def best_of(conn, sql, params, repeat):
+    best, rows = float("inf"), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing database with a text_search table instead of a synthetic one')
+    parser.add_argument('--leagues', type=int, default=3)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--games', type=int, default=20, help='Synthetic games per league and season')
+    parser.add_argument('--segments', type=int, default=400, help='ASR segments per half')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--term', action='append', help='Search term, can be repeated')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if not db_path:
+            db_path = os.path.join(tmp, "games.db")
+            os.environ["DATABASE_PATH"] = db_path
+            from src.ingest import bulk_process_json_files
+            corpus = os.path.join(tmp, "SoccerNet")
+            generate_corpus(corpus, leagues=args.leagues, seasons=args.seasons, games=args.games,
+                            segments=args.segments)
+            bulk_process_json_files(corpus)
+
+        conn = sqlite3.connect(db_path)
+        terms = args.term or DEFAULT_TERMS + [conn.execute("SELECT name FROM teams ORDER BY id").fetchone()[0]]
+        rows = conn.execute("SELECT (SELECT COUNT(*) FROM commentary) + (SELECT COUNT(*) FROM captions)").fetchone()[0]
+        print(f"\n{rows} commentary and caption rows")
+        print(f"{'term':24} {'LIKE ms':>9} {'hits':>7} {'MATCH ms':>9} {'hits':>7} {'speedup':>8}")
+        like_total = match_total = 0.0
+        for term in terms:
+            like_ms, like_hits = best_of(conn, LIKE_SQL, (f"%{term}%",) * 2, args.repeat)
+            phrase = '"' + term.replace('"', '""') + '"'
+            match_ms, match_hits = best_of(conn, MATCH_SQL, (phrase,), args.repeat)
+            like_total += like_ms
+            match_total += match_ms
+            print(f"{term[:24]:24} {like_ms:9.2f} {like_hits:7} {match_ms:9.2f} {match_hits:7} "
+                  f"{like_ms / max(match_ms, 1e-6):7.1f}x")
+        print(f"{'total':24} {like_total:9.2f} {'':7} {match_total:9.2f} {'':7} "
+              f"{like_total / max(match_total, 1e-6):7.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
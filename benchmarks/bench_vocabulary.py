@@ -0,0 +1,92 @@
+"""
+Vocabulary load time of Retriever.query_as_list, the first step of every fuzzy lookup in a session.
+
+    python -m benchmarks.bench_vocabulary --names 200000
+
+Compares the former implementation, SQLDatabase.run followed by ast.literal_eval, with the cursor based one,
+with and without SELECT DISTINCT, on a players table of --names rows (10% of them duplicates). The last row is
+a new Retriever served from the process-wide vocabulary cache, what create_extractor costs after the first call.
+"""
+import argparse
+import ast
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+
+FIRST = ["Lionel", "Cristiano", "Eden", "Sergio", "Luka", "Mohamed", "Kevin", "Harry", "Antoine", "Robert",
+         "Aleksandar", "Zlatan", "Thomas", "Marco", "Paul", "Karim", "Neymar", "Gareth", "Andrés", "Ángel"]
+LAST = ["Messi", "Ronaldo", "Hazard", "Ramos", "Modric", "Salah", "De Bruyne", "Kane", "Griezmann", "Lewandowski",
+        "Mitrovic", "Ibrahimovic", "Müller", "Reus", "Pogba", "Benzema", "Silva", "Bale", "Iniesta", "Di María"]
+
+
+def create_players(db_path, names, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(names):
+        if i and rng.random() < 0.1:
+            rows.append((f"dup{i}", rows[rng.randrange(len(rows))][1]))
+            continue
+        name = f"{rng.choice(FIRST)} {rng.choice(LAST)}{i}"  # The number makes the names unique
+        rows.append((f"h{i}", name if i % 10 else "NULL " + name.split()[-1]))
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE players (hash VARCHAR PRIMARY KEY, name VARCHAR, country VARCHAR)")
+    conn.executemany("INSERT INTO players (hash, name) VALUES (?, ?)", rows)
+    conn.execute("CREATE INDEX ix_players_name ON players (name)")  # As created by create_indexes
+    conn.commit()
+    conn.close()
+
+
+def legacy_query_as_list(db, query, numeric=False):
+    # Retriever.query_as_list before the cursor based version
+    response = db.run(query)
+    response = [el for sub in ast.literal_eval(response) for el in sub if el]
+    if not numeric:
+        response = [re.sub(r"\b\d+\b", "", string).strip() for string in response]
+    return list(set(response))
+
+
+def best_of(function, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from langchain_community.utilities import SQLDatabase
+    from src.connection import engine_from_uri
+    from src.extractor import Retriever
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "players.db")
+        create_players(db_path, args.names)
+        db = SQLDatabase(engine_from_uri(f"sqlite:///{db_path}", read_only=True))
+        config = {"db_table": "players", "db_column": "name", "pk_column": "hash"}
+
+        legacy_ms, legacy = best_of(lambda: legacy_query_as_list(db, "SELECT name FROM players"), args.repeat)
+        runs = {"db.run + literal_eval": (legacy_ms, legacy)}
+        for name, distinct in (("cursor", False), ("cursor, DISTINCT", True)):
+            retriever = Retriever(db, dict(config, distinct=distinct))
+            runs[name] = best_of(retriever.load_vocabulary, args.repeat)
+        Retriever(db, config).query_as_list()
+        runs["cached, new Retriever"] = best_of(lambda: Retriever(db, config).query_as_list(), args.repeat)
+        db._engine.dispose()
+
+    print(f"\n{args.names} names, {len(legacy)} in the vocabulary")
+    print(f"{'':24} {'ms':>9} {'speedup':>8}  same vocabulary")
+    for name, (ms, vocabulary) in runs.items():
+        print(f"{name:24} {ms:9.3f} {legacy_ms / ms:7.0f}x  {set(vocabulary) == set(legacy)}")
+
+
+if __name__ == "__main__":
+    main()
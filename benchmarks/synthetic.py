@@ -0,0 +1,237 @@
+"""
+Deterministic synthetic SoccerNet corpus, used to benchmark ingestion without downloading the real dataset.
+
+The layout mirrors data/dataset/SoccerNet: <league>/<season>/<game>/ with Labels-caption.json, Labels-v2.json
+and the 1_half-ASR.json / 2_half-ASR.json commentary files. The content follows the real files: the score
+matches the goal facts of the lineups and the Goal annotations of Labels-v2, players keep their hash across
+seasons, and every tenth player only has a last name.
+
+    python -m benchmarks.synthetic data/synthetic/SoccerNet --leagues 3 --seasons 2 --games 38 --augmented
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+
+LEAGUES = ["england_epl", "spain_laliga", "germany_bundesliga", "italy_serie-a", "france_ligue-1",
+           "europe_uefa-champions-league"]
+CAPTION_LABELS = ["soccer-ball", "y-card", "r-card", "corner", "substitution", "comments", "attempt", "foul"]
+V2_LABELS = ["Ball out of play", "Throw-in", "Foul", "Indirect free-kick", "Clearance", "Shots on target",
+             "Shots off target", "Corner", "Substitution", "Kick-off", "Yellow card", "Offside"]
+POSITIONS = ["G", "D", "M", "F"]
+COUNTRIES = ["England", "Spain", "France", "Germany", "Italy", "Brazil", "Argentina", "Norway"]
+COMMENTARY = ["and the ball goes wide", "what a save from the keeper", "a dangerous cross into the box",
+              "the referee waves away the penalty appeal", "the flag is up for offside", "a corner kick for {team}",
+              "{team} keep possession in midfield", "a long ball over the top", "the free kick hits the wall",
+              "a yellow card for the challenge", "{team} are pressing high", "the header goes over the bar"]
+
+
+def league_name(index):
+    return LEAGUES[index] if index < len(LEAGUES) else f"league_{index}"
+
+
+def team_names(league_index, games):
+    return [f"Team{league_index}_{i} FC" for i in range(max(4, games // 2))]
+
+
+def _game_clock(rng, minutes=None):
+    if minutes is None:
+        period, minutes = rng.choice([1, 2]), rng.randint(0, 47)
+        clock_minutes = minutes
+    else:
+        period = 1 if minutes <= 45 else 2
+        clock_minutes = minutes if period == 1 else minutes - 45
+    return period, f"{period} - {clock_minutes:02d}:{rng.randint(0, 59):02d}", minutes
+
+
+def _player(team, number):
+    # Every tenth player only has a last name, like in the real data
+    last_name = f"{team.split()[0]}son{number}"
+    name = last_name if number % 10 == 0 else f"Player{number} {last_name}"
+    return {"hash": hashlib.md5(f"{team}/{number}".encode()).hexdigest()[:12], "long_name": name,
+            "country": COUNTRIES[number % len(COUNTRIES)]}
+
+
+def _lineup(rng, team, side, players, goal_minutes):
+    """Lineup of one team, with a goal fact (and usually an assist) for each minute in goal_minutes."""
+    lineup = {"tactic": "4-4-2", "players": [], "coach": [{"hash": f"coach-{team}", "long_name": f"Coach {team}",
+                                                           "country": COUNTRIES[len(team) % len(COUNTRIES)]}]}
+    squad = [_player(team, number) for number in range(1, players + 1)]
+    facts = {player["hash"]: [] for player in squad}
+    starters, substitutes = squad[:11], squad[11:]
+    for minute in goal_minutes:
+        scorer = rng.choice(starters[1:])  # Not the keeper
+        facts[scorer["hash"]].append({"type": "3", "time": f"{minute}' {scorer['long_name']}",
+                                      "description": "Goal"})
+        if rng.random() < 0.7:
+            assist = rng.choice([player for player in starters[1:] if player is not scorer])
+            facts[assist["hash"]].append({"type": "8", "time": f"{minute}' {scorer['long_name']}",
+                                          "description": "Assistance"})
+    for player in starters:
+        if rng.random() < 0.12:
+            facts[player["hash"]].append({"type": "1", "time": f"{rng.randint(1, 90)}' {player['long_name']}",
+                                          "description": "Yellow Card"})
+        elif rng.random() < 0.01:
+            facts[player["hash"]].append({"type": "2", "time": f"{rng.randint(1, 90)}' {player['long_name']}",
+                                          "description": "Red Card"})
+    for substitute, replaced in zip(substitutes[:3], rng.sample(starters[1:], min(3, len(substitutes)))):
+        facts[replaced["hash"]].append({"type": "6" if side == "home" else "7", "time": f"{rng.randint(46, 90)}'",
+                                        "description": substitute["long_name"],
+                                        "linked_player_hash": substitute["hash"]})
+    for number, player in enumerate(squad, start=1):
+        lineup["players"].append(dict(player, shirt_number=str(number), captain="(C)" if number == 1 else "",
+                                      starting=number <= 11, lineup=POSITIONS[min(number // 4, 3)],
+                                      facts=facts[player["hash"]]))
+    return lineup
+
+
+def _caption_file(rng, home, away, season, index, players, annotations, goals):
+    score = f"{len(goals['home'])} - {len(goals['away'])}"
+    start = datetime.date(int(season.split("-")[0]), 8, 1)
+    date = (start + datetime.timedelta(days=index)).isoformat()
+    data = {
+        "gameHomeTeam": home, "gameAwayTeam": away, "score": score,
+        "round": str(index + 1), "venue": [f"{home} Stadium"], "referee_found": [f"Referee {index % 7}"],
+        "gameDate": date, "timestamp": f"{date} - 20:00 {home} {score} {away}",
+        "attendance": [str(rng.randint(10000, 80000))],
+        "lineup": {"home": _lineup(rng, home, "home", players, goals["home"]),
+                   "away": _lineup(rng, away, "away", players, goals["away"])},
+        "annotations": [],
+    }
+    for _ in range(annotations):
+        period, clock, minutes = _game_clock(rng)
+        data["annotations"].append({
+            "gameTime": clock, "label": rng.choice(CAPTION_LABELS),
+            "description": f"{rng.choice([home, away])} pushes forward after {minutes} minutes of play.",
+            "important": rng.choice(["true", "false"]), "visibility": rng.choice(["shown", "not shown"]),
+            "position": str(minutes * 60000),
+        })
+    return data
+
+
+def _v2_file(rng, annotations, goals):
+    data = {"annotations": []}
+    for _ in range(annotations):
+        period, clock, minutes = _game_clock(rng)
+        data["annotations"].append({"gameTime": clock, "label": rng.choice(V2_LABELS),
+                                    "position": str(minutes * 60000),
+                                    "team": rng.choice(["home", "away", "not applicable"]),
+                                    "visibility": rng.choice(["visible", "not shown"])})
+    for side, minutes in goals.items():
+        for minute in minutes:
+            period, clock, _ = _game_clock(rng, minute)
+            data["annotations"].append({"gameTime": clock, "label": "Goal", "position": str(minute * 60000),
+                                        "team": side, "visibility": "visible"})
+    return data
+
+
+def _asr_file(rng, segments, teams):
+    start = 0.0
+    data = {"segments": {}}
+    for i in range(segments):
+        end = start + rng.uniform(1.0, 8.0)
+        text = rng.choice(COMMENTARY).format(team=rng.choice(teams))
+        data["segments"][str(i)] = [round(start, 2), round(end, 2), f"{text}, commentary segment {i}"]
+        start = end
+    return data
+
+
+def generate_corpus(directory, leagues=2, seasons=2, games=10, players=18, annotations=60, v2_annotations=120,
+                    segments=200, seed=0):
+    """
+    Write leagues x seasons x games game folders below directory and return the number of games written.
+    The same arguments always produce byte-identical files.
+
+    Args:
+        players (int): Squad size of each team in a lineup, the first 11 start.
+        annotations (int): Caption annotations per game (Labels-caption.json).
+        v2_annotations (int): Labels-v2 annotations per game, on top of one Goal annotation per goal.
+        segments (int): ASR segments per half.
+    """
+    rng = random.Random(seed)
+    written = 0
+    for league_index in range(leagues):
+        league = league_name(league_index)
+        teams = team_names(league_index, games)
+        for season_index in range(seasons):
+            season = f"{2014 + season_index}-{2015 + season_index}"
+            for index in range(games):
+                home, away = rng.sample(teams, 2)
+                goals = {side: sorted(rng.randint(1, 90) for _ in range(rng.choice([0, 0, 1, 1, 1, 2, 2, 3, 4])))
+                         for side in ("home", "away")}
+                caption = _caption_file(rng, home, away, season, index, players, annotations, goals)
+                game_dir = os.path.join(directory, league, season, caption["timestamp"].replace(":", "-"))
+                os.makedirs(game_dir, exist_ok=True)
+                files = {"Labels-caption.json": caption, "Labels-v2.json": _v2_file(rng, v2_annotations, goals),
+                         "1_half-ASR.json": _asr_file(rng, segments, (home, away)),
+                         "2_half-ASR.json": _asr_file(rng, segments, (home, away))}
+                for name, content in files.items():
+                    with open(os.path.join(game_dir, name), "w") as f:
+                        json.dump(content, f)
+                written += 1
+    return written
+
+
+def _misspell(name, rng):
+    # Swap two neighbouring letters, the kind of typo the augmented names cover
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def generate_augmented_names(directory, leagues=2, games=10, seed=0):
+    """
+    Write augmented_teams.csv and augmented_leagues.csv, in the format of the files in data/dataset, for the
+    teams and leagues of generate_corpus(leagues=leagues, games=games). Returns the paths of both files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    teams_path = os.path.join(directory, "augmented_teams.csv")
+    leagues_path = os.path.join(directory, "augmented_leagues.csv")
+    with open(teams_path, "w") as f:
+        f.write("name,augmented_name\n")
+        for league_index in range(leagues):
+            for team in team_names(league_index, games):
+                short = team[:-len(" FC")]
+                for alias in (short, f"{short} F.C.", team.lower(), _misspell(team, rng)):
+                    f.write(f"{team},{alias}\n")
+    with open(leagues_path, "w") as f:
+        f.write("name,augmented_name\n")
+        for league_index in range(leagues):
+            league = league_name(league_index)
+            country, _, name = league.rpartition("_")
+            aliases = dict.fromkeys([name, name.replace("-", " "), f"{country} {name.replace('-', ' ')}"])
+            for alias in aliases:
+                # Like the real file, with a space after the comma
+                f.write(f"{league}, {alias}\n")
+    return teams_path, leagues_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='Where to write the <league>/<season>/<game> folders')
+    parser.add_argument('--leagues', type=int, default=2)
+    parser.add_argument('--seasons', type=int, default=2)
+    parser.add_argument('--games', type=int, default=10, help='Games per league and season')
+    parser.add_argument('--players', type=int, default=18, help='Squad size per team and game')
+    parser.add_argument('--annotations', type=int, default=60, help='Caption annotations per game')
+    parser.add_argument('--v2-annotations', type=int, default=120, help='Labels-v2 annotations per game')
+    parser.add_argument('--segments', type=int, default=200, help='ASR segments per half')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--augmented', action='store_true',
+                        help='Also write augmented_teams.csv and augmented_leagues.csv in the parent directory')
+    args = parser.parse_args()
+
+    games = generate_corpus(args.directory, leagues=args.leagues, seasons=args.seasons, games=args.games,
+                            players=args.players, annotations=args.annotations,
+                            v2_annotations=args.v2_annotations, segments=args.segments, seed=args.seed)
+    print(f"Wrote {games} games to {args.directory}")
+    if args.augmented:
+        paths = generate_augmented_names(os.path.dirname(os.path.abspath(args.directory)), leagues=args.leagues,
+                                         games=args.games, seed=args.seed)
+        print(f"Wrote {', '.join(paths)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from src.extractor import create_extractor
 from src.sql_chain import create_agent
+from src import instrumentation
+import json
 import os
 from dotenv import load_dotenv
 
@@ -12,8 +14,11 @@ ag = create_agent(llm_model=model)
 
 
 def query(prompt):
-    clean, ver = ex.clean(prompt, verbose=True)
-    ans, ver = ag.ask(clean)
+    # Timed per stage when instrumentation is on, see src/instrumentation.py
+    with instrumentation.request("query"):
+        (clean, ver), bindings = ex.clean(prompt, verbose=True, return_bindings=True)
+        # Questions like an example of src/conf/sqls.json run its SQL without the agent loop
+        ans, ver = ag.ask(clean, bindings=bindings)
     return ans
 
 if __name__ == '__main__':
@@ -21,7 +26,15 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Process a user query.")
     parser.add_argument('-q', '--query', type=str, required=True, help='A query string to process')
+    parser.add_argument('--timings', action='store_true', help='Print the time spent in each stage')
 
     args = parser.parse_args()
+    if args.timings:
+        instrumentation.enable()
     ans = query(args.query)
     print(ans["output"])
+    if args.timings:
+        print(f"Path: {ans['path']}, {ans['latency_ms']} ms, saved: {ans['latency_saved_ms']} ms")
+        print(json.dumps(instrumentation.export()["requests"][-1], indent=2))
+        if ag.db.results is not None:
+            print(f"SQL result cache: {ag.db.results.stats()}")
@@ -5,7 +5,9 @@ except ImportError:
     print("SoccerNet package not found. Please install it by running 'pip install soccernet'")
     exit(1)
 
-from src.database import process_json_files,fill_Augmented_Team, fill_Augmented_League
+from src.database import fill_Augmented_Team, fill_Augmented_League, create_indexes
+from src.ingest import bulk_process_json_files
+import os
 import threading
 
 mySoccerNetDownloader = SoccerNetDownloader(LocalDirectory="data/dataset/SoccerNet")
@@ -18,23 +20,27 @@ def download_labels(file_name):
         print(f"Error downloading {file_name}: {e}")
 
 
-# Create threads for downloading different sets of labels
-thread_v2 = threading.Thread(target=download_labels, args=("Labels-v2.json",))
-thread_caption = threading.Thread(target=download_labels, args=("Labels-caption.json",))
+# The bulk loader's worker processes import this file, the script only runs in the main one
+if __name__ == "__main__":
+    # Create threads for downloading different sets of labels
+    thread_v2 = threading.Thread(target=download_labels, args=("Labels-v2.json",))
+    thread_caption = threading.Thread(target=download_labels, args=("Labels-caption.json",))
 
-# Start the threads
-thread_v2.start()
-thread_caption.start()
+    # Start the threads
+    thread_v2.start()
+    thread_caption.start()
 
-# Wait for both threads to complete
-thread_v2.join()
-thread_caption.join()
+    # Wait for both threads to complete
+    thread_v2.join()
+    thread_caption.join()
 
-print("All files downloaded successfully!")
-print("Creating database..")
+    print("All files downloaded successfully!")
+    print("Creating database..")
 
 
-
-process_json_files("data/dataset/SoccerNet/")
-fill_Augmented_Team("data/Dataset/augmented_teams.csv")
-fill_Augmented_League("data/Dataset/augmented_leagues.csv")
\ No newline at end of file
+    # The bulk loader parses the games on a process pool and writes them in batches, see src/ingest.py.
+    # Indexes are created once, after the augmented names
+    bulk_process_json_files("data/dataset/SoccerNet/", batch_games=100, workers=os.cpu_count() or 1, indexes=False)
+    fill_Augmented_Team("data/Dataset/augmented_teams.csv")
+    fill_Augmented_League("data/Dataset/augmented_leagues.csv")
+    create_indexes()
\ No newline at end of file
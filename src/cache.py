@@ -0,0 +1,119 @@
+"""
+Cache of LLM responses, so a question that was already answered skips the API round-trip.
+
+ResponseCache keeps the most recently used entries in memory and, with a path, also in a SQLite file that
+outlives the process. Values are stored as JSON and decoded on every get, so callers can modify what they
+get back. Entries older than ttl seconds are ignored and removed.
+
+The defaults of cache_from_env can be overridden in .env:
+EXTRACTOR_CACHE_SIZE (0 disables the cache), EXTRACTOR_CACHE_TTL (seconds), EXTRACTOR_CACHE_PATH
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(*parts):
+    """Key for a response, from anything JSON serializable that the response depends on."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of JSON values with an optional SQLite backing file and TTL.
+
+    Usage:
+        cache = ResponseCache(max_entries=256, ttl=24 * 3600, path="data/llm_cache.db")
+        key = cache_key(model, template, question)
+        response = cache.get(key)
+        if response is None:
+            response = call_the_llm()
+            cache.put(key, response)
+    """
+
+    def __init__(self, max_entries=256, ttl=None, path=None):
+        """
+        Args:
+            max_entries (int): Entries kept in memory, the least recently used are dropped first.
+            ttl (float): Seconds an entry stays valid, None for no expiry.
+            path (str): SQLite file that also stores every entry, None to only cache in memory.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (created, JSON text)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            if ttl is not None:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the value stored under key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[0]):
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    row = None
+                if row is not None:
+                    entry = tuple(row)
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[1])
+
+    def put(self, key, value):
+        """Store value, which must be JSON serializable, under key."""
+        entry = (time.time(), json.dumps(value))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                                 (key,) + entry[::-1])
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry, from memory and from the file."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+def cache_from_env():
+    """The ResponseCache configured in .env (see the module docstring), None when it is disabled."""
+    size = int(os.getenv("EXTRACTOR_CACHE_SIZE") or 256)
+    if size <= 0:
+        return None
+    ttl = os.getenv("EXTRACTOR_CACHE_TTL")
+    return ResponseCache(max_entries=size, ttl=float(ttl) if ttl else None,
+                         path=os.getenv("EXTRACTOR_CACHE_PATH") or None)
@@ -0,0 +1,164 @@
+"""
+SQLite engines shared by the ingestion, extractor and SQL agent modules.
+
+Every module gets its engine from get_engine, so the pragmas below are applied to every connection:
+- WAL journal, readers are not blocked while an ingestion writes
+- busy_timeout, a writer waits for the lock instead of failing with "database is locked"
+- cache_size, mmap_size and temp_store for the query path
+Read-only engines open the file with a mode=ro URI, which is what the extractor and the SQL agent use.
+
+The defaults can be overridden in .env:
+SQLITE_WAL, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_TEMP_STORE, SQLITE_BUSY_TIMEOUT, SQLITE_POOL_SIZE
+"""
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+_engines = {}
+_lock = threading.Lock()
+_watchers = {}  # path -> (inode, sqlite3 connection) used by database_version
+_watchers_lock = threading.Lock()
+
+
+def _setting(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    value = value.strip()
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+
+def default_settings():
+    """Connection settings from the environment, see the module docstring."""
+    return {
+        "wal": _setting("SQLITE_WAL", True),
+        "cache_size": _setting("SQLITE_CACHE_SIZE", -64000),  # Negative is KiB, so 64 MB
+        "mmap_size": _setting("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        "temp_store": _setting("SQLITE_TEMP_STORE", "MEMORY"),
+        "busy_timeout": _setting("SQLITE_BUSY_TIMEOUT", 5000),  # Milliseconds
+        "pool_size": _setting("SQLITE_POOL_SIZE", 10),
+    }
+
+
+def database_path():
+    """Path of the SoccerNet database, from DATABASE_PATH."""
+    return os.getenv('DATABASE_PATH')
+
+
+def path_from_uri(uri):
+    """Return the file path of a sqlite:/// URI, or None for anything else."""
+    if uri.startswith("sqlite:///"):
+        return uri[len("sqlite:///"):].split("?")[0]
+    return None
+
+
+def create_sqlite_engine(path, read_only=False, wal=True, cache_size=-64000, mmap_size=256 * 1024 * 1024,
+                         temp_store="MEMORY", busy_timeout=5000, pool_size=10, echo=False):
+    """
+    Create an engine for the SQLite file at path with the given pragmas.
+
+    Args:
+        path (str): Path of the database file.
+        read_only (bool): Open the file with mode=ro, any write fails.
+        wal (bool): Switch the file to WAL journaling. This is persistent and done by writable engines only.
+        cache_size (int): Page cache per connection, pages if positive, KiB if negative.
+        mmap_size (int): Bytes of the file to memory-map, 0 disables it.
+        temp_store (str): DEFAULT, FILE or MEMORY.
+        busy_timeout (int): Milliseconds to wait for a lock before "database is locked".
+        pool_size (int): Connections kept open, about one per concurrent session.
+    """
+    if read_only:
+        uri = f"sqlite:///file:{path}?mode=ro&uri=true"
+    else:
+        uri = f"sqlite:///{path}"
+    engine = create_engine(uri, echo=echo, poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size,
+                           connect_args={"check_same_thread": False, "timeout": busy_timeout / 1000})
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal and not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # NORMAL is safe with WAL and saves an fsync per commit
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA cache_size={int(cache_size)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute(f"PRAGMA temp_store={temp_store}")
+        cursor.close()
+
+    return engine
+
+
+def get_engine(path=None, read_only=False):
+    """
+    Return the shared engine for path (DATABASE_PATH by default), created on first use with the
+    settings from default_settings. Engines are cached per (path, read_only).
+    """
+    path = path or database_path()
+    if not path:
+        raise ValueError("No database path given and DATABASE_PATH is not set")
+    key = (os.path.abspath(path), read_only)
+    with _lock:
+        if key not in _engines:
+            _engines[key] = create_sqlite_engine(path, read_only=read_only, **default_settings())
+        return _engines[key]
+
+
+def engine_from_uri(uri, read_only=False):
+    """get_engine for a sqlite:/// URI, any other URI gets a plain engine."""
+    path = path_from_uri(uri)
+    if path is None:
+        return create_engine(uri)
+    return get_engine(path, read_only=read_only)
+
+
+def engine_path(engine):
+    """Absolute path of the file behind a SQLite engine, None for other engines and in-memory databases."""
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    path = url.database
+    if url.query.get("uri") == "true" and path.startswith("file:"):
+        path = path[len("file:"):]
+    return os.path.abspath(path)
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def database_version(path):
+    """
+    Return a value that changes whenever the SQLite file at path changes: a commit by any connection or process,
+    a checkpoint, or the file being replaced. Use it to invalidate data cached from the database.
+
+    Commits are seen through PRAGMA data_version on a watcher connection kept open per file, the stat of the
+    file and its -wal catch the rest. A missing file gives None.
+    """
+    path = os.path.abspath(path)
+    stat = _stat(path)
+    if stat is None:
+        return None
+    with _watchers_lock:
+        inode, watcher = _watchers.get(path, (None, None))
+        if inode != stat[0]:
+            # New file, or the file was replaced and the old connection still reads the old one
+            if watcher is not None:
+                watcher.close()
+            watcher = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            _watchers[path] = stat[0], watcher
+        data_version = watcher.execute("PRAGMA data_version").fetchone()[0]
+    return stat, _stat(path + "-wal"), data_version
@@ -1,14 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Text, Float, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Float, Boolean, UniqueConstraint, event
 from sqlalchemy.orm import declarative_base, sessionmaker
-import pandas as pd
 import os
 import json
+import threading
 import dotenv
+from src.connection import get_engine
 dotenv.load_dotenv()
 
-db_uri = os.getenv('DATABASE_PATH')
-db_uri = f"sqlite:///{db_uri}"
-engine = create_engine(db_uri, echo=False)
+# Importing this module only defines the models. The engine is created on first use by get_engine (DATABASE_PATH)
+# and the tables by init_db.
 Base = declarative_base()
 
 
@@ -132,11 +132,256 @@ class Player_Event(Base):
         'players.hash'))  # If the event is linked to another player, for example a substitution
 
 
-# Create Tables
-Base.metadata.create_all(engine)
+class Player_Season_Stats(Base):
+    # Materialized per player, team, season and league totals, rebuilt by refresh_season_stats
+    __tablename__ = 'player_season_stats'
+    player_id = Column(String, ForeignKey('players.hash'), primary_key=True)
+    team_id = Column(Integer, ForeignKey('teams.id'), primary_key=True)
+    season = Column(String, primary_key=True)
+    league_id = Column(Integer, ForeignKey('leagues.id'), primary_key=True)
+    games = Column(Integer)  # Games in the lineup, as starter or substitute
+    starts = Column(Integer)
+    goals = Column(Integer)
+    assists = Column(Integer)
+    yellow_cards = Column(Integer)
+    red_cards = Column(Integer)
+
+
+class Team_Season_Stats(Base):
+    # Materialized per team, season and league results, rebuilt by refresh_season_stats
+    __tablename__ = 'team_season_stats'
+    team_id = Column(Integer, ForeignKey('teams.id'), primary_key=True)
+    season = Column(String, primary_key=True)
+    league_id = Column(Integer, ForeignKey('leagues.id'), primary_key=True)
+    played = Column(Integer)
+    wins = Column(Integer)
+    draws = Column(Integer)
+    losses = Column(Integer)
+    points = Column(Integer)  # 3 for a win, 1 for a draw
+    goals_for = Column(Integer)
+    goals_against = Column(Integer)
+    home_played = Column(Integer)
+    home_wins = Column(Integer)
+    home_draws = Column(Integer)
+    home_losses = Column(Integer)
+    home_goals_for = Column(Integer)
+    home_goals_against = Column(Integer)
+    away_played = Column(Integer)
+    away_wins = Column(Integer)
+    away_draws = Column(Integer)
+    away_losses = Column(Integer)
+    away_goals_for = Column(Integer)
+    away_goals_against = Column(Integer)
+    yellow_cards = Column(Integer)
+    red_cards = Column(Integer)
+
+
+class Ingest_Manifest(Base):
+    # One row per source file loaded by src/ingest.py, used to skip unchanged games on re-ingestion
+    __tablename__ = 'ingest_manifest'
+    path = Column(String, primary_key=True)  # Relative to the SoccerNet directory
+    size = Column(Integer)
+    mtime = Column(Integer)  # Nanoseconds
+    sha256 = Column(String)
+    game_id = Column(Integer, ForeignKey('games.id'))
+
 
-# Session setup
-Session = sessionmaker(bind=engine)
+# Secondary indexes on the columns the agent joins and filters on, see the queries in src/conf/sqls.json.
+# They are not part of the models so a bulk load writes into bare tables, create_indexes builds them afterwards.
+# (name, table, columns)
+INDEXES = [
+    ('ix_games_season', 'games', ('season',)),
+    ('ix_games_league_season', 'games', ('league_id', 'season')),
+    ('ix_games_home_team', 'games', ('home_team_id', 'season')),
+    ('ix_games_away_team', 'games', ('away_team_id', 'season')),
+    ('ix_teams_name', 'teams', ('name',)),
+    ('ix_leagues_name', 'leagues', ('name',)),
+    ('ix_players_name', 'players', ('name',)),
+    ('ix_game_lineup_player', 'game_lineup', ('player_id',)),
+    ('ix_game_lineup_team_game', 'game_lineup', ('team_id', 'game_id')),
+    ('ix_player_events_game', 'player_events', ('game_id',)),
+    ('ix_player_events_player_type', 'player_events', ('player_id', 'type')),
+    ('ix_player_events_type_game', 'player_events', ('type', 'game_id')),
+    ('ix_events_game_label', 'events', ('game_id', 'label')),
+    ('ix_events_label', 'events', ('label', 'game_id')),
+    ('ix_captions_game', 'captions', ('game_id', 'period')),
+    ('ix_commentary_game', 'commentary', ('game_id', 'period')),
+    ('ix_augmented_teams_team', 'augmented_teams', ('team_id',)),
+    ('ix_augmented_leagues_league', 'augmented_leagues', ('league_id',)),
+    ('ix_player_season_stats_season', 'player_season_stats', ('league_id', 'season')),
+    ('ix_team_season_stats_season', 'team_season_stats', ('league_id', 'season')),
+]
+
+
+def create_indexes(engine=None):
+    """Create the INDEXES that are missing and refresh the planner statistics."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        for name, table, columns in INDEXES:
+            conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        conn.exec_driver_sql("ANALYZE")
+
+
+def drop_indexes(engine=None):
+    """Drop the INDEXES, e.g. before rebuilding a large part of the database."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        for name, _, _ in INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+# Full-text index over the commentary and caption descriptions. Only description is indexed, the other columns
+# are stored to filter and present the hits. time is event_time_start (seconds) for commentary and the game_time
+# ("1 - 12:34") for captions. Commentary rows get rowid 2 * id and caption rows 2 * id + 1.
+#
+# Deletes and updates are mirrored by triggers. New rows are added by the loaders with one INSERT ... SELECT
+# per batch (sync_text_search): FTS5 flushes its pending terms at every statement savepoint, so an insert
+# trigger, which runs once per row, makes a bulk load several times slower.
+TEXT_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS text_search USING fts5(
+        description, source UNINDEXED, game_id UNINDEXED, period UNINDEXED, time UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS commentary_text_delete AFTER DELETE ON commentary BEGIN
+        DELETE FROM text_search WHERE rowid = 2 * old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS commentary_text_update AFTER UPDATE ON commentary BEGIN
+        DELETE FROM text_search WHERE rowid = 2 * old.id;
+        INSERT INTO text_search (rowid, description, source, game_id, period, time)
+        VALUES (2 * new.id, new.description, 'commentary', new.game_id, new.period, new.event_time_start);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS captions_text_delete AFTER DELETE ON captions BEGIN
+        DELETE FROM text_search WHERE rowid = 2 * old.id + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS captions_text_update AFTER UPDATE ON captions BEGIN
+        DELETE FROM text_search WHERE rowid = 2 * old.id + 1;
+        INSERT INTO text_search (rowid, description, source, game_id, period, time)
+        VALUES (2 * new.id + 1, new.description, 'caption', new.game_id, new.period, new.game_time);
+    END""",
+]
+# Copies the rows with an id above the parameter
+TEXT_SEARCH_FILL = {
+    'commentary': """INSERT INTO text_search (rowid, description, source, game_id, period, time)
+                     SELECT 2 * id, description, 'commentary', game_id, period, event_time_start
+                     FROM commentary WHERE id > ?""",
+    'captions': """INSERT INTO text_search (rowid, description, source, game_id, period, time)
+                   SELECT 2 * id + 1, description, 'caption', game_id, period, game_time
+                   FROM captions WHERE id > ?""",
+}
+
+
+def last_text_ids(connection):
+    """Highest commentary and caption ids, to pass to sync_text_search after inserting more rows."""
+    return {table: connection.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {table}").scalar()
+            for table in TEXT_SEARCH_FILL}
+
+
+def sync_text_search(connection, last_ids):
+    """Add the commentary and caption rows inserted after last_ids (from last_text_ids) to text_search."""
+    for table, sql in TEXT_SEARCH_FILL.items():
+        connection.exec_driver_sql(sql, (last_ids[table],))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_text_search(target, connection, **kw):
+    # Runs with every create_all, a database created before the index existed gets it filled once
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'text_search'").first()
+    for statement in TEXT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        sync_text_search(connection, dict.fromkeys(TEXT_SEARCH_FILL, 0))
+
+
+def rebuild_text_search(engine=None):
+    """Refill text_search from the commentary and captions tables and merge its segments."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM text_search")
+        sync_text_search(conn, dict.fromkeys(TEXT_SEARCH_FILL, 0))
+        conn.exec_driver_sql("INSERT INTO text_search (text_search) VALUES ('optimize')")
+
+
+# The season tables are filled from games, game_lineup and player_events, one (season, league_id) at a time.
+# Player event types are the fact ids of fact_id2label: 1 yellow card, 2 red card, 3 goal, 8 assist.
+SEASON_GAMES = "SELECT id FROM games WHERE season = :season AND league_id = :league_id"
+PLAYER_SEASON_STATS_SQL = f"""
+INSERT INTO player_season_stats (player_id, team_id, season, league_id, games, starts, goals, assists,
+                                 yellow_cards, red_cards)
+SELECT gl.player_id, gl.team_id, g.season, g.league_id, COUNT(*), SUM(gl.starting = 1),
+       SUM(COALESCE(pe.goals, 0)), SUM(COALESCE(pe.assists, 0)), SUM(COALESCE(pe.yellow_cards, 0)),
+       SUM(COALESCE(pe.red_cards, 0))
+FROM game_lineup gl
+JOIN games g ON g.id = gl.game_id
+LEFT JOIN (SELECT game_id, player_id, SUM(type = 3) AS goals, SUM(type = 8) AS assists,
+                  SUM(type = 1) AS yellow_cards, SUM(type = 2) AS red_cards
+           FROM player_events WHERE game_id IN ({SEASON_GAMES}) GROUP BY game_id, player_id) pe
+       ON pe.game_id = gl.game_id AND pe.player_id = gl.player_id
+WHERE gl.game_id IN ({SEASON_GAMES}) AND NOT gl.coach
+GROUP BY gl.player_id, gl.team_id, g.season, g.league_id
+"""
+TEAM_SEASON_STATS_SQL = f"""
+INSERT INTO team_season_stats (team_id, season, league_id, played, wins, draws, losses, points, goals_for,
+                               goals_against, home_played, home_wins, home_draws, home_losses, home_goals_for,
+                               home_goals_against, away_played, away_wins, away_draws, away_losses, away_goals_for,
+                               away_goals_against, yellow_cards, red_cards)
+SELECT r.team_id, r.season, r.league_id, COUNT(*), SUM(gf > ga), SUM(gf = ga), SUM(gf < ga),
+       SUM(3 * (gf > ga) + (gf = ga)), SUM(gf), SUM(ga),
+       SUM(home), SUM(home AND gf > ga), SUM(home AND gf = ga), SUM(home AND gf < ga), SUM(home * gf), SUM(home * ga),
+       SUM(NOT home), SUM(NOT home AND gf > ga), SUM(NOT home AND gf = ga), SUM(NOT home AND gf < ga),
+       SUM((NOT home) * gf), SUM((NOT home) * ga),
+       COALESCE(c.yellow_cards, 0), COALESCE(c.red_cards, 0)
+FROM (SELECT home_team_id AS team_id, season, league_id, goal_home AS gf, goal_away AS ga, 1 AS home
+      FROM games WHERE id IN ({SEASON_GAMES})
+      UNION ALL
+      SELECT away_team_id, season, league_id, goal_away, goal_home, 0
+      FROM games WHERE id IN ({SEASON_GAMES})) r
+LEFT JOIN (SELECT gl.team_id, SUM(pe.type = 1) AS yellow_cards, SUM(pe.type = 2) AS red_cards
+           FROM player_events pe
+           JOIN game_lineup gl ON gl.game_id = pe.game_id AND gl.player_id = pe.player_id
+           WHERE pe.game_id IN ({SEASON_GAMES}) GROUP BY gl.team_id) c ON c.team_id = r.team_id
+GROUP BY r.team_id, r.season, r.league_id
+"""
+
+
+def refresh_season_stats(engine=None, seasons=None):
+    """
+    Rebuild player_season_stats and team_season_stats for the given (season, league_id) pairs, or for every
+    season in games when seasons is None. Runs in one transaction, so readers see either the old or the new totals.
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        if seasons is None:
+            seasons = conn.exec_driver_sql("SELECT DISTINCT season, league_id FROM games").all()
+            for table in (Player_Season_Stats.__tablename__, Team_Season_Stats.__tablename__):
+                conn.exec_driver_sql(f"DELETE FROM {table}")
+        params = [{"season": season, "league_id": league_id} for season, league_id in sorted(seasons)]
+        if not params:
+            return 0
+        for table, sql in ((Player_Season_Stats.__tablename__, PLAYER_SEASON_STATS_SQL),
+                           (Team_Season_Stats.__tablename__, TEAM_SEASON_STATS_SQL)):
+            conn.exec_driver_sql(f"DELETE FROM {table} WHERE season = :season AND league_id = :league_id", params)
+            conn.exec_driver_sql(sql, params)
+    return len(params)
+
+
+_sessionmakers = {}
+_sessionmakers_lock = threading.Lock()
+
+
+def init_db(engine=None):
+    """Create the missing tables, and the text_search index, in the database. Returns the engine."""
+    engine = engine or get_engine()
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def get_session(engine=None):
+    """Return a new ORM session on engine, by default the DATABASE_PATH engine."""
+    engine = engine or get_engine()
+    with _sessionmakers_lock:
+        if engine not in _sessionmakers:
+            _sessionmakers[engine] = sessionmaker(bind=engine)
+        return _sessionmakers[engine]()
 
 
 def extract_time_from_player_event(time: str) -> str:
@@ -156,33 +401,56 @@ def get_or_create(session, model, **kwargs):
         return instance
 
 
-def process_game_data(data, data2, league, season):
-    session = Session()
-    # Caption = d and v2 = d2
-    home_team = data["gameHomeTeam"]
-    away_team = data["gameAwayTeam"]
+def normalize_game(data):
+    """Return (home team name, away team name, Game columns) from a Labels-caption.json file."""
     score = data["score"]
-    home_score = score[0]
-    away_score = score[-1]
-    round_ = data["round"]
-    venue = data["venue"][0]
     referee = data.get("referee_found", None)
     referee = referee[0] if referee else data.get("referee", None)
-    date = data["gameDate"]
-    timestamp = data["timestamp"]
     attendance = data.get("attendance", [])
     attendance = attendance[0] if attendance else None
+    game_data = dict(timestamp=data["timestamp"], score=score, goal_home=score[0], goal_away=score[-1],
+                     round=data["round"], venue=data["venue"][0], referee=referee, attendance=attendance,
+                     date=data["gameDate"])
+    return data["gameHomeTeam"], data["gameAwayTeam"], game_data
+
+
+def normalize_coach(coach):
+    """Return (hash, name, country) of a lineup coach. Unlike players, coach names are stored as given."""
+    return coach["hash"], coach["long_name"], coach["country"]
+
+
+def normalize_lineup_player(player_data):
+    """
+    Split one lineup entry of Labels-caption.json into the player row, the GameLineup columns and the
+    player events (type, time, linked_player) of that player.
+    """
+    player_hash = player_data["hash"]
+    name = player_data["long_name"]
+    if " " not in name:  # Since some players are missing their first name, do this to help with the search
+        name = "NULL " + name
+    country = player_data["country"]
+    lineup = dict(shirt_number=player_data["shirt_number"], position=player_data["lineup"],
+                  starting=player_data["starting"], captain=player_data["captain"] == "(C)")
+    facts = player_data.get("facts", None) or []  # Facts might be empty
+    facts = [(int(fact["type"]), extract_time_from_player_event(fact["time"]), fact.get("linked_player_hash", None))
+             for fact in facts]
+    return player_hash, name, country, lineup, facts
+
+
+def process_game_data(data, data2, league, season):
+    session = get_session()
+    # Caption = d and v2 = d2
+    home_team, away_team, game_data = normalize_game(data)
 
     home_team = get_or_create(session, Team, name=home_team)
     away_team = get_or_create(session, Team, name=away_team)
     # Check if the game already exists
-    game = session.query(Game).filter_by(timestamp=timestamp, home_team_id=home_team.id).first()
+    game = session.query(Game).filter_by(timestamp=game_data["timestamp"], home_team_id=home_team.id).first()
     # Check if league exists
     league = get_or_create(session, League, name=league)
     if not game:
-        game = Game(timestamp=timestamp, score=score, goal_home=home_score, goal_away=away_score, round=round_,
-                    home_team_id=home_team.id, away_team_id=away_team.id,
-                    venue=venue, date=date, attendance=attendance, season=season, league_id=league.id, referee=referee)
+        game = Game(home_team_id=home_team.id, away_team_id=away_team.id, season=season, league_id=league.id,
+                    **game_data)
         session.add(game)
         session.commit()
 
@@ -197,40 +465,21 @@ def process_game_data(data, data2, league, season):
         tactic = team_lineup["tactic"]
 
         for player_data in team_lineup["players"]:
-            player_hash = player_data["hash"]
-            name = player_data["long_name"]
-            if " " not in name:  # Since some players are missing their first name, do this to help with the search
-                name = "NULL " + name
-            number = player_data["shirt_number"]
-            captain = player_data["captain"] == "(C)"
-            starting = player_data["starting"]
-            country = player_data["country"]
-            position = player_data["lineup"]
-            facts = player_data.get("facts", None)  # Facts might be empty
+            player_hash, name, country, lineup, facts = normalize_lineup_player(player_data)
 
             player = get_or_create(session, Player, hash=player_hash, name=name, country=country)
             game_lineup = GameLineup(game_id=game.id, team_id=team_id, player_id=player.hash,
-                                     shirt_number=number, position=position, starting=starting, captain=captain,
-                                     coach=False, tactics=tactic)
-            if facts:
-                for fact in facts:
-                    type = fact["type"]
-                    time = extract_time_from_player_event(fact["time"])
-                    event = get_or_create(session, Player_Event_Label, id=int(type))
-                    linked_player = fact.get("linked_player_hash", None)
-
-                    player_event = Player_Event(game_id=game.id, player_id=player.hash, time=time, type=event.id,
-                                                linked_player=linked_player)
-                    session.add(player_event)
+                                     coach=False, tactics=tactic, **lineup)
+            for type, time, linked_player in facts:
+                event = get_or_create(session, Player_Event_Label, id=type)
+
+                player_event = Player_Event(game_id=game.id, player_id=player.hash, time=time, type=event.id,
+                                            linked_player=linked_player)
+                session.add(player_event)
             session.add(game_lineup)
 
         # Get the coach
-        coach = team_lineup["coach"][0]
-        coach_hash = coach["hash"]
-        coach_name = coach["long_name"]
-        if " " not in coach_name:  # Since some players are missing their first name, do this to help with the search
-            name = "NULL " + coach_name
-        coach_country = coach["country"]
+        coach_hash, coach_name, coach_country = normalize_coach(team_lineup["coach"][0])
         coach_player = get_or_create(session, Player, hash=coach_hash, name=coach_name, country=coach_country)
         game_lineup = GameLineup(game_id=game.id, team_id=team_id, player_id=coach_player.hash,
                                  shirt_number=None, position=None, starting=None, captain=False, coach=True,
@@ -243,26 +492,7 @@ def process_game_data(data, data2, league, season):
     # Start parsing the events
     events = data["annotations"]
     for event in events:
-        period, time = convert_to_seconds(event["gameTime"])
-        label = event["label"]
-        # Renaming labels
-        if label == "soccer-ball":
-            label = "goal"
-        elif label == "y-card":
-            label = "yellow card"
-        elif label == "r-card":
-            label = "red card"
-
-        description = event["description"]
-        important = event["important"] == "true"
-        visible = event["visibility"]
-        # Convert to boolean
-        # True if shown, False if not
-        visible = visible == "shown"
-        position = int(event["position"])
-
-        event = Caption(game_id=game.id, game_time=time, period=period, label=label, description=description,
-                        important=important, visibility=visible, frame_stamp=position)
+        event = Caption(game_id=game.id, **normalize_caption(event))
         session.add(event)
     session.commit()
 
@@ -274,7 +504,7 @@ def process_player_data(data):
 
 
 def process_ASR_data(data, game_id, period):
-    session = Session()
+    session = get_session()
     seg = data["segments"]
     commentary_events = []  # Store the events in a list
 
@@ -306,28 +536,59 @@ def convert_to_seconds(time_str):
     return period, total_seconds
 
 
+def normalize_caption(event):
+    """Turn one Labels-caption.json annotation into the column values of a Caption row (without game_id)."""
+    period, time = convert_to_seconds(event["gameTime"])
+    label = event["label"]
+    # Renaming labels
+    if label == "soccer-ball":
+        label = "goal"
+    elif label == "y-card":
+        label = "yellow card"
+    elif label == "r-card":
+        label = "red card"
+
+    description = event["description"]
+    important = event["important"] == "true"
+    visible = event["visibility"]
+    # Convert to boolean
+    # True if shown, False if not
+    visible = visible == "shown"
+    position = int(event["position"])
+    return dict(game_time=time, period=period, label=label, description=description,
+                important=important, visibility=visible, frame_stamp=position)
+
+
+def normalize_v2_annotation(annotation):
+    """
+    Turn one Labels-v2.json annotation into (period, game_time, team, position, visibility, label).
+    team is the raw "home"/"away" marker, the caller maps it to a team id.
+    """
+    period, game_time = convert_to_seconds(annotation["gameTime"])
+    position = annotation.get("position", None)  # Assuming position can be null
+    visibility = annotation["visibility"] == "visible"
+    # Convert to boolean
+    # True if visible, False if not
+    visibility = visibility == "visible"
+    label = annotation["label"]
+    return period, game_time, annotation["team"], position, visibility, label
+
+
 def parse_labels_v2(data, session, home_team_id, away_team_id, game_id):
     annotations_data = data["annotations"]
     no_team = get_or_create(session, Team, name="not applicable")
 
     for annotation in annotations_data:
-        period, game_time = convert_to_seconds(annotation["gameTime"])
+        period, game_time, team, position, visibility, label = normalize_v2_annotation(annotation)
 
         # Determine which team the annotation belongs to
-        if annotation["team"] == "home":
+        if team == "home":
             team_id = home_team_id
-        elif annotation["team"] == "away":
+        elif team == "away":
             team_id = away_team_id
         else:
             team_id = no_team.id
 
-        position = annotation.get("position", None)  # Assuming position can be null
-        visibility = annotation["visibility"] == "visible"
-        # Convert to boolean
-        # True if visible, False if not
-        visibility = visibility == "visible"
-        label = annotation["label"]
-
         # Create and add the Annotations instance
         annotation_entry = Event(
             game_id=game_id,
@@ -343,16 +604,24 @@ def parse_labels_v2(data, session, home_team_id, away_team_id, game_id):
     session.commit()
 
 
+def split_game_path(root):
+    # Game folders are <league>/<season>/<game>, accept both / and \\ separators
+    return [part for part in root.replace("\\", "/").split("/") if part]
+
+
 def process_json_files(directory):
-    session = Session()
+    engine = init_db()
+    session = get_session(engine)
     fill_player_events(session)
+    with engine.connect() as conn:
+        last_ids = last_text_ids(conn)
     for root, dirs, files in os.walk(directory):
         print(root)
         labels_file = None
         asr_files = []
-        path_parts = root.split("\\")
+        path_parts = split_game_path(root)
         if len(path_parts) > 2:
-            league = path_parts[-3].split("/")[-1]
+            league = path_parts[-3]
             season = path_parts[-2]
         # Need the labels-v2 first as it contains the game ID
         for file in files:
@@ -388,30 +657,36 @@ def process_json_files(directory):
 
     session.commit()
     session.close()
+    with engine.begin() as conn:
+        sync_text_search(conn, last_ids)
+    refresh_season_stats(engine)
+
+
+fact_id2label = {
+    "1": "Yellow card",
+    # Example: "time": "71' Ivanovic B. (Unsportsmanlike conduct)", "description": "Yellow Card"
+    "2": "Red card",  # Example: "time": "70' Matic N. (Unsportsmanlike conduct)", "description": "Red Card"
+    "3": "Goal",  # Example: "time": "14' Ivanovic B. (Hazard E.)", "description": "Goal"
+    "4": "NA",
+    "5": "NA 2",
+    "6": "Substitution home",  # Example: "time": "72'", "description": "Ramires"
+    "7": "Substitution away",  # Example: "time": "86'", "description": "Filipe Luis"
+    "8": "Assistance"  # Example: "time": "14' Ivanovic B. (Hazard E.)", "description": "Assistance"
+}
 
 
 def fill_player_events(session):
-    fact_id2label = {
-        "1": "Yellow card",
-        # Example: "time": "71' Ivanovic B. (Unsportsmanlike conduct)", "description": "Yellow Card"
-        "2": "Red card",  # Example: "time": "70' Matic N. (Unsportsmanlike conduct)", "description": "Red Card"
-        "3": "Goal",  # Example: "time": "14' Ivanovic B. (Hazard E.)", "description": "Goal"
-        "4": "NA",
-        "5": "NA 2",
-        "6": "Substitution home",  # Example: "time": "72'", "description": "Ramires"
-        "7": "Substitution away",  # Example: "time": "86'", "description": "Filipe Luis"
-        "8": "Assistance"  # Example: "time": "14' Ivanovic B. (Hazard E.)", "description": "Assistance"
-    }
     for key, value in fact_id2label.items():
         label = get_or_create(session, Player_Event_Label, label=value)
     session.commit()
 
 
 def fill_Augmented_Team(file_path):
+    import pandas as pd  # Only needed here, and slow to import
     df = pd.read_csv(file_path)
     # the df should have two columns, team_name and augmented_name
 
-    session = Session()
+    session = get_session()
     teams = session.query(Team).all()
     # For each row, find the team_id and add the augmented name
     for index, row in df.iterrows():
@@ -428,10 +703,11 @@ def fill_Augmented_Team(file_path):
 
 def fill_Augmented_League(file_path):
     # Read the csv file
+    import pandas as pd
     df = pd.read_csv(file_path)
     # the df should have two columns, team_name and augmented_name
 
-    session = Session()
+    session = get_session()
     leagues = session.query(League).all()
     # For each row, find the team_id and add the augmented name
     for index, row in df.iterrows():
@@ -448,9 +724,11 @@ def fill_Augmented_League(file_path):
 
 
 if __name__ == "__main__":
+    init_db()
     # Example directory path
     process_json_files('../data/Dataset/SoccerNet/')
     fill_Augmented_Team('../data/Dataset/augmented_teams.csv')
     fill_Augmented_League('../data/Dataset/augmented_leagues.csv')
+    create_indexes()
 # Rename the event/annotation table to something more descriptive. Events are fucking everything else over
 
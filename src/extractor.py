@@ -1,17 +1,21 @@
 from typing import Optional
 
-from langchain.chains import create_extraction_chain_pydantic
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_extraction_chain
 from copy import deepcopy
 from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
+from src.connection import engine_path, database_version
+from src.sql_database import get_database
 import os
 import difflib
-import ast
 import json
 import re
-from thefuzz import process
+import threading
+from src.matching import FuzzyIndex, select_matches
+from src.cache import cache_key, cache_from_env
+from src.local_extraction import LocalExtractor
+from src.name_variants import NameVariantIndex
+from src.instrumentation import timed, span
+from src.templates import template_bindings
 # Set up logging
 import logging
 
@@ -21,11 +25,10 @@ load_dotenv(".env")
 
 logging.basicConfig(level=logging.INFO)
 # Save the log to a file
-handler = logging.FileHandler('extractor.log')
+handler = logging.FileHandler('extractor.log', delay=True)
 logger = logging.getLogger(__name__)
 
-os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
-# os.environ["ANTHROPIC_API_KEY"] = os.getenv('ANTHROPIC_API_KEY')
+# load_dotenv has already put OPENAI_API_KEY (and ANTHROPIC_API_KEY) from .env in the environment
 
 if os.getenv('LANGSMITH'):
     os.environ['LANGCHAIN_TRACING_V2'] = 'true'
@@ -33,29 +36,90 @@ if os.getenv('LANGSMITH'):
     os.environ[
         'LANGCHAIN_API_KEY'] = os.getenv("LANGSMITH_API_KEY")
     os.environ['LANGCHAIN_PROJECT'] = os.getenv('LANGSMITH_PROJECT')
-db_uri = os.getenv('DATABASE_PATH')
-db_uri = f"sqlite:///{db_uri}"
-db = SQLDatabase.from_uri(db_uri)
-few_shot_n = os.getenv('FEW_SHOT')
-few_shot_n = int(few_shot_n)
+few_shot_n = int(os.getenv('FEW_SHOT', 3))
+# Threads scoring the fuzzy matches of a prompt, -1 for one per core
+fuzzy_workers = int(os.getenv('FUZZY_WORKERS') or -1)
+# auto: extract the entities from the vocabularies when the question allows it, the LLM otherwise.
+# local: never call the LLM. llm: always call it
+extraction_mode = os.getenv('EXTRACTION_MODE') or 'auto'
+# Standalone numbers are removed from the vocabulary of non-numeric columns
+_NUMBERS = re.compile(r"\b\d+\b")
+# SQLite's LOWER only folds ASCII letters
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+# Vocabularies, and their fuzzy indexes, shared by every Retriever in the process,
+# (path, table, column, numeric[, kind]) -> (version, value)
+_vocabularies = {}
+_vocabularies_lock = threading.Lock()
+_loading_locks = {}
+
+
+def _sqlite_lower(value):
+    return value.translate(_ASCII_LOWER)
+
+
+def cached_vocabulary(key, path, load):
+    """
+    Return the vocabulary (or index) cached under key, calling load() when it is missing or the database file
+    at path changed since it was loaded (see database_version). The value is shared, callers must not modify it.
+    """
+    version = database_version(path)
+    with _vocabularies_lock:
+        entry = _vocabularies.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        loading = _loading_locks.setdefault(key, threading.Lock())
+    # Only one thread loads a given vocabulary, the others wait for its result
+    with loading:
+        with _vocabularies_lock:
+            entry = _vocabularies.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        values = load()
+        with _vocabularies_lock:
+            _vocabularies[key] = version, values
+        return values
+
+
+def clear_vocabularies():
+    """Drop every cached vocabulary."""
+    with _vocabularies_lock:
+        _vocabularies.clear()
 
 
 # from langchain_anthropic import ChatAnthropic
 class Extractor():
     # llm = ChatOpenAI(model_name="gpt-4-0125-preview", temperature=0)
     # gpt-3.5-turbo
-    def __init__(self, model="gpt-3.5-turbo-0125", schema_config=None, custom_extractor_prompt=None):
+    def __init__(self, model="gpt-3.5-turbo-0125", schema_config=None, custom_extractor_prompt=None, llm=None):
         # model = "gpt-4-0125-preview"
-        if custom_extractor_prompt:
-            cust_promt = ChatPromptTemplate.from_template(custom_extractor_prompt)
-
-        self.llm = ChatOpenAI(model=model, temperature=0)
-        # self.llm = ChatAnthropic(model="claude-3-opus-20240229", temperature=0)
+        # llm replaces the ChatOpenAI model, e.g. a fake chat model in tests
+        self.model = getattr(llm, "model_name", model)
+        self.llm = llm
         self.schema = schema_config or {}
-        self.chain = create_extraction_chain(self.schema, self.llm, prompt=cust_promt)
+        self.custom_extractor_prompt = custom_extractor_prompt
+        self.chain = None
+        self._lock = threading.Lock()
+
+    def get_chain(self):
+        # The chat model, with its HTTP connection pool, and the chain are created once and reused
+        with self._lock:
+            if self.chain is None:
+                cust_promt = None
+                if self.custom_extractor_prompt:
+                    cust_promt = ChatPromptTemplate.from_template(self.custom_extractor_prompt)
+
+                # langchain.chains imports every chain in the package, about two seconds, so only import it
+                # when needed
+                from langchain.chains import create_extraction_chain
+
+                if self.llm is None:
+                    self.llm = ChatOpenAI(model=self.model, temperature=0)
+                # self.llm = ChatAnthropic(model="claude-3-opus-20240229", temperature=0)
+                self.chain = create_extraction_chain(self.schema, self.llm, prompt=cust_promt)
+            return self.chain
 
     def extract(self, query):
-        return self.chain.invoke(query)
+        return self.get_chain().invoke(query)
 
 
 class Retriever():
@@ -67,43 +131,107 @@ class Retriever():
         self.pk_column = config.get('pk_column')
         self.numeric = config.get('numeric', False)
         self.response = []
-        self.query = f"SELECT {self.column} FROM {self.table}"
+        self.index = None
+        # The vocabulary is deduplicated anyway, DISTINCT lets SQLite skip the repeated values
+        distinct = "DISTINCT " if config.get('distinct', True) else ""
+        self.query = f"SELECT {distinct}{self.column} FROM {self.table}"
         self.augmented_table = config.get('augmented_table', None)
         self.augmented_column = config.get('augmented_column', None)
         self.augmented_fk = config.get('augmented_fk', None)
+        # Look names up by their variants ("C. Ronaldo", "Messi") before fuzzy matching them, needs pk_column
+        self.name_variants = config.get('name_variants', False) and self.pk_column is not None
+
+    def iter_rows(self, query):
+        """Yield the rows of query one by one, typed as the DBAPI cursor returns them."""
+        # SQLDatabase.run would return the whole result as the repr of a list, to be parsed again with literal_eval
+        connection = self.db._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.arraysize = 10000
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+        finally:
+            connection.close()
+
+    def iter_column(self):
+        """Yield the values of the query one by one, typed as the DBAPI cursor returns them."""
+        for row in self.iter_rows(self.query):
+            yield row[0]
 
     def query_as_list(self):
-        # Execute the query
-        response = self.db.run(self.query)
-        response = [el for sub in ast.literal_eval(response) for el in sub if el]
-        if not self.numeric:
-            response = [re.sub(r"\b\d+\b", "", string).strip() for string in response]
-        self.response = list(set(response))
-        # print(self.response)
+        """
+        Set self.response to the vocabulary of the column. It is shared with every other Retriever on the same
+        database file, table and column, and only read again from the database when the file changed.
+        """
+        self.response = self._cached((), self.load_vocabulary)
         return self.response
 
+    def fuzzy_index(self):
+        """The FuzzyIndex of self.response, shared like the vocabulary."""
+        if self.index is None or self.index.choices is not self.response:
+            self.index = self._cached(("fuzzy",), lambda: FuzzyIndex(self.response))
+        return self.index
+
+    def _cached(self, kind, load):
+        path = engine_path(self.db._engine)
+        if path is None:
+            return load()
+        return cached_vocabulary((path, self.table, self.column, self.numeric) + kind, path, load)
+
+    @timed("load_vocabulary")
+    def load_vocabulary(self):
+        # Empty values are skipped, numbers are stripped from text columns, duplicates are removed keeping the
+        # first occurrence
+        vocabulary = {}
+        for value in self.iter_column():
+            if not value:
+                continue
+            if not self.numeric:
+                value = _NUMBERS.sub("", value).strip()
+            vocabulary[value] = None
+        return list(vocabulary)
+
+    def load_pks(self):
+        # Value -> primary key of the first row with that value, what "WHERE column = value LIMIT 1" returns
+        pks = {}
+        for value, pk in self.iter_rows(f"SELECT {self.column}, {self.pk_column} FROM {self.table}"):
+            pks.setdefault(value, pk)
+        return pks
+
+    def load_aliases(self):
+        # Lowercased augmented name -> name in the table, the first row of an alias wins
+        names = {}
+        for pk, value in self.iter_rows(f"SELECT {self.pk_column}, {self.column} FROM {self.table}"):
+            names.setdefault(pk, value)
+        aliases = {}
+        query = f"SELECT {self.augmented_fk}, {self.augmented_column} FROM {self.augmented_table}"
+        for fk, alias in self.iter_rows(query):
+            if alias is not None:
+                aliases.setdefault(_sqlite_lower(alias), names.get(fk))
+        return aliases
+
+    def load_name_variants(self):
+        return NameVariantIndex(self.iter_rows(f"SELECT {self.column}, {self.pk_column} FROM {self.table}"))
+
+    def variant_index(self):
+        """The NameVariantIndex of the column, shared like the vocabulary."""
+        return self._cached(("variants",), self.load_name_variants)
+
+    def aliases(self):
+        """Lowercased augmented name -> name in the table, shared like the vocabulary."""
+        return self._cached(("aliases",), self.load_aliases)
+
     def get_augmented_items(self, prompt):
         if self.augmented_table is None:
             return None
         else:
-            # Construct the query to search for the prompt in the augmented table
-            query = f"SELECT {self.augmented_fk} FROM {self.augmented_table} WHERE LOWER({self.augmented_column}) = LOWER('{prompt}')"
-
-            # Execute the query
-            fk_response = self.db.run(query)
-            if fk_response:
-                # Extract the FK value
-                fk_response = ast.literal_eval(fk_response)
-                fk_value = fk_response[0][0]
-                query = f"SELECT {self.column} FROM {self.table} WHERE {self.pk_column} = {fk_value}"
-                # Execute the query
-                matching_response = self.db.run(query)
-                # Extract the matching response
-                matching_response = ast.literal_eval(matching_response)
-                matching_response = matching_response[0][0]
-                return matching_response
-            else:
-                return None
+            # Look the prompt up in the augmented names, loaded once like the vocabulary
+            return self.aliases().get(_sqlite_lower(str(prompt)))
 
     def find_close_matches(self, target_string, n=3, method="difflib", threshold=70):
         """
@@ -116,9 +244,8 @@ class Retriever():
         Returns:
         - list of tuples: Each tuple contains a match and its score.
         """
-        # Ensure we have the response list populated
-        if not self.response:
-            self.query_as_list()
+        # Populate the response list, or pick up a new one if the database changed. Cheap when it is cached
+        self.query_as_list()
 
         # Find top n close matches
         if method == "fuzzy":
@@ -133,32 +260,54 @@ class Retriever():
 
         return top_matches
 
+    def find_close_matches_many(self, target_strings, n=3, method="difflib", threshold=70, workers=1):
+        """
+        find_close_matches for each of target_strings. The fuzzy matches of all of them are scored at once,
+        on workers threads (-1 for one per core).
+        """
+        self.query_as_list()
+        if method == "fuzzy":
+            return self.fuzzy_strings(target_strings, limit=n, threshold=threshold, workers=workers)
+        return [difflib.get_close_matches(target_string, self.response, n=n, cutoff=0.2)
+                for target_string in target_strings]
+
     def fuzzy_string(self, prompt, limit, threshold=80, low_threshold=30):
+        return self.fuzzy_strings([prompt], limit, threshold=threshold, low_threshold=low_threshold)[0]
+
+    @timed("fuzzy_match")
+    def fuzzy_strings(self, prompts, limit, threshold=80, low_threshold=30, workers=1):
+        results = [None] * len(prompts)
+        if self.name_variants:
+            # A variant of one name is that name, as a match meeting the threshold would be. A variant of up to
+            # limit names gives them as the choices, more are left to the fuzzy matching
+            variants = self.variant_index()
+            for i, prompt in enumerate(prompts):
+                names = variants.lookup(prompt)
+                if len(names) == 1:
+                    results[i] = names[0]
+                elif names and len(names) <= limit:
+                    results[i] = names
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
 
         # Get matches and their scores, limited by the specified 'limit'
-        matches = process.extract(prompt, self.response, limit=limit)
-
-        filtered_matches = [match for match in matches if match[1] >= threshold]
-
-        # If no matches meet the threshold, return the list of all matches' strings
-        if not filtered_matches:
-            # Return matches above the low_threshold
-            # Fix for wrong properties being returned
-            return [match[0] for match in matches if match[1] >= low_threshold]
-
-        # If there's only one match meeting the threshold, return it as a string
-        if len(filtered_matches) == 1:
-            return filtered_matches[0][0]  # Return the matched string directly
-
-        # If there's more than one match meeting the threshold or ties, return the list of matches' strings
-        highest_score = filtered_matches[0][1]
-        ties = [match for match in filtered_matches if match[1] == highest_score]
-
-        # Return the strings of tied matches directly, ignoring the scores
-        m = [match[0] for match in ties]
-        if len(m) == 1:
-            return m[0]
-        return [match[0] for match in ties]
+        # Matches meeting the threshold come from a shortlist of the index, scored against every name when
+        # names left out of it could tie with the best, see FuzzyIndex.extract
+        index = self.fuzzy_index()
+        # The cutoff is on unrounded scores, 79.5 rounds up to 80
+        matches = index.extract_many([prompts[i] for i in pending], limit=limit, score_cutoff=threshold - 0.5,
+                                     workers=workers)
+
+        # The prompts without a match meeting the threshold need all their matches, for low_threshold
+        low = [j for j, found in enumerate(matches) if not any(match[1] >= threshold for match in found)]
+        if low:
+            all_matches = index.extract_many([prompts[pending[j]] for j in low], limit=limit, workers=workers)
+            for j, found in zip(low, all_matches):
+                matches[j] = found
+        for i, found in zip(pending, matches):
+            results[i] = select_matches(found, threshold, low_threshold)
+        return results
 
     def fetch_pk(self, property_name, property_value):
         # Some properties do not have a primary key
@@ -174,12 +323,11 @@ class Retriever():
         if self.pk_column is None:
             return [None for _ in property_value]
 
+        # The primary keys are loaded once like the vocabulary
+        pks = self._cached(("pks",), self.load_pks)
         for value in property_value:
-            query = f"SELECT {self.pk_column} FROM {self.table} WHERE {self.column} = '{value}' LIMIT 1"
-            response = self.db.run(query)
-
-            # Append the response (PK or None) to the pk_list
-            pk_list.append(response)
+            # Append the PK, or None, to the pk_list
+            pk_list.append(pks.get(value))
 
         return pk_list
 
@@ -200,8 +348,8 @@ def setup_retrievers(db, schema_config):
     return retrievers
 
 
-def extract_properties(prompt, schema_config, custom_extractor_prompt=None):
-    """Extract properties from the prompt."""
+def strip_schema(schema_config):
+    """The schema as the extraction chain sees it, without the database mappings."""
     # modify schema_conf to only include the required properties
     schema_stripped = {'properties': {}}
     for key, value in schema_config['properties'].items():
@@ -209,13 +357,35 @@ def extract_properties(prompt, schema_config, custom_extractor_prompt=None):
             'type': value['type'],
             'items': {'type': value['items']['type']}
         }
+    return schema_stripped
 
-    extractor = Extractor(schema_config=schema_stripped, custom_extractor_prompt=custom_extractor_prompt)
-    extraction_result = extractor.extract(prompt)
-    # print("Extraction Result:", extraction_result)
 
-    if 'text' in extraction_result and extraction_result['text']:
-        properties = extraction_result['text']
+@timed("extract_properties")
+def extract_properties(prompt, schema_config, custom_extractor_prompt=None, extractor=None, cache=None):
+    """
+    Extract properties from the prompt.
+
+    extractor is the Extractor to use, a new one is created for schema_config if none is given. With a
+    ResponseCache, a question already asked with the same model, prompt template and schema is answered
+    from the cache.
+    """
+    if extractor is None:
+        extractor = Extractor(schema_config=strip_schema(schema_config),
+                              custom_extractor_prompt=custom_extractor_prompt)
+    properties = None
+    if cache is not None:
+        # Questions that only differ in whitespace get the same answer
+        key = cache_key(extractor.model, extractor.custom_extractor_prompt, extractor.schema,
+                        " ".join(str(prompt).split()))
+        properties = cache.get(key)
+    if properties is None:
+        extraction_result = extractor.extract(prompt)
+        # print("Extraction Result:", extraction_result)
+        properties = extraction_result.get('text') or []
+        if cache is not None:
+            cache.put(key, properties)
+
+    if properties:
         return properties
     else:
         print("No properties extracted.")
@@ -252,7 +422,8 @@ def recheck_property_value(properties, property_name, value, retrievers):
             print("No close matches found. Please try again or type 'quit' to stop.")
 
 
-def check_and_update_properties(properties_list, retrievers, method="fuzzy", input_func="input"):
+@timed("check_and_update_properties")
+def check_and_update_properties(properties_list, retrievers, method="fuzzy", input_func="input", workers=1):
     """
     Checks and updates the properties in the properties list based on close matches found in the database.
     The function iterates through each property in each property dictionary within the list,
@@ -264,6 +435,7 @@ def check_and_update_properties(properties_list, retrievers, method="fuzzy", inp
             to check and potentially update based on database matches.
         retrievers (dict): A dictionary of Retriever objects keyed by property name, used to find close matches in the database.
         input_func (function, optional): A function to capture user input. Defaults to the built-in input function.
+        workers (int, optional): Threads scoring the fuzzy matches of a property, -1 for one per core.
 
     The function updates the properties_list in place based on user choices for updating property values
     with close matches found by the retrievers.
@@ -277,19 +449,25 @@ def check_and_update_properties(properties_list, retrievers, method="fuzzy", inp
 
             updated_property_values = []  # To store updated list of values
 
-            for value in property_values:
-                if retriever.augmented_table:
-                    augmented_value = retriever.get_augmented_items(value)
-                    if augmented_value:
-                        updated_property_values.append(augmented_value)
-                        continue
+            augmented_values = [None] * len(property_values)
+            if retriever.augmented_table:
+                augmented_values = [retriever.get_augmented_items(value) for value in property_values]
+            # The values without an augmented name are all looked up at once
+            n = few_shot_n
+            # if input_func == "chainlit":
+            #     n = 5
+            # else:
+            #     n = 3
+            pending = [value for value, augmented_value in zip(property_values, augmented_values)
+                       if not augmented_value]
+            pending_matches = iter(retriever.find_close_matches_many(pending, method=method, n=n, workers=workers))
+
+            for value, augmented_value in zip(property_values, augmented_values):
+                if augmented_value:
+                    updated_property_values.append(augmented_value)
+                    continue
                 # Since property_value is now expected to be a list, we handle each value individually
-                n = few_shot_n
-                # if input_func == "chainlit":
-                #     n = 5
-                # else:
-                #     n = 3
-                top_matches = retriever.find_close_matches(value, method=method, n=n)
+                top_matches = next(pending_matches)
 
                 # Check if the closest match is the same as the current value
                 if top_matches and top_matches[0] == value:
@@ -354,6 +532,7 @@ def remove_duplicates(dicts):
     return dicts
 
 
+@timed("fetch_pks")
 def fetch_pks(properties_list, retrievers):
     all_pk_attributes = []  # Initialize a list to store dictionaries of _pk attributes for each item in properties_list
 
@@ -381,6 +560,7 @@ def fetch_pks(properties_list, retrievers):
 #     return prompt
 
 
+@timed("update_prompt")
 def update_prompt(prompt, properties, pk, properties_original, retrievers):
     updated_info = ""
     for prop, pk_info, prop_orig in zip(properties, pk, properties_original):
@@ -408,6 +588,9 @@ def update_prompt(prompt, properties, pk, properties_original, retrievers):
                 pk_value = None
                 if isinstance(pk_detail, str):
                     pk_value = pk_detail.strip("[]()").split(",")[0].replace("'", "").replace('"', '')
+                elif pk_detail is not None:
+                    # Retriever.fetch_pk returns the key as stored, e.g. an int id
+                    pk_value = pk_detail
 
                 update_statement = ""
                 # Skip updating if there's no change in value to avoid redundant info
@@ -477,21 +660,61 @@ class PromptCleaner:
             Returns a tuple containing the updated properties and their primary keys.
     """
 
-    def __init__(self, db=db, schema_config=None, custom_extractor_prompt=None):
+    def __init__(self, db=None, schema_config=None, custom_extractor_prompt=None, workers=None, llm=None,
+                 cache=None, extraction=None):
         """
         Initializes the PromptCleaner with a database connection and a schema configuration.
 
         Args:
             db: The database connection object to be used for querying. (if none, it will use the default db)
             schema_config: A dictionary defining properties and their database mappings for extraction and updating.
+            workers: Threads scoring the fuzzy matches of a property, -1 for one per core. (if none, FUZZY_WORKERS)
+            llm: Chat model of the extractor. (if none, ChatOpenAI)
+            cache: ResponseCache of the extracted properties. (if none, the one configured in .env, False for none)
+            extraction: "auto", "local" or "llm", see LocalExtractor. (if none, EXTRACTION_MODE)
         """
-        self.db = db
+        self.db = db or get_database()
         self.schema_config = schema_config
         self.retrievers = setup_retrievers(self.db, self.schema_config)
         self.cust_extractor_prompt = custom_extractor_prompt
         self.properties_original = None
+        self.workers = fuzzy_workers if workers is None else workers
+        # One extractor for the lifetime of the cleaner, its chain is created on the first extraction
+        self.extractor = Extractor(schema_config=strip_schema(schema_config),
+                                   custom_extractor_prompt=custom_extractor_prompt, llm=llm)
+        self.cache = cache_from_env() if cache is None else cache or None
+        self.extraction = extraction or extraction_mode
+        if self.extraction not in ("auto", "local", "llm"):
+            raise ValueError(f"Unknown extraction mode {self.extraction!r}, expected auto, local or llm")
+        self.local_extractor = LocalExtractor(self.retrievers)
+        self.last_extraction = None  # "local" or "llm", how the last prompt was extracted
+
+    def extract(self, prompt):
+        """
+        Extract the properties of prompt, from the vocabularies when the extraction mode allows it and
+        LocalExtractor is certain of the result, with the LLM otherwise.
+        """
+        if self.extraction != "llm":
+            with span("local_extraction"):
+                properties, certain = self.local_extractor.extract(prompt)
+            if certain or self.extraction == "local":
+                self.last_extraction = "local"
+                return properties
+        self.last_extraction = "llm"
+        return extract_properties(prompt, self.schema_config, self.cust_extractor_prompt,
+                                  extractor=self.extractor, cache=self.cache)
+
+    def match_values(self, property_name, values, method="fuzzy"):
+        """
+        Look up all values of a property in the database at once.
+
+        Returns:
+            list: For each value, what Retriever.find_close_matches returns for it.
+        """
+        return self.retrievers[property_name].find_close_matches_many(values, n=few_shot_n, method=method,
+                                                                      workers=self.workers)
 
-    def clean(self, prompt, return_pk=False, test=False, verbose=False):
+    def clean(self, prompt, return_pk=False, test=False, verbose=False, return_bindings=False):
         """
         Processes the given prompt to extract properties, remove duplicates, update the properties
         based on close matches within the database, and fetch primary keys for these properties.
@@ -505,20 +728,17 @@ class PromptCleaner:
             return_pk (bool): A flag to indicate whether to return primary keys along with the properties.
             test (bool): A flag to indicate whether to return the original properties for testing purposes.
             verbose (bool): A flag to indicate whether to return the original properties for debugging.
+            return_bindings (bool): A flag to also return the template bindings of the prompt, for SqlChain.ask.
 
         Returns:
             tuple: A tuple containing two elements:
                 - The first element is the original prompt, with updated information that excist in the db.
                 - The second element is a list of dictionaries, each containing primary keys for the properties,
                   where applicable.
+            With return_bindings, (that result, the bindings of the prompt, see src/templates.py).
 
         """
-        if self.cust_extractor_prompt:
-
-            properties = extract_properties(prompt, self.schema_config, self.cust_extractor_prompt)
-
-        else:
-            properties = extract_properties(prompt, self.schema_config)
+        properties = self.extract(prompt)
         # Keep original properties for later use
         properties_original = deepcopy(properties)
 
@@ -529,42 +749,54 @@ class PromptCleaner:
         pk = None
         # VALIDATE PROPERTIES
         if properties:
-            check_and_update_properties(properties, self.retrievers)
+            check_and_update_properties(properties, self.retrievers, workers=self.workers)
             pk = fetch_pks(properties, self.retrievers)
+        # Returned rather than kept, the cleaner is shared by concurrent requests
+        bindings = self.bindings(prompt, properties, properties_original, pk) if return_bindings else None
         properties = update_prompt(prompt=prompt, properties=properties, pk=pk, properties_original=properties_original,
                                    retrievers=self.retrievers)
 
         # Prepare additional data if requested
         if return_pk and verbose:
-            return (properties, pk), (properties, properties_original)
+            result = (properties, pk), (properties, properties_original)
         elif return_pk:
-            return properties, pk
+            result = properties, pk
         elif verbose:
-            return properties, properties_original
+            result = properties, properties_original
+        else:
+            result = properties
+        return (result, bindings) if return_bindings else result
 
-        return properties
+    def bindings(self, prompt, properties, properties_original, pk):
+        """The placeholder values of the SQL examples for the validated properties, see template_bindings."""
+        keyed = {name for name, retriever in self.retrievers.items() if retriever.pk_column is not None}
+        return template_bindings(prompt, properties, properties_original, pk, keyed)
 
     def extract_chainlit(self, prompt):
-        if self.cust_extractor_prompt:
-
-            properties = extract_properties(prompt, self.schema_config, self.cust_extractor_prompt)
-
-        else:
-            properties = extract_properties(prompt, self.schema_config)
+        properties = self.extract(prompt)
         self.properties_original = deepcopy(properties)
         return properties
 
     def validate_chainlit(self, properties):
-        properties, need_val = check_and_update_properties(properties, self.retrievers, input_func="chainlit")
+        properties, need_val = check_and_update_properties(properties, self.retrievers, input_func="chainlit",
+                                                           workers=self.workers)
         return properties, need_val
 
-    def build_prompt_chainlit(self, properties, prompt):
+    def build_prompt_chainlit(self, properties, prompt, properties_original=None, return_bindings=False):
+        """
+        The prompt with the validated properties. properties_original are those extract_chainlit returned for
+        prompt, the last extracted by default, which another session may have replaced. With return_bindings,
+        (prompt, the template bindings for SqlChain.ask).
+        """
         pk = None
+        if properties_original is None:
+            properties_original = self.properties_original
         # self.properties_original= deepcopy(properties)
         if properties:
             pk = fetch_pks(properties, self.retrievers)
-        prompt_new = update_prompt(prompt, properties, pk, self.properties_original, self.retrievers)
-        return prompt_new
+        bindings = self.bindings(prompt, properties, properties_original, pk) if return_bindings else None
+        prompt_new = update_prompt(prompt, properties, pk, properties_original, self.retrievers)
+        return (prompt_new, bindings) if return_bindings else prompt_new
 
 
 def load_json(file_path: str) -> dict:
@@ -572,9 +804,10 @@ def load_json(file_path: str) -> dict:
         return json.load(file)
 
 
-def create_extractor(schema: str = "src/conf/schema.json", db: SQLDatabase = db_uri):
+def create_extractor(schema: str = "src/conf/schema.json", db: str = None):
+    """Create a PromptCleaner for the schema on the database URI db (DATABASE_PATH by default)."""
     schema_config = load_json(schema)
-    db = SQLDatabase.from_uri(db)
+    db = get_database(db)
     pre_prompt = """Extract and save the relevant entities mentioned \
                     in the following passage together with their properties.
 
@@ -0,0 +1,374 @@
+"""
+Few-shot example index of the SQL agent, persisted so a start does not embed the examples again.
+
+SemanticSimilarityExampleSelector.from_examples embeds every example of src/conf/sqls.json and builds a FAISS
+index on every SqlChain. few_shot_vectorstore builds it once per examples and embedding model: the FAISS
+index is written to FEW_SHOT_INDEX_PATH/<hash of the examples and the embedding model>/index.faiss and later
+read memory-mapped, the documents are rebuilt from the examples. Within a process the index and documents
+are shared by every SqlChain, each gets a vectorstore embedding its questions with its own embeddings (and so its
+own API key).
+
+Each example is stored under a hash of its content. When the examples file changes, FewShotExamples.reload
+(or the watcher thread of the file) makes a new vectorstore from a copy of the current one, embedding only the
+new or changed examples and deleting the removed ones, and swaps it in. Requests keep searching the vectorstore
+they started with. One thread watches a file for all its FewShotExamples and holds them weakly, it ends with
+the last of them or when they are stopped.
+
+The embeddings are pluggable, FEW_SHOT_EMBEDDINGS in .env selects OpenAI (openai, the default) or
+LocalEmbeddings (local), which needs no API calls, also for the questions, and works offline.
+"""
+import copy
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import weakref
+import zlib
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+_vectorstores = {}
+_vectorstores_lock = threading.Lock()
+_file_watchers = {}  # absolute path -> _FileWatcher
+_file_watchers_lock = threading.Lock()
+_TOKEN = re.compile(r"\w+")
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings hashing the words and character trigrams of a text into a fixed size vector, computed locally.
+
+    Usage:
+        embeddings = LocalEmbeddings()
+        embeddings.embed_query("How many goals did Messi score?")  # 512 floats, L2 normalized
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+        self.model = f"local-hashing-{size}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in _TOKEN.findall(text.lower()):
+            vector[zlib.crc32(word.encode()) % self.size] += 2.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode()) % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def get_embeddings(name=None):
+    """The embeddings named name, FEW_SHOT_EMBEDDINGS by default: openai or local."""
+    name = (name or os.getenv("FEW_SHOT_EMBEDDINGS") or "openai").strip().lower()
+    if name == "local":
+        return LocalEmbeddings()
+    if name == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+    raise ValueError(f"Unknown embeddings {name!r}, expected openai or local")
+
+
+def embeddings_id(embeddings):
+    """What identifies the vectors of embeddings: the class and the model."""
+    return f"{type(embeddings).__name__}:{getattr(embeddings, 'model', None) or getattr(embeddings, 'model_name', '')}"
+
+
+def example_id(example):
+    """Id of an example in the vectorstore, from its content, so a changed example is a new one."""
+    return cache_key(example)[:32]
+
+
+def _documents(examples, input_keys):
+    # id -> what SemanticSimilarityExampleSelector.from_examples stores for the example, duplicates once
+    documents = {}
+    for example in examples:
+        documents.setdefault(example_id(example), Document(page_content=" ".join(example[key] for key in input_keys),
+                                                           metadata=example))
+    return documents
+
+
+def _index_path(examples, embeddings, input_keys, directory):
+    key = cache_key(embeddings_id(embeddings), input_keys, examples)
+    directory = directory or os.getenv("FEW_SHOT_INDEX_PATH") or "data/few_shot_index"
+    return key, os.path.join(directory, key[:32], "index.faiss")
+
+
+def _load(path, embeddings, documents):
+    # The saved vectorstore, None when there is none
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    if not os.path.exists(path):
+        return None
+    with open(os.path.join(os.path.dirname(path), "ids.json")) as file:
+        ids = json.load(file)["ids"]
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return FAISS(embeddings, index, InMemoryDocstore({id_: documents[id_] for id_ in ids}), dict(enumerate(ids)))
+
+
+def _save(vectorstore, path, embeddings):
+    import faiss
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+    with open(os.path.join(os.path.dirname(path), "ids.json"), "w") as file:
+        json.dump({"embeddings": embeddings_id(embeddings), "ids": ids}, file)
+    # The index is written last and under another name first, a process that finds it finds ids.json too and
+    # never sees half an index
+    faiss.write_index(vectorstore.index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _embed(vectorstore, documents, ids, embeddings):
+    # Add the documents ids to vectorstore, embedded in one call
+    vectors = embeddings.embed_documents([documents[id_].page_content for id_ in ids])
+    vectorstore.add_embeddings(zip([documents[id_].page_content for id_ in ids], vectors),
+                               metadatas=[documents[id_].metadata for id_ in ids], ids=ids)
+
+
+def _bound(vectorstore, embeddings):
+    # vectorstore embedding the questions with embeddings, sharing the index and documents of the cached one
+    if vectorstore.embedding_function is embeddings:
+        return vectorstore
+    bound = copy.copy(vectorstore)
+    bound.embedding_function = embeddings
+    return bound
+
+
+def few_shot_vectorstore(examples, embeddings, input_keys=("input",), directory=None):
+    """
+    Return the FAISS vectorstore of examples, read from directory (FEW_SHOT_INDEX_PATH, data/few_shot_index by
+    default) when it was built before, built and written there otherwise.
+
+    Args:
+        examples (list of dict): The few-shot examples, as in src/conf/sqls.json.
+        embeddings: Embeddings of the examples and of the questions.
+        input_keys: Keys of the examples that are embedded.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    input_keys = sorted(input_keys)
+    key, path = _index_path(examples, embeddings, input_keys, directory)
+    with _vectorstores_lock:
+        if key in _vectorstores:
+            return _bound(_vectorstores[key], embeddings)
+        documents = _documents(examples, input_keys)
+        vectorstore = _load(path, embeddings, documents)
+        if vectorstore is None:
+            vectors = embeddings.embed_documents([document.page_content for document in documents.values()])
+            vectorstore = FAISS(embeddings, faiss.IndexFlatL2(len(vectors[0])), InMemoryDocstore(), {})
+            vectorstore.add_embeddings(zip([document.page_content for document in documents.values()], vectors),
+                                       metadatas=[document.metadata for document in documents.values()],
+                                       ids=list(documents))
+            _save(vectorstore, path, embeddings)
+        _vectorstores[key] = vectorstore
+        return vectorstore
+
+
+def update_vectorstore(vectorstore, examples, embeddings, input_keys=("input",), directory=None):
+    """
+    Return the vectorstore of examples, made from vectorstore (that of other examples) by embedding only the
+    examples it does not have and deleting those examples does not have, and saved like few_shot_vectorstore.
+
+    vectorstore is not modified, requests using it are not affected by the update.
+
+    Returns:
+        (FAISS, int, int): The vectorstore, the number of examples added and deleted.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    input_keys = sorted(input_keys)
+    key, path = _index_path(examples, embeddings, input_keys, directory)
+    documents = _documents(examples, input_keys)
+    current = set(vectorstore.index_to_docstore_id.values())
+    deleted = [id_ for id_ in vectorstore.index_to_docstore_id.values() if id_ not in documents]
+    added = [id_ for id_ in documents if id_ not in current]
+    with _vectorstores_lock:
+        if key in _vectorstores:
+            return _bound(_vectorstores[key], embeddings), len(added), len(deleted)
+        if not added and not deleted:
+            updated = vectorstore
+        else:
+            # A copy, the index of vectorstore may be memory-mapped read-only and is searched by requests
+            updated = FAISS(embeddings, faiss.clone_index(vectorstore.index),
+                            InMemoryDocstore({id_: vectorstore.docstore.search(id_) for id_ in current}),
+                            dict(vectorstore.index_to_docstore_id))
+            if deleted:
+                updated.delete(deleted)
+            if added:
+                _embed(updated, documents, added, embeddings)
+            _save(updated, path, embeddings)
+        _vectorstores[key] = updated
+        return updated, len(added), len(deleted)
+
+
+class FewShotExamples:
+    """
+    The few-shot examples of a JSON file and their vectorstore, updated when the file changes.
+
+    Usage:
+        examples = FewShotExamples("src/conf/sqls.json", LocalEmbeddings())
+        selector = SemanticSimilarityExampleSelector(vectorstore=examples.vectorstore, k=2, input_keys=["input"])
+        examples.watch(5, lambda vectorstore: setattr(selector, "vectorstore", vectorstore))
+        examples.stop()
+    """
+
+    def __init__(self, path, embeddings, input_keys=("input",), directory=None):
+        self.path = path
+        self.embeddings = embeddings
+        self.input_keys = input_keys
+        self.directory = directory
+        self._stat = self._file_stat()
+        self.vectorstore = few_shot_vectorstore(self._read(), embeddings, input_keys, directory)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _read(self):
+        with open(self.path) as file:
+            return json.load(file)
+
+    def reload(self, force=False):
+        """
+        Update the vectorstore to the file when it changed since the last read, or when force is set.
+
+        Returns:
+            (int, int): Examples added and deleted.
+        """
+        with self._reload_lock:
+            stat = self._file_stat()
+            if not force and stat == self._stat:
+                return 0, 0
+            examples = self._read()
+            self.vectorstore, added, deleted = update_vectorstore(self.vectorstore, examples, self.embeddings,
+                                                                  self.input_keys, self.directory)
+            self._stat = stat
+            return added, deleted
+
+    def watch(self, interval, on_reload=None):
+        """
+        Check the file every interval seconds, and call on_reload(vectorstore) after an update, until stop.
+
+        The file has one watcher thread for all its FewShotExamples, checking it at the shortest of their
+        intervals. It holds them and a bound method on_reload weakly, watching does not keep them alive.
+        """
+        with _file_watchers_lock:
+            path = os.path.abspath(self.path)
+            watcher = _file_watchers.get(path)
+            if watcher is None or not watcher.add(self, interval, on_reload):
+                watcher = _file_watchers[path] = _FileWatcher(path)
+                watcher.add(self, interval, on_reload)
+                watcher.start()
+        self._watcher = watcher
+        return watcher
+
+    def stop(self):
+        """Stop watching the file, its thread ends when no other FewShotExamples watches it."""
+        if self._watcher is not None:
+            self._watcher.remove(self)
+            self._watcher = None
+
+
+class _FileWatcher:
+    """The thread checking one examples file and reloading every FewShotExamples of it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.interval = None
+        self._subscribers = weakref.WeakKeyDictionary()  # FewShotExamples -> weak or plain on_reload, or None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="few-shot-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, examples, interval, on_reload):
+        """Watch for examples, False when the thread has already ended."""
+        # A bound method would keep its object, the chain holding examples, and so examples alive
+        callback = weakref.WeakMethod(on_reload) if inspect.ismethod(on_reload) else on_reload
+        with self._lock:
+            if self._stopped.is_set():
+                return False
+            self._subscribers[examples] = callback
+            self.interval = interval if self.interval is None else min(self.interval, interval)
+            return True
+
+    def remove(self, examples):
+        with self._lock:
+            self._subscribers.pop(examples, None)
+            if self._subscribers:
+                return
+            self._stopped.set()
+        self._unregister()
+
+    def stop(self):
+        """End the thread, at once when it is waiting."""
+        with self._lock:
+            self._stopped.set()
+        self._unregister()
+
+    def _unregister(self):
+        with _file_watchers_lock:
+            if _file_watchers.get(self.path) is self:
+                del _file_watchers[self.path]
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not self._check():
+                # The FewShotExamples watched were all collected
+                self._unregister()
+                return
+
+    def _check(self):
+        # Reload every FewShotExamples, False when there is none left. Their references end with the call.
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+            if not subscribers:
+                self._stopped.set()
+                return False
+        for examples, callback in subscribers:
+            self._reload(examples, callback)
+        return True
+
+    def _reload(self, examples, callback):
+        try:
+            added, deleted = examples.reload()
+            if not (added or deleted):
+                return
+            logger.info("Few-shot examples of %s: %d added, %d deleted", self.path, added, deleted)
+            on_reload = callback() if isinstance(callback, weakref.WeakMethod) else callback
+            if on_reload is not None:
+                on_reload(examples.vectorstore)
+        except (OSError, ValueError) as error:
+            # An invalid or half written file is read again at the next change
+            logger.warning("Could not reload the few-shot examples of %s: %s", self.path, error)
+        except Exception:
+            # Embedding errors (network, API key) included, the thread keeps watching
+            logger.exception("Could not reload the few-shot examples of %s", self.path)
@@ -0,0 +1,508 @@
+"""
+Bulk ingestion of the SoccerNet label files.
+
+process_json_files commits every get_or_create on its own, which costs a SELECT and a commit per team, player
+and label. The BulkLoader keeps the dimension tables (teams, leagues, players, player event labels and games)
+in memory, assigns their ids itself and writes everything with executemany, one transaction per batch of games.
+It writes the same rows, with the same ids, as process_json_files.
+
+Every source file loaded is recorded in the ingest_manifest table with its size, mtime and sha256. Running
+the loader again skips games whose files are unchanged and replaces the child rows (lineups, player events,
+captions, events and commentary) of games whose files changed, so a refresh costs time proportional to
+what changed on disk.
+
+After a load the player_season_stats and team_season_stats tables are rebuilt for the (season, league) pairs
+that received or lost games, the other seasons keep their totals. The full-text index over commentary and
+captions (text_search) is updated in the same transaction as each batch.
+
+With stream=True the caption, Labels-v2 and ASR files are not loaded whole. Their annotations and segments
+are read incrementally with src.json_stream and written in batches of batch_rows rows, so memory use does
+not grow with the size of the files.
+"""
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+from sqlalchemy import func, select
+
+from src.connection import get_engine
+from src.database import (init_db, Game, GameLineup, Team, Player, Caption, Commentary, League, Event,
+                          Player_Event_Label, Player_Event, Ingest_Manifest, fact_id2label, normalize_game, normalize_coach,
+                          normalize_lineup_player, normalize_caption, normalize_v2_annotation, split_game_path,
+                          create_indexes, refresh_season_stats, Player_Season_Stats, last_text_ids,
+                          sync_text_search)
+from src.json_stream import JsonStream, iter_member
+
+# Columns written for each table, in the order the row tuples are built. Tables are flushed in this order
+# so parents are always written before their children.
+COLUMNS = {
+    Team.__tablename__: ("id", "name"),
+    League.__tablename__: ("id", "name"),
+    Player.__tablename__: ("hash", "name", "country"),
+    Player_Event_Label.__tablename__: ("id", "label"),
+    Game.__tablename__: ("id", "timestamp", "score", "goal_home", "goal_away", "round", "venue", "referee",
+                         "attendance", "date", "home_team_id", "away_team_id", "season", "league_id"),
+    GameLineup.__tablename__: ("game_id", "team_id", "player_id", "shirt_number", "position", "starting", "captain",
+                               "coach", "tactics"),
+    Player_Event.__tablename__: ("game_id", "player_id", "time", "type", "linked_player"),
+    Caption.__tablename__: ("game_id", "game_time", "period", "label", "description", "important", "visibility",
+                            "frame_stamp"),
+    Event.__tablename__: ("game_id", "period", "game_time", "team_id", "frame_stamp", "label", "visibility"),
+    Commentary.__tablename__: ("game_id", "period", "event_time_start", "event_time_end", "description"),
+}
+# Game columns that come straight from normalize_game
+GAME_FIELDS = COLUMNS[Game.__tablename__][1:10]
+# Tables holding the per game rows that are replaced when a game's files change
+CHILD_TABLES = (GameLineup.__tablename__, Player_Event.__tablename__, Caption.__tablename__, Event.__tablename__,
+                Commentary.__tablename__)
+NO_TEAM = "not applicable"
+
+
+def find_game_dirs(directory):
+    """Yield (root, league, season, files) for every game folder, in the order process_json_files visits them."""
+    for root, dirs, files in os.walk(directory):
+        path_parts = split_game_path(root)
+        if len(path_parts) < 3 or not any('Labels-caption.json' in file for file in files):
+            continue
+        yield root, path_parts[-3], path_parts[-2], files
+
+
+def asr_period(file):
+    """Return the period of an ASR commentary file, or None if the file is not one."""
+    if '1_half-ASR' in file:
+        return 1
+    if '2_half-ASR' in file:
+        return 2
+    return None
+
+
+def source_files(files):
+    """Return the files of a game folder that are loaded, the Labels-caption.json file first."""
+    labels_file = None
+    json_files = []
+    for file in files:
+        if 'Labels-caption.json' in file:
+            labels_file = file
+        elif 'Labels-v2' in file and file.endswith('.json') or asr_period(file) is not None:
+            json_files.append(file)
+    return [labels_file] + json_files
+
+
+def _read_json(root, file, record):
+    # Read, fingerprint and parse a source file in one pass
+    with open(os.path.join(root, file), 'rb') as f:
+        content = f.read()
+        mtime = os.fstat(f.fileno()).st_mtime_ns
+    record["files"].append((file, len(content), mtime, hashlib.sha256(content).hexdigest()))
+    return json.loads(content)
+
+
+def _fingerprint(root, file, record, chunk_size=1 << 20):
+    # Fingerprint a source file without keeping its content, for files that are streamed later
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(os.path.join(root, file), 'rb') as f:
+        for chunk in iter(functools.partial(f.read, chunk_size), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+        mtime = os.fstat(f.fileno()).st_mtime_ns
+    record["files"].append((file, size, mtime, sha256.hexdigest()))
+
+
+def _caption_row(event):
+    caption = normalize_caption(event)
+    return tuple(caption[column] for column in COLUMNS[Caption.__tablename__][1:])
+
+
+def iter_stream_rows(kind, path, period=None):
+    """Yield the row tuples of a streamed source, the same tuples read_game puts in a record."""
+    if kind == "captions":
+        yield from map(_caption_row, iter_member(path, "annotations"))
+    elif kind == "events":
+        yield from map(normalize_v2_annotation, iter_member(path, "annotations"))
+    else:
+        for _, v in iter_member(path, "segments"):
+            yield period, float(v[0]), float(v[1]), v[2]
+
+
+def read_game(root, league, season, files, stream=False):
+    """
+    Parse one game folder into a plain record of row tuples. Nothing here touches the database, team and
+    player references are kept as "home"/"away" and player hashes until the loader assigns ids.
+
+    With stream=True only the game and lineup data is parsed. The annotations and ASR segments are listed
+    in record["streams"] as (kind, path, period) and read by the loader while it writes them.
+    """
+    labels_file, *json_files = source_files(files)
+
+    record = {"root": root, "files": [], "league": league, "season": season, "streams": []}
+    if stream:
+        _fingerprint(root, labels_file, record)
+        path = os.path.join(root, labels_file)
+        with open(path, 'rb') as f:
+            data = {key: value for key, value in JsonStream(f).members(streamed={"annotations"})
+                    if key != "annotations"}
+        record["streams"].append(("captions", path, None))
+    else:
+        data = _read_json(root, labels_file, record)
+    home_team, away_team, game = normalize_game(data)
+
+    record.update({"home_team": home_team, "away_team": away_team, "game": game, "players": [], "lineup": [],
+                   "player_events": [], "captions": [], "events": None, "commentary": []})
+    for side in ("home", "away"):
+        team_lineup = data["lineup"][side]
+        tactic = team_lineup["tactic"]
+        for player_data in team_lineup["players"]:
+            player_hash, name, country, lineup, facts = normalize_lineup_player(player_data)
+            record["players"].append((player_hash, name, country))
+            record["lineup"].append((side, player_hash, lineup["shirt_number"], lineup["position"],
+                                     lineup["starting"], lineup["captain"], False, tactic))
+            for type, fact_time, linked_player in facts:
+                record["player_events"].append((player_hash, fact_time, type, linked_player))
+        coach_hash, coach_name, coach_country = normalize_coach(team_lineup["coach"][0])
+        record["players"].append((coach_hash, coach_name, coach_country))
+        record["lineup"].append((side, coach_hash, None, None, None, False, True, tactic))
+
+    if not stream:
+        record["captions"] = [_caption_row(event) for event in data["annotations"]]
+
+    for file in json_files:
+        kind = "events" if 'Labels-v2' in file else "commentary"
+        if kind == "events":
+            record["events"] = record["events"] or []
+        if stream:
+            _fingerprint(root, file, record)
+            record["streams"].append((kind, os.path.join(root, file), asr_period(file)))
+        elif kind == "events":
+            annotations = _read_json(root, file, record)["annotations"]
+            record["events"].extend(normalize_v2_annotation(annotation) for annotation in annotations)
+        else:
+            period = asr_period(file)
+            segments = _read_json(root, file, record)["segments"]
+            record["commentary"].extend((period, float(v[0]), float(v[1]), v[2]) for v in segments.values())
+    return record
+
+
+class BulkLoader:
+    """
+    Writes game records produced by read_game to the database.
+
+    Teams, leagues, players, player event labels and games are looked up in in-memory maps, seeded from
+    whatever is already in the database, so no SELECT is issued per row. Rows are buffered per table and
+    written with executemany in one transaction every batch_games games, or as soon as batch_rows rows
+    are buffered.
+
+    The manifest rows are written in the same transaction as the game rows, so an interrupted load is
+    picked up where it stopped on the next run.
+
+    Usage:
+        loader = BulkLoader(engine, batch_games=100, source_dir=directory)
+        for root, league, season, files in find_game_dirs(directory):
+            if not loader.skip_unchanged(root, files):
+                loader.add_game(read_game(root, league, season, files))
+        stats = loader.close()
+    """
+
+    def __init__(self, engine=None, batch_games=100, source_dir=None, batch_rows=50000):
+        self.engine = engine or get_engine()
+        self.batch_games = batch_games
+        self.batch_rows = batch_rows
+        self.pending_rows = 0
+        self.source_dir = source_dir
+        self.rows = {table: [] for table in COLUMNS}
+        self.counts = dict.fromkeys(COLUMNS, 0)
+        self.replaced_game_ids = []  # Games whose child rows are deleted on the next flush
+        self.game_updates = []
+        self.manifest_rows = []
+        self.stale_paths = []
+        self.games_added = 0
+        self.games_skipped = 0
+        self.games_replaced = 0
+        self.seasons = set()  # (season, league_id) pairs whose season stats are out of date
+        self.pending_games = 0
+        self.started = time.perf_counter()
+        self._load_dimensions()
+
+    def _load_dimensions(self):
+        with self.engine.connect() as conn:
+            # Like get_or_create, the first row with a given name wins
+            self.teams = {}
+            for id_, name in conn.execute(select(Team.id, Team.name).order_by(Team.id)):
+                self.teams.setdefault(name, id_)
+            self.leagues = {}
+            for id_, name in conn.execute(select(League.id, League.name).order_by(League.id)):
+                self.leagues.setdefault(name, id_)
+            self.players = set(conn.execute(select(Player.hash)).scalars())
+            self.labels = dict(conn.execute(select(Player_Event_Label.id, Player_Event_Label.label)).all())
+            self.games = {}
+            self.game_seasons = {}
+            for id_, timestamp, home_team_id, season, league_id in conn.execute(
+                    select(Game.id, Game.timestamp, Game.home_team_id, Game.season, Game.league_id).order_by(Game.id)):
+                self.games.setdefault((timestamp, home_team_id), id_)
+                self.game_seasons[id_] = (season, league_id)
+            # A database loaded before the season tables existed gets them filled for every season
+            if self.game_seasons and conn.execute(select(func.count()).select_from(Player_Season_Stats)).scalar() == 0:
+                self.seasons.update(self.game_seasons.values())
+            self.next_team_id = (conn.execute(select(func.max(Team.id))).scalar() or 0) + 1
+            self.next_league_id = (conn.execute(select(func.max(League.id))).scalar() or 0) + 1
+            self.next_game_id = (conn.execute(select(func.max(Game.id))).scalar() or 0) + 1
+            self.first_new_game_id = self.next_game_id
+
+            # path -> (size, mtime, sha256, game_id), and the manifest paths of each game folder
+            self.manifest = {}
+            self.manifest_dirs = {}
+            for path, size, mtime, sha256, game_id in conn.execute(
+                    select(Ingest_Manifest.path, Ingest_Manifest.size, Ingest_Manifest.mtime,
+                           Ingest_Manifest.sha256, Ingest_Manifest.game_id)):
+                self.manifest[path] = (size, mtime, sha256, game_id)
+                self.manifest_dirs.setdefault(path.rsplit("/", 1)[0], set()).add(path)
+
+        # Same labels as fill_player_events
+        known_labels = set(self.labels.values())
+        for label in fact_id2label.values():
+            if label not in known_labels:
+                label_id = max(self.labels, default=0) + 1
+                self.labels[label_id] = label
+                known_labels.add(label)
+                self.rows[Player_Event_Label.__tablename__].append((label_id, label))
+
+    def _manifest_path(self, root, file=None):
+        path = os.path.join(root, file) if file else root
+        if self.source_dir is not None:
+            path = os.path.relpath(path, self.source_dir)
+        return path.replace("\\", "/")
+
+    def skip_unchanged(self, root, files):
+        """
+        Return True, and count the game as skipped, if the manifest has exactly the source files of this
+        folder with the same size and mtime. This only stats the files, nothing is read.
+        """
+        sources = source_files(files)
+        paths = {self._manifest_path(root, file): file for file in sources}
+        if set(paths) != self.manifest_dirs.get(self._manifest_path(root), set()):
+            return False
+        for path, file in paths.items():
+            stat = os.stat(os.path.join(root, file))
+            if (stat.st_size, stat.st_mtime_ns) != self.manifest[path][:2]:
+                return False
+        self.games_skipped += 1
+        return True
+
+    def _update_manifest(self, record, game_id):
+        game_dir = self._manifest_path(record["root"])
+        paths = set()
+        for file, size, mtime, sha256 in record["files"]:
+            path = self._manifest_path(record["root"], file)
+            paths.add(path)
+            self.manifest[path] = (size, mtime, sha256, game_id)
+            self.manifest_rows.append((path, size, mtime, sha256, game_id))
+        for path in self.manifest_dirs.get(game_dir, set()) - paths:
+            del self.manifest[path]
+            self.stale_paths.append((path,))
+        self.manifest_dirs[game_dir] = paths
+
+    def _unchanged_content(self, record):
+        # Files were touched but their content is the same as what is loaded
+        game_dir = self._manifest_path(record["root"])
+        hashes = {self._manifest_path(record["root"], file): sha256 for file, _, _, sha256 in record["files"]}
+        if set(hashes) != self.manifest_dirs.get(game_dir, set()):
+            return None
+        if any(self.manifest[path][2] != sha256 for path, sha256 in hashes.items()):
+            return None
+        return self.manifest[next(iter(hashes))][3]
+
+    def _extend(self, table, rows):
+        # Buffer rows, flushing whenever batch_rows rows are waiting
+        buffer = self.rows[table]
+        for row in rows:
+            buffer.append(row)
+            self.pending_rows += 1
+            if self.pending_rows >= self.batch_rows:
+                self.flush()
+                buffer = self.rows[table]
+
+    def _team(self, name):
+        if name not in self.teams:
+            self.teams[name] = self.next_team_id
+            self.rows[Team.__tablename__].append((self.next_team_id, name))
+            self.next_team_id += 1
+        return self.teams[name]
+
+    def _league(self, name):
+        if name not in self.leagues:
+            self.leagues[name] = self.next_league_id
+            self.rows[League.__tablename__].append((self.next_league_id, name))
+            self.next_league_id += 1
+        return self.leagues[name]
+
+    def add_game(self, record):
+        """
+        Buffer the rows of one game record and flush if the batch is full. Returns the game id.
+
+        A game that is already in the database from an earlier load gets its row updated and its child rows
+        replaced, unless its files have the same content as recorded in the manifest.
+        """
+        game_id = self._unchanged_content(record)
+        if game_id is not None:
+            self._update_manifest(record, game_id)
+            self.games_skipped += 1
+            return game_id
+
+        home_team_id = self._team(record["home_team"])
+        away_team_id = self._team(record["away_team"])
+        game = record["game"]
+        league_id = self._league(record["league"])
+        key = (game["timestamp"], home_team_id)
+        game_id = self.games.get(key)
+        game_row = tuple(game[column] for column in GAME_FIELDS) + (home_team_id, away_team_id, record["season"],
+                                                                    league_id)
+        if game_id is None:
+            game_id = self.games[key] = self.next_game_id
+            self.next_game_id += 1
+            self.rows[Game.__tablename__].append((game_id,) + game_row)
+        elif game_id < self.first_new_game_id:
+            # The game may have moved to another season or league
+            self.seasons.add(self.game_seasons[game_id])
+            self.replaced_game_ids.append((game_id,))
+            self.game_updates.append(game_row + (game_id,))
+            self.games_replaced += 1
+
+        for player in record["players"]:
+            if player[0] not in self.players:
+                self.players.add(player[0])
+                self.rows[Player.__tablename__].append(player)
+
+        team_ids = {"home": home_team_id, "away": away_team_id}
+        self.rows[GameLineup.__tablename__].extend(
+            (game_id, team_ids[row[0]]) + row[1:] for row in record["lineup"])
+
+        for player_event in record["player_events"]:
+            type = player_event[2]
+            if type not in self.labels:
+                self.labels[type] = None
+                self.rows[Player_Event_Label.__tablename__].append((type, None))
+        self.rows[Player_Event.__tablename__].extend((game_id,) + row for row in record["player_events"])
+        self._extend(Caption.__tablename__, ((game_id,) + row for row in record["captions"]))
+
+        if record["events"] is not None:
+            team_ids[NO_TEAM] = self._team(NO_TEAM)
+        self._extend(Event.__tablename__, self._event_rows(game_id, team_ids, record["events"] or ()))
+        self._extend(Commentary.__tablename__, ((game_id,) + row for row in record["commentary"]))
+
+        for kind, path, period in record["streams"]:
+            rows = iter_stream_rows(kind, path, period)
+            if kind == "events":
+                self._extend(Event.__tablename__, self._event_rows(game_id, team_ids, rows))
+            else:
+                table = Caption.__tablename__ if kind == "captions" else Commentary.__tablename__
+                self._extend(table, ((game_id,) + row for row in rows))
+
+        # Recorded last, a game cut short by a failure is loaded again on the next run
+        self._update_manifest(record, game_id)
+        self.seasons.add((record["season"], league_id))
+        self.games_added += 1
+        self.pending_games += 1
+        if self.pending_games >= self.batch_games:
+            self.flush()
+        return game_id
+
+    @staticmethod
+    def _event_rows(game_id, team_ids, events):
+        for period, game_time, team, position, visibility, label in events:
+            yield game_id, period, game_time, team_ids.get(team, team_ids.get(NO_TEAM)), position, label, visibility
+
+    def flush(self):
+        """Write all buffered rows in a single transaction."""
+        with self.engine.begin() as conn:
+            if self.replaced_game_ids:
+                for table in CHILD_TABLES:
+                    conn.exec_driver_sql(f"DELETE FROM {table} WHERE game_id = ?", self.replaced_game_ids)
+                columns = COLUMNS[Game.__tablename__][1:]
+                conn.exec_driver_sql(f"UPDATE {Game.__tablename__} SET {', '.join(c + ' = ?' for c in columns)} "
+                                     f"WHERE id = ?", self.game_updates)
+            # After the deletes: SQLite gives the ids of deleted rows at the end of a table to new rows again,
+            # the replacement rows of a game would otherwise be at or below last_ids and never reach text_search
+            last_ids = last_text_ids(conn)
+            for table, columns in COLUMNS.items():
+                rows = self.rows[table]
+                if not rows:
+                    continue
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                conn.exec_driver_sql(sql, rows)
+                self.counts[table] += len(rows)
+                self.rows[table] = []
+            sync_text_search(conn, last_ids)
+            if self.stale_paths:
+                conn.exec_driver_sql(f"DELETE FROM {Ingest_Manifest.__tablename__} WHERE path = ?", self.stale_paths)
+            if self.manifest_rows:
+                conn.exec_driver_sql(f"INSERT OR REPLACE INTO {Ingest_Manifest.__tablename__} "
+                                     f"(path, size, mtime, sha256, game_id) VALUES (?, ?, ?, ?, ?)",
+                                     self.manifest_rows)
+        self.replaced_game_ids, self.game_updates, self.manifest_rows, self.stale_paths = [], [], [], []
+        self.pending_games = 0
+        self.pending_rows = 0
+
+    def stats(self):
+        seconds = time.perf_counter() - self.started
+        rows = sum(self.counts.values())
+        return {"games": self.games_added, "skipped": self.games_skipped, "replaced": self.games_replaced,
+                "rows": rows, "seconds": seconds,
+                "rows_per_sec": rows / seconds if seconds else 0.0, "tables": dict(self.counts)}
+
+    def close(self):
+        """Flush what is left, refresh the season stats of the seasons that changed and return the load statistics."""
+        self.flush()
+        refresh_season_stats(self.engine, self.seasons)
+        self.seasons = set()
+        return self.stats()
+
+
+def _read_game(game_dir, stream=False):
+    return read_game(*game_dir, stream=stream)
+
+
+def iter_game_records(game_dirs, workers=1, chunksize=4, stream=False):
+    """
+    Yield the record of every (root, league, season, files) game folder, in the order given.
+
+    With workers > 1 the folders are parsed by a process pool. imap keeps the results in order, so the
+    records, and the ids the loader gives them, are the same as when parsing on one core.
+    """
+    read = functools.partial(_read_game, stream=stream)
+    if workers <= 1:
+        yield from map(read, game_dirs)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(read, game_dirs, chunksize=chunksize)
+
+
+def bulk_process_json_files(directory, engine=None, batch_games=100, workers=1, stream=False, batch_rows=50000,
+                            indexes=True):
+    """
+    Bulk version of process_json_files. Returns the statistics of the load. Missing tables are created first.
+
+    With indexes=True the secondary indexes are created once the rows are in. A fresh database is then
+    loaded into bare tables, a refresh updates the existing indexes as it goes.
+
+    SQLite only allows one writer, so with workers > 1 only the parsing is spread over a process pool
+    and this process stays the single writer. With stream=True the annotations and ASR segments are read
+    incrementally by the writer and flushed every batch_rows rows, which bounds memory use.
+
+    Games already loaded from unchanged files are skipped, so running this again on the same directory
+    only loads what changed since the last run.
+    """
+    engine = init_db(engine)
+    loader = BulkLoader(engine, batch_games=batch_games, source_dir=directory, batch_rows=batch_rows)
+    game_dirs = [game_dir for game_dir in find_game_dirs(directory)
+                 if not loader.skip_unchanged(game_dir[0], game_dir[3])]
+    for record in iter_game_records(game_dirs, workers=workers, stream=stream):
+        loader.add_game(record)
+    stats = loader.close()
+    if indexes:
+        create_indexes(engine)
+    print(f"Loaded {stats['games']} games, {stats['rows']} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_sec']:.0f} rows/sec), {stats['skipped']} unchanged, {stats['replaced']} replaced")
+    return stats
@@ -0,0 +1,250 @@
+"""
+Latency of the stages of a question: extraction, matching, primary keys, prompt, few-shot selection, agent.
+
+Stages are timed with span (a context manager) or timed (a decorator). Each duration goes to a histogram of
+its stage, kept for the whole process, and to the breakdown of the current request when one was started with
+request, so one slow answer can be broken down and the usual latency of every stage compared. SpanCallbackHandler
+times the LLM calls and tool calls (SQL queries, schema lookups) of a langchain agent the same way.
+
+Instrumentation is off unless INSTRUMENTATION is set in .env or enable() is called. Off, span returns a shared
+no-op context and timed calls the function directly.
+
+Usage:
+    with instrumentation.request("query") as breakdown:
+        clean = prompt_cleaner.clean(prompt)
+        answer = agent.ask(clean)
+    print(breakdown.to_dict())
+    instrumentation.export_json("timings.json")  # Histograms and the recent requests
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Upper bounds of the histogram buckets, in milliseconds, the last bucket has none
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+_enabled = os.getenv("INSTRUMENTATION", "").strip().lower() in ("1", "true", "yes")
+_current = contextvars.ContextVar("instrumentation_request", default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+_recent = deque(maxlen=100)  # Breakdowns of the last requests, for export
+_disabled_span = nullcontext()
+
+
+def enable(enabled=True):
+    """Turn instrumentation on or off for the process."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+class Histogram:
+    """Count, total, min, max and bucket counts of the durations of one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self.count += 1
+            self.total_ms += ms
+            self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+            self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+            bucket = 0
+            while bucket < len(BUCKETS_MS) and ms > BUCKETS_MS[bucket]:
+                bucket += 1
+            self.buckets[bucket] += 1
+
+    def to_dict(self):
+        with self._lock:
+            bounds = [f"<={bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+            return {
+                "count": self.count,
+                "total_ms": round(self.total_ms, 3),
+                "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+                "min_ms": self.min_ms and round(self.min_ms, 3),
+                "max_ms": self.max_ms and round(self.max_ms, 3),
+                "buckets_ms": dict(zip(bounds, self.buckets)),
+            }
+
+
+class Request:
+    """Spans of one request, in the order they ended, with their start relative to the request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.depth = 0
+        self.spans = []  # (name, start ms, duration ms, depth)
+
+    def to_dict(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        totals = {}
+        for name, _, ms, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + ms
+        return {
+            "name": self.name,
+            "total_ms": round((end - self.start) * 1000, 3),
+            "stages_ms": {name: round(ms, 3) for name, ms in totals.items()},
+            "spans": [{"name": name, "start_ms": round(start, 3), "duration_ms": round(ms, 3), "depth": depth}
+                      for name, start, ms, depth in self.spans],
+        }
+
+
+def record(name, start, end, request=None):
+    """Record a stage that ran from start to end (time.perf_counter()) in its histogram and the request."""
+    ms = (end - start) * 1000
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+    histogram.add(ms)
+    request = request or _current.get()
+    if request is not None:
+        request.spans.append((name, (start - request.start) * 1000, ms, request.depth))
+
+
+@contextmanager
+def _span(name):
+    request = _current.get()
+    if request is not None:
+        request.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if request is not None:
+            request.depth -= 1
+        record(name, start, end, request)
+
+
+def span(name):
+    """Context manager timing the stage name, a no-op when instrumentation is off."""
+    if not _enabled:
+        return _disabled_span
+    return _span(name)
+
+
+def timed(name):
+    """Decorator timing every call of the function as the stage name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request(name="request"):
+    """
+    Collect the spans of the code in the block, in this thread or task, into a Request. Yields the Request,
+    or None when instrumentation is off.
+    """
+    if not _enabled:
+        yield None
+        return
+    current = Request(name)
+    token = _current.set(current)
+    try:
+        with _span(name):
+            yield current
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+        _recent.append(current)
+
+
+def current_request():
+    """The Request being collected, None outside of request."""
+    return _current.get()
+
+
+def export():
+    """The histograms of every stage and the breakdowns of the recent requests."""
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {
+        "histograms": {name: histogram.to_dict() for name, histogram in sorted(histograms.items())},
+        "requests": [recent.to_dict() for recent in list(_recent)],
+    }
+
+
+def export_json(path=None):
+    """export() as JSON, written to path when given."""
+    text = json.dumps(export(), indent=2)
+    if path:
+        with open(path, "w") as file:
+            file.write(text)
+    return text
+
+
+def reset():
+    """Forget the histograms and the recent requests."""
+    with _histograms_lock:
+        _histograms.clear()
+    _recent.clear()
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """
+    langchain callbacks timing the LLM calls ("agent.llm") and tool calls ("tool.<name>") of a chain or agent.
+
+    Usage:
+        agent.invoke(inputs, config={"callbacks": [SpanCallbackHandler()]})
+    """
+
+    def __init__(self):
+        # run id -> (stage, start, request), the callbacks of a run may come from another thread
+        self._runs = {}
+
+    def _start(self, run_id, name):
+        if _enabled:
+            self._runs[run_id] = (name, time.perf_counter(), _current.get())
+
+    def _end(self, run_id):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            name, start, run_request = run
+            record(name, start, time.perf_counter(), run_request)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "agent.llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "agent.llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, f"tool.{(serialized or {}).get('name', 'unknown')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
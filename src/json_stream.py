@@ -0,0 +1,122 @@
+"""
+Incremental reader for the SoccerNet JSON files.
+
+json.load keeps the whole document, and every object in it, in memory at once. The ASR files are one large
+"segments" object and the label files one large "annotations" array, so JsonStream reads the file in
+fixed-size chunks and hands out the elements of those members one at a time. Memory use then depends on the
+chunk size and the size of a single element, not on the size of the file.
+"""
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = ",:]}" + _WHITESPACE
+
+
+class JsonStream:
+    """
+    Reads the top-level object of a JSON file member by member.
+
+    Usage:
+        with open(path, 'rb') as f:
+            for key, value in JsonStream(f).members(streamed={"segments"}):
+                if key == "segments":
+                    for name, segment in value:  # Elements are parsed as they are iterated
+                        ...
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        # Drop what was consumed and append the next chunk
+        chunk = self.f.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.text.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def _peek(self):
+        # Next non-whitespace character, '' at the end of the file
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number cut by the end of the chunk decodes fine, so only trust a value followed by a delimiter
+                if self.eof or end < len(self.buf) and self.buf[end] in _DELIMITERS:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+    def elements(self):
+        """Yield the values of the array, or the (key, value) pairs of the object, at the current position."""
+        opener = self._expect("[{")
+        close = "]" if opener == "[" else "}"
+        if self._peek() == close:
+            self.pos += 1
+            return
+        while True:
+            if opener == "{":
+                key = self._value()
+                self._expect(":")
+                yield key, self._value()
+            else:
+                yield self._value()
+            if self._expect("," + close) == close:
+                return
+
+    def members(self, streamed=()):
+        """
+        Yield (key, value) for each member of the top-level object. The value of a key in streamed is an
+        elements() iterator, which must be used before asking for the next member. Whatever is left of it
+        is skipped.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key in streamed:
+                elements = self.elements()
+                yield key, elements
+                for _ in elements:
+                    pass
+            else:
+                yield key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+def iter_member(path, key, chunk_size=1 << 16):
+    """Yield the elements of the top-level member key of the JSON file at path."""
+    with open(path, 'rb') as f:
+        for name, value in JsonStream(f, chunk_size).members(streamed={key}):
+            if name == key:
+                yield from value
@@ -0,0 +1,239 @@
+"""
+Entity extraction without the LLM, for questions that name the entities the way the database does.
+
+LocalExtractor builds an Aho-Corasick automaton over the vocabularies of the retrievers (players, teams,
+leagues, event labels, ...) and the augmented names of the teams and leagues, and finds all of them in one
+pass over the question. Seasons are found with regular expressions ("2015-2016", "15-16", "2014-15", "2015").
+The result has the shape of extract_properties, the text of the question as it was written, so the retrievers
+resolve it the same way.
+
+The extraction is only certain when the question has nothing left outside the matches that may be an entity:
+no word, capitalized or not ("messi", "atletico madrid"), that is not a common word of questions, no number, no
+phrase that is a name of two properties, and no match joined by "and" or "or" to a word outside the matches, which
+may share its head noun ("yellow and red cards", "Manchester United or City"). PromptCleaner asks the LLM for the
+others.
+"""
+import re
+import unicodedata
+
+# Seasons like 2015-2016, 2015-16, 15-16, 15-2016, 2015/16 and single years
+_SEASON = re.compile(r"(?<![\w-])(?:(?:(?:19|20)\d{2}|\d{2})\s*[-/]\s*(?:(?:19|20)\d{2}|\d{2})|(?:19|20)\d{2})(?![\w-])")
+_WORD = re.compile(r"\w+")
+# Capitalized anywhere in a question without being an entity
+_COMMON_WORDS = {
+    "a", "all", "an", "and", "any", "are", "as", "at", "by", "calculate", "can", "count", "database", "did", "do",
+    "does", "find", "for", "from", "game", "games", "get", "give", "has", "have", "how", "i", "in", "is", "it",
+    "league", "leagues", "list", "make", "many", "me", "most", "much", "no", "not", "of", "on", "or", "player",
+    "players", "please", "season", "seasons", "show", "team", "teams", "tell", "the", "to", "was", "were", "what",
+    "when", "where", "which", "who", "with",
+}
+# Words of the questions around the entities, outside the matches they leave the extraction certain
+_QUESTION_WORDS = _COMMON_WORDS | {
+    "about", "advantage", "after", "against", "aggregate", "also", "anyone", "average", "away", "be", "been",
+    "before", "best", "between", "both", "but", "commentary", "could", "during", "each", "ever", "event", "events",
+    "every", "first", "given", "got", "had", "half", "happen", "happened", "he", "her", "his", "home", "if",
+    "include", "into", "its", "last", "least", "less", "limit", "lose", "lost", "match", "matches", "mention",
+    "mentioned", "mentions", "minute", "minutes", "more", "name", "names", "number", "occurred", "only", "order",
+    "other", "over", "per", "period", "play", "played", "playing", "plays", "receive", "received", "record",
+    "result", "results", "say", "said", "score", "scored", "scorer", "scorers", "scores", "second", "she", "should",
+    "sort", "sorted", "start", "started", "starts", "stats", "statistics", "table", "than", "that", "their", "them",
+    "then", "there", "these", "they", "this", "those", "time", "times", "top", "total", "under", "up", "versus",
+    "vs", "who", "whose", "will", "win", "wins", "won", "would",
+}
+_CONNECTORS = {"and", "or"}
+
+
+def _fold_char(char):
+    # Lowercase, accents stripped and anything but letters and digits as a space, one character for one
+    base = unicodedata.normalize("NFKD", char)[:1].lower()
+    return base if len(base) == 1 and base.isalnum() else " "
+
+
+def fold(text):
+    """
+    Return the text lowercased, without accents, with runs of other characters as one space, and for each
+    character of the result the index of the character of text it comes from.
+    """
+    folded, positions = [], []
+    for i, char in enumerate(text):
+        char = _fold_char(char)
+        if char == " " and (not folded or folded[-1] == " "):
+            continue
+        folded.append(char)
+        positions.append(i)
+    return "".join(folded), positions
+
+
+class AhoCorasick:
+    """
+    Multi-pattern string search, all occurrences of all patterns in one pass over the text.
+
+    Usage:
+        automaton = AhoCorasick()
+        automaton.add("real madrid", "team_name")
+        automaton.build()
+        list(automaton.find("is real madrid in it"))  # [(3, 14, 'real madrid', {'team_name'})]
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # Patterns ending at each state
+        self.values = {}
+
+    def add(self, pattern, value):
+        """Add pattern, tagged with value. A pattern added several times keeps all its values."""
+        if pattern not in self.values:
+            self.values[pattern] = set()
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.out[state].append(pattern)
+        self.values[pattern].add(value)
+
+    def build(self):
+        """Compute the failure links, after the last add."""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, text):
+        """Yield (start, end, pattern, values) for every occurrence of a pattern in text."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for pattern in self.out[state]:
+                yield i + 1 - len(pattern), i + 1, pattern, self.values[pattern]
+
+
+class LocalExtractor:
+    """
+    Extracts the properties of a question from the vocabularies of retrievers, see the module docstring.
+
+    Usage:
+        extractor = LocalExtractor(prompt_cleaner.retrievers)
+        properties, certain = extractor.extract("Is Manchester United in the database?")
+        # [{'team_name': ['Manchester United']}], True
+    """
+
+    def __init__(self, retrievers):
+        """
+        Args:
+            retrievers (dict): Retriever per property name, as PromptCleaner.retrievers.
+        """
+        self.retrievers = retrievers
+        self.automaton = None
+        self.sources = None
+        self.seasons = [name for name, retriever in retrievers.items() if retriever.numeric]
+
+    def _sources(self):
+        # The vocabularies and alias maps the automaton is built from, reloaded by the retrievers when the
+        # database changes
+        sources = {}
+        for name, retriever in self.retrievers.items():
+            if retriever.numeric:
+                continue
+            sources[name] = [retriever.query_as_list()]
+            if retriever.augmented_table:
+                sources[name].append(retriever.aliases())
+        return sources
+
+    def get_automaton(self):
+        """The automaton of the current vocabularies, built again when one of them changed."""
+        sources = self._sources()
+        current = self.sources is not None and all(
+            len(sources[name]) == len(self.sources[name]) and all(a is b for a, b in zip(sources[name],
+                                                                                         self.sources[name]))
+            for name in sources)
+        if not current:
+            automaton = AhoCorasick()
+            for name, names in sources.items():
+                for vocabulary in names:
+                    for value in vocabulary:
+                        pattern = fold(str(value))[0].strip()
+                        # Too short or too common to tell a name from a word of the question
+                        if len(pattern) < 2 or pattern in _COMMON_WORDS:
+                            continue
+                        automaton.add(pattern, name)
+                        # Plurals, "yellow cards" for the event label "Yellow card"
+                        automaton.add(pattern + "s", name)
+            automaton.build()
+            self.automaton, self.sources = automaton, sources
+        return self.automaton
+
+    def extract(self, prompt):
+        """
+        Return (properties, certain). properties has the shape of extract_properties, None when nothing was
+        found, and certain tells whether the question may name something the vocabularies do not have.
+        """
+        folded, positions = fold(prompt)
+        certain = True
+        spans = []  # (start, end) in prompt, property names
+        for start, end, _, names in self._matches(folded):
+            spans.append(((positions[start], positions[end - 1] + 1), names))
+        for name in self.seasons:
+            spans.extend(((match.start(), match.end()), {name}) for match in _SEASON.finditer(prompt))
+
+        # Leftmost-longest matches that do not overlap
+        spans.sort(key=lambda span: (span[0][0], -span[0][1]))
+        properties, covered, last_end = {}, [], -1
+        for (start, end), names in spans:
+            if start < last_end:
+                continue
+            last_end = end
+            covered.append((start, end))
+            if len(names) > 1:
+                # The same name is, e.g., a player and a team
+                certain = False
+                continue
+            values = properties.setdefault(next(iter(names)), [])
+            if prompt[start:end] not in values:
+                values.append(prompt[start:end])
+
+        if certain:
+            certain = not self._leftovers(prompt, covered) and not self._elided(prompt, covered)
+        return ([properties] if properties else None), certain
+
+    def _matches(self, folded):
+        # Matches starting and ending at word boundaries
+        for start, end, pattern, names in self.get_automaton().find(folded):
+            if (start == 0 or folded[start - 1] == " ") and (end == len(folded) or folded[end] == " "):
+                yield start, end, pattern, names
+
+    def _leftovers(self, prompt, covered):
+        # Words outside the matches that may be an entity, whatever their case
+        leftovers = []
+        for match in _WORD.finditer(prompt):
+            if any(start <= match.start() < end for start, end in covered):
+                continue
+            word = match.group()
+            if any(char.isdigit() for char in word) or word.lower() not in _QUESTION_WORDS:
+                leftovers.append(word)
+        return leftovers
+
+    @staticmethod
+    def _elided(prompt, covered):
+        # Matches joined by a connector to a word outside the matches, "yellow" in "yellow and red cards" is
+        # an event whose noun is that of the match
+        words = list(_WORD.finditer(prompt))
+        inside = [any(start <= word.start() < end for start, end in covered) for word in words]
+        for i in range(1, len(words) - 1):
+            if words[i].group().lower() not in _CONNECTORS or inside[i - 1] == inside[i + 1]:
+                continue
+            other = words[i - 1] if inside[i + 1] else words[i + 1]
+            if other.group().lower() not in _COMMON_WORDS:
+                return True
+        return False
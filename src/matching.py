@@ -0,0 +1,198 @@
+"""
+Fuzzy lookup of a name in a vocabulary, the matching behind Retriever.fuzzy_string.
+
+thefuzz.process.extract processes every choice again and scores the query against all of them on every call.
+FuzzyIndex processes the vocabulary once and keeps, for every trigram of the processed names, the names that
+contain it. A lookup with a score cutoff then only scores a shortlist of the names sharing the most trigrams
+with the query, with the same scorer, processing and rounding as thefuzz. Sharing trigrams is not the score, so
+the shortlist is a heuristic: a name left out can score as high as the best one kept. Every name is scored,
+which is what thefuzz would have done, when none of the shortlist reaches the cutoff, when the trigrams are too
+common to pick a shortlist, and when the least alike names kept score within FALLBACK_MARGIN of the best, which
+means names just as alike may have been left out.
+
+extract_many looks up several names at once, their shortlists scored on several threads and the names that need
+a full scan in one rapidfuzz.process.cdist call that can use several threads, and select_matches turns the matches into what fuzzy_string returns.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from thefuzz import utils
+
+# thefuzz runs full_process on the query, then process.extract runs the ASCII version on the query and choices
+_process = partial(utils.full_process, force_ascii=True)
+# A shortlist whose least alike names score this close to its best match is scored against every name
+FALLBACK_MARGIN = 5
+
+
+def process_query(query):
+    """The query as thefuzz.process.extract compares it."""
+    return _process(utils.full_process(query))
+
+
+def trigrams(processed):
+    """Trigrams of the words of a processed name, padded so short words and word boundaries count."""
+    grams = set()
+    for word in processed.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FuzzyIndex:
+    """
+    Trigram index over a list of choices.
+
+    Usage:
+        index = FuzzyIndex(["Lionel Messi", "Cristiano Ronaldo"])
+        index.extract("Lionel Mesi", limit=3, score_cutoff=80)  # [('Lionel Messi', 96)]
+    """
+
+    def __init__(self, choices, shortlist=1000):
+        """
+        Args:
+            choices (list of str): The vocabulary, kept by reference. Matches are returned from it.
+            shortlist (int): Names scored by a lookup with a score cutoff.
+        """
+        self.choices = choices
+        self.shortlist = shortlist
+        self.processed = [_process(choice) for choice in choices]
+        postings = {}
+        sizes = []
+        for i, processed in enumerate(self.processed):
+            grams = trigrams(processed)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.sizes = np.array(sizes, dtype=np.int32)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def _candidates(self, query):
+        # (indexes of the names sharing the most trigrams with query, indexes of the least alike of them), None
+        # when they can not be told apart
+        grams = trigrams(query)
+        ids = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not ids:
+            return None
+        counts = np.bincount(np.concatenate(ids))
+        hits = np.flatnonzero(counts)
+        if len(hits) <= self.shortlist:
+            return hits, hits[:0]
+        shared, sizes = counts[hits], self.sizes[hits]
+        # Half of the shortlist are the names most alike as a whole (Dice coefficient), what ratio scores, the
+        # other half the names contained in the query or containing it, what the partial and token ratios score
+        half = self.shortlist // 2
+        candidates, weakest = [], []
+        for similarity in (2 * shared / (len(grams) + sizes), shared / np.minimum(len(grams), sizes)):
+            top = np.argpartition(similarity, -half)[-half:]
+            # More names than the shortlist are as alike as the best ones, e.g. all those with a common surname
+            if similarity[top].min() == similarity.max():
+                return None
+            candidates.append(hits[top])
+            weakest.append(hits[top[similarity[top] == similarity[top].min()]])
+        return np.union1d(*candidates), np.union1d(*weakest)
+
+    def extract(self, query, limit=5, score_cutoff=0):
+        """
+        Return the best limit matches of query as (choice, score) tuples, best first, like
+        thefuzz.process.extractBests(query, choices, limit=limit, score_cutoff=score_cutoff).
+
+        With a score_cutoff above 0 only the shortlisted names are scored, unless none of them reaches it, all
+        limit matches found have the same score, or the least alike shortlisted names score within
+        FALLBACK_MARGIN of the best. The result is then approximate: usually that of thefuzz, but a name left
+        out of the shortlist can score as high as the best match, which is then missing from the ties.
+        """
+        return self.extract_many([query], limit=limit, score_cutoff=score_cutoff)[0]
+
+    def _shortlisted(self, query, limit, score_cutoff):
+        # The matches of query among its shortlist, None when every name has to be scored
+        shortlist = self._candidates(query)
+        if shortlist is None:
+            return None
+        candidates, weakest = shortlist
+        scores = process.cdist([query], [self.processed[j] for j in candidates], scorer=fuzz.WRatio,
+                               processor=None, score_cutoff=score_cutoff, dtype=np.float64)[0]
+        best = _best(scores, candidates, limit, score_cutoff)
+        if not best:
+            return None
+        # limit names tied at the best score, e.g. sharing a first name with the query, may be the first
+        # few of many more, and the scan picks the first ones in the vocabulary
+        if len(best) == limit and round(best[-1][0]) == round(best[0][0]):
+            return None
+        # The names just left out are about as alike as the least alike kept, and may score as high as
+        # the best
+        if len(weakest) and process.cdist([query], [self.processed[j] for j in weakest], scorer=fuzz.WRatio,
+                                          processor=None, score_cutoff=best[0][0] - FALLBACK_MARGIN,
+                                          dtype=np.float64).any():
+            return None
+        return best
+
+    def extract_many(self, queries, limit=5, score_cutoff=0, workers=1):
+        """
+        extract for each of queries. The shortlists of the queries are scored on workers threads, the
+        queries that need all the names scored in one process.cdist call on workers threads, so a batch takes
+        about as long as its slowest query when there are as many cores as queries.
+
+        Args:
+            workers (int): Threads, -1 for one per core.
+        """
+        queries = [process_query(query) for query in queries]
+        results = [None] * len(queries)
+        if score_cutoff > 0:
+            threads = min(len(queries), (os.cpu_count() or 1) if workers == -1 else workers)
+            if threads > 1:
+                # rapidfuzz releases the GIL while it scores
+                with ThreadPoolExecutor(threads) as executor:
+                    results = list(executor.map(lambda query: self._shortlisted(query, limit, score_cutoff),
+                                                queries))
+            else:
+                results = [self._shortlisted(query, limit, score_cutoff) for query in queries]
+        rest = [i for i, result in enumerate(results) if result is None]
+        if rest:
+            scores = process.cdist([queries[i] for i in rest], self.processed, scorer=fuzz.WRatio, processor=None,
+                                   score_cutoff=score_cutoff, dtype=np.float64, workers=workers)
+            ids = np.arange(len(self.processed))
+            for row, i in enumerate(rest):
+                results[i] = _best(scores[row], ids, limit, score_cutoff)
+        return [[(self.choices[j], int(round(score))) for score, j in result] for result in results]
+
+
+def _best(scores, ids, limit, score_cutoff):
+    # (score, id) of the limit best scores, ties broken by position in the vocabulary as in process.extract
+    keep = np.flatnonzero(scores >= score_cutoff)
+    if len(keep) > limit:
+        kth = np.partition(scores[keep], -limit)[-limit]
+        keep = keep[scores[keep] >= kth]
+    order = np.lexsort((ids[keep], -scores[keep]))[:limit]
+    return [(scores[k], ids[k]) for k in keep[order]]
+
+
+def select_matches(matches, threshold=80, low_threshold=30):
+    """
+    What Retriever.fuzzy_string returns for the best (choice, score) matches of a lookup: the best choice if
+    it is the only one meeting the threshold, the choices tied with it otherwise, and when none meets the
+    threshold, the list of choices meeting low_threshold.
+    """
+    filtered_matches = [match for match in matches if match[1] >= threshold]
+
+    # If no matches meet the threshold, return the list of all matches' strings
+    if not filtered_matches:
+        # Return matches above the low_threshold
+        # Fix for wrong properties being returned
+        return [match[0] for match in matches if match[1] >= low_threshold]
+
+    # If there's only one match meeting the threshold, return it as a string
+    if len(filtered_matches) == 1:
+        return filtered_matches[0][0]  # Return the matched string directly
+
+    # If there's more than one match meeting the threshold or ties, return the list of matches' strings
+    highest_score = filtered_matches[0][1]
+    ties = [match for match in filtered_matches if match[1] == highest_score]
+
+    # Return the strings of tied matches directly, ignoring the scores
+    m = [match[0] for match in ties]
+    if len(m) == 1:
+        return m[0]
+    return [match[0] for match in ties]
@@ -0,0 +1,77 @@
+"""
+The ways a player is named in a question, looked up without fuzzy matching.
+
+Questions name players as "C. Ronaldo", "E. Hazard", "Messi" or "Mesut Ozil", which fuzzy matching has to find
+by scoring the whole vocabulary. NameVariantIndex maps the variants of every name (full name, surname, initial
+and surname, first name, first name and surname, all lowercase and without accents) to the primary keys of
+the players, so Retriever.fuzzy_strings resolves them with one dict lookup. The ingestion prefixes single
+word names with "NULL ", which is not a variant.
+"""
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+
+def normalize_name(name):
+    """name lowercased, without accents and with anything but letters and digits as single spaces."""
+    if not name.isascii():
+        decomposed = unicodedata.normalize("NFKD", name)
+        name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", name).strip().lower()
+
+
+def name_variants(name):
+    """
+    The normalized variants of a full name.
+
+    Usage:
+        name_variants("Kevin De Bruyne")
+        # {'kevin de bruyne', 'kevin', 'de bruyne', 'k de bruyne', 'bruyne', 'k bruyne', 'kevin bruyne'}
+    """
+    if name.startswith("NULL "):
+        name = name[len("NULL "):]
+    words = normalize_name(name).split()
+    if not words:
+        return set()
+    variants = {" ".join(words)}
+    if len(words) > 1:
+        first = words[0]
+        variants.add(first)
+        for i in range(1, len(words)):
+            surname = " ".join(words[i:])
+            variants.update((surname, f"{first[0]} {surname}", f"{first} {surname}"))
+    return {variant for variant in variants if len(variant) > 1}
+
+
+class NameVariantIndex:
+    """
+    Name variant -> primary keys of the names having it.
+
+    Usage:
+        index = NameVariantIndex([("Cristiano Ronaldo", "h1"), ("Ronaldo Luís Nazário", "h2")])
+        index.lookup("C. Ronaldo")  # ['Cristiano Ronaldo']
+        index.lookup("Ronaldo")  # ['Cristiano Ronaldo', 'Ronaldo Luís Nazário']
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows (iterable of tuple): (name, primary key) rows. A primary key keeps the name of its first row.
+        """
+        self.names = {}  # primary key -> name
+        self.variants = {}  # variant -> primary keys, in the order of rows
+        for name, pk in rows:
+            if not name or pk in self.names:
+                continue
+            self.names[pk] = name
+            for variant in name_variants(name):
+                self.variants.setdefault(variant, []).append(pk)
+
+    def lookup_pks(self, query):
+        """Primary keys of the names having query as a variant."""
+        return self.variants.get(normalize_name(str(query)), [])
+
+    def lookup(self, query):
+        """Names having query as a variant, without duplicates, in the order of rows."""
+        return list(dict.fromkeys(self.names[pk] for pk in self.lookup_pks(query)))
@@ -0,0 +1,122 @@
+"""
+Cache of the results of the SQL the agent runs, so a query it already ran returns without reaching SQLite.
+
+The agent often writes the same SELECT for repeated or similar questions, aggregates over events and
+player_events among them. SoccerDatabase.run looks the query up here first, keyed by its normalized text
+(whitespace and the case of anything outside string literals do not matter) and the database version of
+src.connection.database_version. Any commit, an ingestion for instance, changes the version and empties the
+cache. Entries are bounded by their size in memory, the least recently used are dropped first.
+
+SQL_CACHE_BYTES in .env sets the bound (32 MB by default), 0 disables the cache.
+"""
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# String literals, quoted identifiers and the text between them
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_SPACE = re.compile(r"\s+")
+_READ = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """sql with single spaces, lowercase and without a trailing semicolon, except inside quotes."""
+    parts = _LITERAL.split(sql.strip().rstrip(";").strip())
+    # The odd parts are the quoted ones
+    return "".join(part if i % 2 else _SPACE.sub(" ", part).lower() for i, part in enumerate(parts))
+
+
+def is_read_query(sql):
+    """Whether sql is a query (SELECT or WITH), whose result can be cached."""
+    return _READ.match(sql) is not None and ";" not in sql.strip().rstrip(";")
+
+
+class QueryCache:
+    """
+    LRU cache of query results for one database version, bounded by their size in bytes.
+
+    Usage:
+        cache = QueryCache(max_bytes=32 * 2 ** 20)
+        result = cache.get(sql, version)
+        if result is None:
+            result = run(sql)
+            cache.put(sql, version, result)
+        cache.stats()  # Hits, misses, evictions, entries and bytes
+    """
+
+    def __init__(self, max_bytes=32 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._version = None
+        self._entries = OrderedDict()  # normalized SQL -> (result, size)
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        # The entries of another version are stale, they are dropped at once rather than evicted one by one
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._version = version
+
+    def get(self, key, version):
+        """The result stored under key for version, or None."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, version, result):
+        """Store result under key for version, unless it alone is larger than the cache."""
+        size = sys.getsizeof(key) + sys.getsizeof(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = result, size
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Hits, misses, hit rate, evictions, invalidations, entries and bytes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def query_cache_from_env():
+    """The QueryCache configured in .env (see the module docstring), None when it is disabled."""
+    size = int(os.getenv("SQL_CACHE_BYTES") or 32 * 2 ** 20)
+    return QueryCache(size) if size > 0 else None
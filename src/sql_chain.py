@@ -1,10 +1,9 @@
 import logging
 import json
 import os
-from langchain_community.vectorstores import FAISS
+import time
 from langchain_core.example_selectors import SemanticSimilarityExampleSelector
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.agent_toolkits import create_sql_agent
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import (
     ChatPromptTemplate,
     FewShotPromptTemplate,
@@ -12,18 +11,21 @@ from langchain_core.prompts import (
     PromptTemplate,
     SystemMessagePromptTemplate,
 )
-from langchain_community.utilities import SQLDatabase
 from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from src.sql_database import get_database
+from src.instrumentation import SpanCallbackHandler, span, timed
+from src.few_shot import FewShotExamples, get_embeddings
+from src.templates import bind
 
 load_dotenv(".env")
 
 logging.basicConfig(level=logging.INFO)
 # Save the log to a file
-handler = logging.FileHandler('extractor.log')
+handler = logging.FileHandler('extractor.log', delay=True)
 logger = logging.getLogger(__name__)
 
-os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
-
 if os.getenv('LANGSMITH'):
     os.environ['LANGCHAIN_TRACING_V2'] = 'true'
     os.environ['LANGCHAIN_ENDPOINT'] = 'https://api.smith.langchain.com'
@@ -32,6 +34,26 @@ if os.getenv('LANGSMITH'):
     os.environ['LANGCHAIN_PROJECT'] = os.getenv('LANGSMITH_PROJECT')
 
 
+# Rows of a template query given to the summary, like the agent's top_k
+TEMPLATE_ROWS = 30
+
+# The precomputed and full-text tables, in the system prompt of the agent with and without few-shot examples
+TABLES_GUIDE = """For season totals, use the precomputed tables instead of aggregating player_events and games:
+        player_season_stats has one row per player_id, team_id, season and league_id with games, starts, goals, assists, yellow_cards and red_cards.
+        team_season_stats has one row per team_id, season and league_id with played, wins, draws, losses, points, goals_for, goals_against,
+        the same results split into home_ and away_ columns (home_wins, away_goals_for, ...), yellow_cards and red_cards.
+        To search the text of the commentary and captions, use the full-text table text_search(description, source, game_id, period, time)
+        with MATCH, for example WHERE text_search MATCH 'penalty', instead of LIKE on commentary.description or captions.description.
+        source is 'commentary' or 'caption'. Order the hits by text_search.rank to get the best matches first."""
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You answer questions about soccer games from the result of a SQL query on the database.
+    Answer the question with the rows only. If they do not answer it, say 'I don't know'.
+    DO NOT include information that is not present in the rows in your answer."""),
+    ("human", "Question: {input}\nSQL query: {query}\nColumns: {columns}\nRows: {rows}"),
+])
+
+
 def load_json(file_path: str) -> dict:
     with open(file_path, 'r') as file:
         return json.load(file)
@@ -39,13 +61,32 @@ def load_json(file_path: str) -> dict:
 
 class SqlChain:
     def __init__(self, few_shot_prompts: str, llm_model="gpt-3.5-turbo", db_uri="sqlite:///data/games.db",
-                 few_shot_k=2):
+                 few_shot_k=2, embeddings=None):
         self.llm = ChatOpenAI(model=llm_model, temperature=0)
-        self.db = SQLDatabase.from_uri(db_uri)
+        self.db = get_database(db_uri)
+        # The tables, keys and values the prompt describes, built now rather than on the first question
+        self.db.schema_digest()
         self.few_shot_k = few_shot_k
-        self.few_shot = self._set_up_few_shot_prompts(load_json(few_shot_prompts))
+        # Embeddings of the examples and questions, FEW_SHOT_EMBEDDINGS (OpenAI by default) when not given
+        self.embeddings = embeddings or get_embeddings()
+        # The index of the examples is built once and read from disk afterwards, see src/few_shot.py
+        self.examples = FewShotExamples(few_shot_prompts, self.embeddings, input_keys=["input"])
+        self.few_shot = self._set_up_few_shot_prompts(self.examples.vectorstore)
+        # Pick up examples added to the file while running, every FEW_SHOT_RELOAD_INTERVAL seconds
+        reload_interval = float(os.getenv('FEW_SHOT_RELOAD_INTERVAL') or 0)
+        if reload_interval > 0:
+            self.examples.watch(reload_interval, self._use_examples)
         self.full_prompt = None
+        # Times the LLM and tool calls of the agent when instrumentation is on
+        self.callbacks = [SpanCallbackHandler()]
+        # Questions close to an example run its SQL without the agent, see template_answer
+        self.fast_path = os.getenv('FAST_PATH', 'false').strip().lower() in ('1', 'true', 'yes')
+        self.fast_path_threshold = float(os.getenv('FAST_PATH_THRESHOLD') or 0.85)
+        self._agent_runs = 0
+        self._agent_seconds = 0.0
 
+        # The agent toolkits import every toolkit in langchain_community, so they are imported on first use
+        from langchain_community.agent_toolkits import create_sql_agent
         self.agent = create_sql_agent(
             llm=self.llm,
             db=self.db,
@@ -57,19 +98,28 @@ class SqlChain:
             top_k=30,
         )
 
-    def _set_up_few_shot_prompts(self, few_shot_prompts: dict) -> None:
-        few_shots = SemanticSimilarityExampleSelector.from_examples(
-            few_shot_prompts,
-            OpenAIEmbeddings(),
-            FAISS,
+    def _set_up_few_shot_prompts(self, vectorstore) -> SemanticSimilarityExampleSelector:
+        few_shots = SemanticSimilarityExampleSelector(
+            vectorstore=vectorstore,
             k=self.few_shot_k,
             input_keys=["input"],
         )
         return few_shots
 
+    def _use_examples(self, vectorstore):
+        # Prompts built from now on select from vectorstore, those being built keep the one they started with
+        self.few_shot.vectorstore = vectorstore
+
+    def reload_examples(self):
+        """Update the few-shot examples to their file, embedding only the new ones. Returns (added, deleted)."""
+        added, deleted = self.examples.reload()
+        self._use_examples(self.examples.vectorstore)
+        return added, deleted
+
+    @timed("few_prompt_construct")
     def few_prompt_construct(self, query: str, top_k=5, dialect="SQLite") -> str:
 
-        system_prefix = """You are an agent designed to interact with a SQL database.
+        system_prefix = ("""You are an agent designed to interact with a SQL database.
         Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
         ALWAYS query the database before returning an answer.
         Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
@@ -79,13 +129,19 @@ class SqlChain:
         Only use the given tools. Only use the information returned by the tools to construct your final answer.
         You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
 
+        """ + TABLES_GUIDE + """
+
         DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
 
         If the question does not seem related to the database, just return 'I don't know' as the answer.
         DO NOT include information that is not present in the database in your answer.
 
+        The tables of the database are described below. Write the query from this description, without listing
+        the tables or asking for their schema first. Only use the schema tool for something it does not cover.
+        {schema}
+
         Here are some examples of user inputs and their corresponding SQL queries. They are tested and works.
-        Use them as a guide when creating your own queries:"""
+        Use them as a guide when creating your own queries:""")
 
         # SUFFIX = """Begin!
         #
@@ -97,7 +153,7 @@ class SqlChain:
 
             Question: {input}
             Thought: I should look at the examples provided and see if I can use them to identify tables and how to build the query.  
-            Then I should query the schema of the most relevant tables.
+            Then I should write the query from the description of the tables, querying the schema only for what it does not cover.
             I will not stop until I query the database and return the answer.
             {agent_scratchpad}"""
 
@@ -106,7 +162,7 @@ class SqlChain:
             example_prompt=PromptTemplate.from_template(
                 "User input: {input}\nSQL query: {query}"
             ),
-            input_variables=["input", "dialect", "top_k"],
+            input_variables=["input", "dialect", "top_k", "schema"],
             prefix=system_prefix,
             suffix=SUFFIX,
         )
@@ -122,12 +178,14 @@ class SqlChain:
                 "input": query,
                 "top_k": top_k,
                 "dialect": dialect,
+                # Cached until the schema changes, see SoccerDatabase.schema_digest
+                "schema": self.db.schema_digest(),
                 "agent_scratchpad": [],
             }
         )
 
     def prompt_no_few_shot(self, query: str, dialect="SQLite") -> str:
-        system_prefix = """You are an agent designed to interact with a SQL database.
+        system_prefix = ("""You are an agent designed to interact with a SQL database.
         Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
         Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
         You can order the results by a relevant column to return the most interesting examples in the database.
@@ -136,14 +194,24 @@ class SqlChain:
         Only use the given tools. Only use the information returned by the tools to construct your final answer.
         You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
 
+        """ + TABLES_GUIDE + """
+
         DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
 
         If the question does not seem related to the database, just return 'I don't know' as the answer.
-        DO NOT include information that is not present in the database in your answer."""
+        DO NOT include information that is not present in the database in your answer.""")
 
         return f"{system_prefix}\n{query}"
 
-    def ask(self, query: str, few_prompt: bool = True, rag_test=False) -> str:
+    def ask(self, query: str, few_prompt: bool = True, rag_test=False, bindings=None) -> str:
+        """
+        Answer query, the cleaned question, with the agent, or with the SQL of a few-shot example when bindings
+        (PromptCleaner.clean with return_bindings) are given and one matches, see template_answer.
+
+        Returns:
+            (dict, prompt): The answer, with "output", the "path" taken ("template" or "agent"), "latency_ms" and
+            "latency_saved_ms", and the prompt of the agent, or the SQL run on the template path.
+        """
         if rag_test:
             self.few_prompt_construct(query)
             # Alter the self.full_prompt to only include whats added by the RAG system
@@ -159,16 +227,75 @@ class SqlChain:
             # Then remove the first element
             prompt = prompt[1:]
             return prompt
+        config = {"callbacks": self.callbacks}
+        start = time.perf_counter()
+        if few_prompt and bindings and self.fast_path:
+            with span("template"):
+                answer = self.template_answer(query, bindings)
+            if answer is not None:
+                elapsed = time.perf_counter() - start
+                answer["path"] = "template"
+                answer["latency_ms"] = round(elapsed * 1000, 3)
+                # Against the mean time of the agent so far, unknown before its first answer
+                answer["latency_saved_ms"] = (round((self._agent_seconds / self._agent_runs - elapsed) * 1000, 3)
+                                              if self._agent_runs else None)
+                logger.info("Answered with the SQL of the example %r in %.0f ms", answer["example"],
+                            answer["latency_ms"])
+                return answer, answer["sql"]
         if few_prompt:
             self.few_prompt_construct(query)
-            return self.agent.invoke({"input": self.full_prompt}), self.full_prompt
+            prompt = self.full_prompt
+            with span("agent"):
+                answer = self.agent.invoke({"input": prompt}, config=config)
         else:
+            prompt = self.prompt_no_few_shot(query)
+            with span("agent"):
+                answer = self.agent.invoke(prompt, config=config)
+        elapsed = time.perf_counter() - start
+        self._agent_runs += 1
+        self._agent_seconds += elapsed
+        answer["path"] = "agent"
+        answer["latency_ms"] = round(elapsed * 1000, 3)
+        answer["latency_saved_ms"] = 0.0
+        return answer, prompt
+
+    def template_answer(self, query, bindings):
+        """
+        Answer query with the SQL of the nearest few-shot example, its placeholders bound to the entities of the
+        question, and one LLM call writing the answer from the rows.
+
+        Args:
+            query (str): The cleaned question.
+            bindings (dict): The template bindings of the question, from PromptCleaner.clean.
 
-            return self.agent.invoke(self.prompt_no_few_shot(query)), self.prompt_no_few_shot(query)
+        Returns:
+            dict: "output", "sql", "parameters", "example" (its input) and "similarity", or None when no example is
+            as similar as FAST_PATH_THRESHOLD, the nearest cannot be bound or its query fails.
+        """
+        found = self.few_shot.vectorstore.similarity_search_with_relevance_scores(bindings["question"], k=1)
+        if not found or found[0][1] < self.fast_path_threshold:
+            return None
+        document, similarity = found[0]
+        bound = bind(document.metadata["query"], bindings, document.metadata["input"])
+        if bound is None:
+            return None
+        statement, parameters = bound
+        try:
+            with span("template.sql"), self.db._engine.connect() as connection:
+                result = connection.execute(text(statement), parameters)
+                columns = list(result.keys())
+                rows = [tuple(row) for row in result.fetchmany(TEMPLATE_ROWS)]
+        except SQLAlchemyError as error:
+            logger.warning("The SQL of the example %r failed, asking the agent: %s", document.metadata["input"], error)
+            return None
+        messages = SUMMARY_PROMPT.format_messages(input=query, query=statement, columns=columns, rows=rows)
+        output = self.llm.invoke(messages, config={"callbacks": self.callbacks}).content
+        return {"input": query, "output": output, "sql": statement, "parameters": parameters,
+                "example": document.metadata["input"], "similarity": similarity}
 
 
 def create_agent(few_shot_prompts: str = "src/conf/sqls.json", llm_model="gpt-3.5-turbo-0125",
-                 db_uri="config", few_shot_k=2):
+                 db_uri="config", few_shot_k=2, embeddings=None):
     """ Create an agent with the given few_shot_prompts, llm_model and db_uri
      Call it with agent.ask(prompt)"""
     if db_uri == "config":
@@ -177,7 +304,7 @@ def create_agent(few_shot_prompts: str = "src/conf/sqls.json", llm_model="gpt-3.
         # print(db_uri)
         # print("sqlite:///data/games.db")
         # exit(0)
-    return SqlChain(few_shot_prompts, llm_model, db_uri, few_shot_k)
+    return SqlChain(few_shot_prompts, llm_model, db_uri, few_shot_k, embeddings)
 
 
 if __name__ == "__main__":
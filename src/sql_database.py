@@ -0,0 +1,208 @@
+"""
+The SQLDatabase shared by the extractor and the SQL agent.
+
+langchain's SQLDatabase reflects every table of the database when it is created, and the extractor and the agent
+each created their own. get_database returns one SoccerDatabase per URI, on the shared engine of src.connection,
+that reflects a table the first time the agent asks for its description and caches the descriptions until
+the database changes. The internal tables (ingest_manifest, the shadow tables of the FTS5 index) are hidden from
+the agent.
+
+schema_digest describes every table in a few lines (columns, keys, indexes, the values of the columns that have
+few), for the system prompt of the agent, so it does not spend its first LLM round-trips on the schema tools.
+It is built once per schema, PRAGMA schema_version tells when the tables or indexes changed.
+
+run, which the agent's query tool calls, keeps the results of queries in a QueryCache (src/query_cache.py) until
+the data changes.
+"""
+import os
+import threading
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import MetaData, String, inspect
+
+from src.connection import engine_from_uri, database_path, engine_path, database_version
+from src.query_cache import is_read_query, normalize_sql, query_cache_from_env
+
+# Bookkeeping of the ingestion, nothing a question is about
+INTERNAL_TABLES = {"ingest_manifest"}
+# Tables FTS5 creates next to a virtual table <name>, as <name>_data, ...
+_FTS5_SHADOWS = ("_data", "_idx", "_content", "_docsize", "_config")
+# Text columns with at most this many distinct values have them listed in the schema digest
+DIGEST_VALUES = 20
+
+_databases = {}  # engine -> SoccerDatabase
+_databases_lock = threading.Lock()
+
+
+class SoccerDatabase(SQLDatabase):
+    """
+    SQLDatabase that reflects tables on demand and caches get_table_info.
+
+    Usage:
+        db = get_database()  # Shared, rather than SoccerDatabase(engine)
+        db.get_table_info(["players", "teams"])
+    """
+
+    def __init__(self, engine, ignore_tables=None, sample_rows_in_table_info=3, indexes_in_table_info=False,
+                 custom_table_info=None, max_string_length=300):
+        """
+        Args:
+            engine: SQLAlchemy engine, as returned by src.connection.engine_from_uri.
+            ignore_tables (list of str): Tables hidden besides the internal ones.
+            The other arguments are those of SQLDatabase.
+        """
+        # The attributes SQLDatabase.__init__ sets, without the reflection of every table at the end
+        self._engine = engine
+        self._schema = None
+        self._inspector = inspect(engine)
+        self._all_tables = set(self._inspector.get_table_names())
+        virtual = self._virtual_tables()
+        self._include_tables = set()
+        internal = INTERNAL_TABLES | {name + shadow for name in virtual for shadow in _FTS5_SHADOWS}
+        self._ignore_tables = (internal | set(ignore_tables or ())) & self._all_tables
+        self._usable_tables = set(self.get_usable_table_names())
+        self._sample_rows_in_table_info = sample_rows_in_table_info
+        self._indexes_in_table_info = indexes_in_table_info
+        # Reflection gives the columns of a virtual table no type, which SQLDatabase drops, and the sample rows
+        # query then selects nothing. They are described by their CREATE statement instead
+        self._custom_table_info = {table: info for table, info in dict(virtual, **(custom_table_info or {})).items()
+                                   if table in self._all_tables}
+        self._max_string_length = max_string_length
+        self._metadata = MetaData()
+        self._path = engine_path(engine)
+        self._table_info = {}  # tuple of table names or None -> (database version, info)
+        self._digest = None  # (schema version, digest)
+        # Results of the queries of run, SQL_CACHE_BYTES in .env, None when disabled
+        self.results = query_cache_from_env() if self._path else None
+        self._lock = threading.Lock()
+
+    def _virtual_tables(self):
+        # name -> CREATE VIRTUAL TABLE statement
+        if self._engine.dialect.name != "sqlite":
+            return {}
+        with self._engine.connect() as connection:
+            return dict(connection.exec_driver_sql(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'").all())
+
+    def _reflect(self, table_names):
+        # Reflect the tables not reflected yet, under the lock as get_table_info edits the reflected tables
+        missing = [name for name in table_names if name not in self._metadata.tables]
+        if missing:
+            self._metadata.reflect(bind=self._engine, only=missing)
+
+    def get_table_info(self, table_names=None):
+        """SQLDatabase.get_table_info, computed once per set of tables until the database changes."""
+        key = tuple(sorted(set(table_names))) if table_names is not None else None
+        version = database_version(self._path) if self._path else None
+        if key is not None:
+            missing_tables = set(key).difference(self.get_usable_table_names())
+            if missing_tables:
+                raise ValueError(f"table_names {missing_tables} not found in database")
+        with self._lock:
+            cached = self._table_info.get(key)
+            if cached is not None and cached[0] == version and version is not None:
+                return cached[1]
+            self._reflect(key if key is not None else self.get_usable_table_names())
+            info = super().get_table_info(list(key) if key is not None else None)
+            self._table_info[key] = version, info
+            return info
+
+    def run(self, command, fetch="all", include_columns=False):
+        """SQLDatabase.run, with the result of a query cached until the database changes."""
+        if self.results is None or not is_read_query(command):
+            return super().run(command, fetch, include_columns)
+        key = f"{fetch}:{include_columns:d}:{normalize_sql(command)}"
+        version = database_version(self._path)
+        result = self.results.get(key, version)
+        if result is None:
+            # Errors are raised, and run_no_throw reports them, without being cached
+            result = super().run(command, fetch, include_columns)
+            self.results.put(key, version, result)
+        return result
+
+    def schema_version(self):
+        """What changes when a table or index is created, altered or dropped, or the file is replaced."""
+        if self._engine.dialect.name != "sqlite":
+            return None
+        with self._engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA schema_version").scalar()
+        return (os.stat(self._path).st_ino if self._path and os.path.exists(self._path) else None), version
+
+    def _distinct_values(self, connection, table, column):
+        # The values of column when it has at most DIGEST_VALUES of them, None otherwise
+        values = connection.exec_driver_sql(
+            f'SELECT DISTINCT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL LIMIT {DIGEST_VALUES + 1}').all()
+        if not values or len(values) > DIGEST_VALUES:
+            return None
+        return sorted(str(value)[:40] for value, in values)
+
+    def _build_digest(self):
+        inspector = inspect(self._engine)
+        virtual = self._custom_table_info
+        lines = ["Tables, as table(column, ...), PK the primary key, -> table.column a foreign key:"]
+        values, indexes = [], []
+        with self._engine.connect() as connection:
+            for table in sorted(self.get_usable_table_names()):
+                columns = inspector.get_columns(table)
+                if table in virtual:
+                    lines.append(f"{table}({', '.join(column['name'] for column in columns)}): full-text index, "
+                                 f"query it with {table} MATCH '...'")
+                    continue
+                primary_key = set(inspector.get_pk_constraint(table)["constrained_columns"])
+                references = {}
+                for foreign_key in inspector.get_foreign_keys(table):
+                    for column, referred in zip(foreign_key["constrained_columns"], foreign_key["referred_columns"]):
+                        references[column] = f"{foreign_key['referred_table']}.{referred}"
+                # Small lookup tables, like the labels of player_events.type, are listed whole
+                rows = None
+                if len(columns) == 2 and primary_key:
+                    rows = connection.exec_driver_sql(f'SELECT * FROM "{table}" LIMIT {DIGEST_VALUES + 1}').all()
+                    if len(rows) <= DIGEST_VALUES:
+                        values.append(f"{table} rows: {', '.join(f'{key}={value}' for key, value in rows)}")
+                    else:
+                        rows = None
+                described = []
+                for column in columns:
+                    name = column["name"]
+                    described.append(name + (" PK" if name in primary_key else "")
+                                     + (f" -> {references[name]}" if name in references else ""))
+                    if (rows is not None or name in primary_key or name in references
+                            or not isinstance(column["type"], String)):
+                        continue
+                    found = self._distinct_values(connection, table, name)
+                    if found:
+                        values.append(f"{table}.{name}: {', '.join(repr(value) for value in found)}")
+                lines.append(f"{table}({', '.join(described)})")
+                indexes.extend(f"{table}({', '.join(index['column_names'])})"
+                               for index in inspector.get_indexes(table) if not index["name"].startswith("sqlite_"))
+        if values:
+            lines.append("Values of the columns with few of them:")
+            lines.extend(values)
+        if indexes:
+            lines.append(f"Indexes: {', '.join(indexes)}")
+        return "\n".join(lines)
+
+    def schema_digest(self):
+        """
+        Compact description of the tables for the prompt of the agent: their columns, primary and foreign keys,
+        indexes, and the values of the text columns with few of them (events.label, player_event_labels, ...).
+        Built again only when schema_version changes.
+        """
+        version = self.schema_version()
+        with self._lock:
+            if self._digest is None or self._digest[0] != version:
+                self._digest = version, self._build_digest()
+            return self._digest[1]
+
+
+def get_database(uri=None):
+    """
+    Return the shared, read-only SoccerDatabase for uri (sqlite:///DATABASE_PATH by default), created on
+    first use.
+    """
+    # Keyed by engine, which src.connection shares per file, so URIs of the same file share the database
+    engine = engine_from_uri(uri or f"sqlite:///{database_path()}", read_only=True)
+    with _databases_lock:
+        if engine not in _databases:
+            _databases[engine] = SoccerDatabase(engine)
+        return _databases[engine]
@@ -0,0 +1,146 @@
+"""
+SQL examples of src/conf/sqls.json used as templates, for the fast path of SqlChain.ask.
+
+The examples are written with placeholders for the entities of the question ("How many goals did <player>
+score in <season>?", "... WHERE p.name = '<player>' AND g.season = '<season>'"). template_bindings turns what
+PromptCleaner found in a question into the question with the same placeholders, to find the nearest example, and
+the values of the placeholders. bind makes the query of that example a parameterized statement, when the question
+has the wording of the example outside the placeholders ("assists" is not "goals", however similar their
+embeddings), a value for every placeholder, and every entity of the question is used, so nothing the question asks
+for is dropped.
+"""
+import re
+
+# Placeholder -> (schema property, which of its values, the value or its primary key)
+PLACEHOLDERS = {
+    "player": ("person_name", 0, "value"),
+    "player_hash": ("person_name", 0, "pk"),
+    "team": ("team_name", 0, "value"),
+    "team2": ("team_name", 1, "value"),
+    "league": ("league", 0, "value"),
+    "league_id": ("league", 0, "pk"),
+    "season": ("year_season", 0, "value"),
+    "event": ("in_game_event", 0, "value"),
+}
+_PLACEHOLDER = re.compile(r"<(\w+)>")
+_WORD = re.compile(r"\w+")
+# Words that do not change what a question asks for, "season" and "league" restate their placeholder
+_FILLERS = {"a", "an", "the", "in", "of", "for", "by", "at", "to", "did", "does", "do", "was", "were", "is", "are",
+            "season", "league"}
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def template_bindings(prompt, properties, properties_original, pks, keyed=()):
+    """
+    The bindings of a cleaned question for bind and SqlChain.ask, None when it has no entities.
+
+    Args:
+        prompt (str): The question as asked.
+        properties, properties_original, pks: The validated properties, the extracted ones and their primary
+            keys, as in PromptCleaner.clean.
+        keyed: The properties having a primary key. Their values without one are not in the database and get
+            no placeholder value, so no template is bound.
+
+    Returns:
+        dict: "question", the question with the placeholders in place of the entities as written, "values",
+        the value of each placeholder, "counts", the number of values of each property, and "written", its
+        values as written.
+    """
+    if not properties:
+        return None
+    properties, original = properties[0], (properties_original or [{}])[0]
+    pks = (pks or [{}])[0]
+    values, counts, written = {}, {}, {}
+    for name, found in properties.items():
+        if _as_list(found):
+            counts[name] = len(_as_list(found))
+            written[name] = [str(value) for value in _as_list(original.get(name)) if value]
+    question = prompt
+    for placeholder, (name, position, kind) in PLACEHOLDERS.items():
+        found = _as_list(properties.get(name))
+        if position >= len(found):
+            continue
+        value = found[position]
+        keys = _as_list(pks.get(f"{name}_pk"))
+        key = keys[position] if position < len(keys) else None
+        if name in keyed and key is None:
+            continue
+        if kind == "pk":
+            value = key
+        elif isinstance(value, str) and position < len(written.get(name, [])) and name != "in_game_event":
+            # Events stay as written, the examples have them in their text ("all goals scored by <team>")
+            question = re.sub(re.escape(written[name][position]), f"<{placeholder}>", question, count=1,
+                              flags=re.IGNORECASE)
+        if value is not None and not isinstance(value, list):
+            values[placeholder] = value
+    return {"question": question, "values": values, "counts": counts, "written": written}
+
+
+def _wording(text):
+    # The words of text outside its placeholders, without fillers and plural s
+    words = set()
+    for word in _WORD.findall(_PLACEHOLDER.sub(" ", text).lower()):
+        if word not in _FILLERS:
+            words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return words
+
+
+def same_wording(example_input, bindings):
+    """Whether the question of bindings asks what example_input does, word for word outside the placeholders."""
+    question = bindings["question"]
+    if "<event>" in example_input:
+        # The events of the question stay as written, the example has them as its placeholder
+        for value in bindings["written"].get("in_game_event", []):
+            question = re.sub(rf"\b{re.escape(value)}\b", " ", question, count=1, flags=re.IGNORECASE)
+    return _wording(question) == _wording(example_input)
+
+
+def bind(query, bindings, example_input=""):
+    """
+    Return (statement, parameters) of query with its placeholders as bound parameters, or None when the question
+    is not worded like example_input (see same_wording), a placeholder has no value, sits inside a longer string
+    literal, or an entity of the question is not used. query without placeholders is not a template and gives None
+    too.
+
+    An entity written the same in example_input, the question of the example, is part of the template: the
+    "goals" of "How many goals did <player> score in <season>?" needs no placeholder.
+    """
+    if not same_wording(example_input, bindings):
+        return None
+    statement, parameters, used = [], {}, {}
+    position = 0
+    for match in _PLACEHOLDER.finditer(query):
+        name = match.group(1)
+        start, end = match.span()
+        quoted = query[start - 1:start] == "'" and query[end:end + 1] == "'"
+        # Inside a string literal, the placeholder is only a value when it is the whole literal
+        if query[:start].count("'") % 2 == 1 and not quoted:
+            return None
+        if name not in PLACEHOLDERS or name not in bindings["values"]:
+            return None
+        statement.append(query[position:start - 1] if quoted else query[position:start])
+        statement.append(f":{name}")
+        parameters[name] = bindings["values"][name]
+        position = end + 1 if quoted else end
+        prop, index, _ = PLACEHOLDERS[name]
+        used.setdefault(prop, set()).add(index)
+    if not used:
+        return None
+    statement.append(query[position:])
+    # Every value of every property of the question, and nothing the question does not have
+    if set(used) - set(bindings["counts"]):
+        return None
+    example_input = example_input.lower()
+    for prop, count in bindings["counts"].items():
+        if prop in used:
+            if used[prop] != set(range(count)):
+                return None
+        elif len(bindings["written"][prop]) != count or not all(
+                re.search(rf"\b{re.escape(value.lower())}\b", example_input) for value in bindings["written"][prop]):
+            return None
+    return "".join(statement), parameters
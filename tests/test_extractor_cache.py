@@ -0,0 +1,64 @@
+import json
+
+import langchain.chains
+from langchain_community.chat_models.fake import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+
+from benchmarks.bench_local_extraction import create_database
+from src.cache import ResponseCache
+from src.extractor import Extractor, PromptCleaner, load_json
+from src.sql_database import get_database
+
+PROMPT = "How many goals did Messi score in the 2015-2016 season?"
+PROPERTIES = [{"person_name": ["Messi"], "year_season": ["2015-2016"]}]
+
+
+class CountingChatModel(FakeMessagesListChatModel):
+    calls: int = 0
+
+    def _generate(self, *args, **kwargs):
+        self.calls += 1
+        return super()._generate(*args, **kwargs)
+
+
+def fake_llm():
+    # What the OpenAI function calling of the extraction chain returns
+    arguments = json.dumps({"info": PROPERTIES})
+    message = AIMessage(content="", additional_kwargs={
+        "function_call": {"name": "information_extraction", "arguments": arguments}})
+    return CountingChatModel(responses=[message] * 10)
+
+
+def test_extraction_chain_is_built_once(monkeypatch):
+    built = []
+    create = langchain.chains.create_extraction_chain
+
+    def create_extraction_chain(*args, **kwargs):
+        built.append(args)
+        return create(*args, **kwargs)
+
+    monkeypatch.setattr(langchain.chains, "create_extraction_chain", create_extraction_chain)
+    llm = fake_llm()
+    extractor = Extractor(schema_config=load_json("src/conf/schema.json"), llm=llm)
+    chain = extractor.get_chain()
+    assert extractor.extract(PROMPT)["text"] == PROPERTIES
+    assert extractor.extract("Is Manchester United in the database?")["text"] == PROPERTIES
+    assert extractor.get_chain() is chain
+    assert len(built) == 1
+    assert llm.calls == 2
+
+
+def test_repeated_prompt_is_answered_from_the_cache(tmp_path):
+    path = str(tmp_path / "games.db")
+    create_database(path, 10)
+    llm = fake_llm()
+    cleaner = PromptCleaner(get_database(f"sqlite:///{path}"), load_json("src/conf/schema.json"), llm=llm,
+                            cache=ResponseCache(max_entries=16), extraction="llm")
+    assert cleaner.extract(PROMPT) == PROPERTIES
+    assert llm.calls == 1
+    # Again, and with other whitespace
+    assert cleaner.extract(PROMPT) == PROPERTIES
+    assert cleaner.extract("  How many goals  did Messi score in the 2015-2016 season? ") == PROPERTIES
+    assert llm.calls == 1
+    assert cleaner.cache.hits == 2
+    assert cleaner.cache.misses == 1
@@ -0,0 +1,88 @@
+import gc
+import json
+import time
+import weakref
+
+from src.few_shot import FewShotExamples, LocalEmbeddings, few_shot_vectorstore, update_vectorstore
+
+EXAMPLES = [
+    {"input": "How many goals did <player> score in <season>?", "query": "SELECT 1"},
+    {"input": "List the games of <team> in <season>", "query": "SELECT 2"},
+]
+
+
+def test_cached_vectorstore_uses_the_callers_embeddings(tmp_path):
+    first, second = LocalEmbeddings(), LocalEmbeddings()
+    vectorstore = few_shot_vectorstore(EXAMPLES, first, directory=str(tmp_path))
+    shared = few_shot_vectorstore(EXAMPLES, second, directory=str(tmp_path))
+
+    # Same index and documents, but the questions of the second caller are embedded with its own embeddings
+    assert shared.index is vectorstore.index
+    assert shared.embedding_function is second
+    assert vectorstore.embedding_function is first
+
+    updated, added, deleted = update_vectorstore(vectorstore, EXAMPLES[:1], first, directory=str(tmp_path))
+    again, _, _ = update_vectorstore(shared, EXAMPLES[:1], second, directory=str(tmp_path))
+    assert (added, deleted) == (0, 1)
+    assert again.index is updated.index
+    assert again.embedding_function is second
+
+
+class FailingEmbeddings(LocalEmbeddings):
+    """LocalEmbeddings failing the first calls, like an API with a revoked key."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def embed_documents(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Incorrect API key provided")
+        return super().embed_documents(texts)
+
+
+def test_one_watcher_per_file_survives_errors_and_stops(tmp_path):
+    path = tmp_path / "sqls.json"
+    path.write_text(json.dumps(EXAMPLES))
+    first = FewShotExamples(str(path), LocalEmbeddings(), directory=str(tmp_path / "index"))
+    second = FewShotExamples(str(path), LocalEmbeddings(), directory=str(tmp_path / "index"))
+    reloaded = []
+    watcher = first.watch(0.01, reloaded.append)
+    assert second.watch(0.05) is watcher
+
+    # An embedding error is logged and the file checked again, not the end of the watcher
+    first.embeddings = FailingEmbeddings(failures=1)
+    path.write_text(json.dumps(EXAMPLES + [{"input": "Which team won <league> in <season>?", "query": "SELECT 3"}]))
+    deadline = time.monotonic() + 5
+    while not reloaded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(reloaded) == 1 and len(reloaded[0].index_to_docstore_id) == 3
+    assert watcher._thread.is_alive()
+
+    first.stop()
+    assert watcher._thread.is_alive()
+    second.stop()
+    watcher._thread.join(1)
+    assert not watcher._thread.is_alive()
+
+
+def test_watcher_does_not_keep_its_examples_alive(tmp_path):
+    path = tmp_path / "sqls.json"
+    path.write_text(json.dumps(EXAMPLES))
+
+    class Chain:
+        def __init__(self):
+            self.examples = FewShotExamples(str(path), LocalEmbeddings(), directory=str(tmp_path / "index"))
+            self.watcher = self.examples.watch(0.01, self.use)
+
+        def use(self, vectorstore):
+            pass
+
+    chain = Chain()
+    watcher, collected = chain.watcher, weakref.ref(chain)
+    del chain
+    gc.collect()
+    assert collected() is None
+    watcher._thread.join(1)
+    assert not watcher._thread.is_alive()
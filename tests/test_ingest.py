@@ -0,0 +1,48 @@
+import json
+import os
+import sqlite3
+
+from benchmarks.synthetic import generate_corpus
+from src.connection import get_engine
+from src.ingest import bulk_process_json_files, find_game_dirs
+
+
+def text_counts(path):
+    connection = sqlite3.connect(path)
+    try:
+        return tuple(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                     for table in ("commentary", "captions", "text_search"))
+    finally:
+        connection.close()
+
+
+def test_incremental_refresh_keeps_text_search_in_sync(tmp_path):
+    corpus = str(tmp_path / "SoccerNet")
+    generate_corpus(corpus, leagues=1, seasons=1, games=4, segments=50)
+    path = str(tmp_path / "games.db")
+    engine = get_engine(path)
+    bulk_process_json_files(corpus, engine)
+    commentary, captions, indexed = text_counts(path)
+    assert indexed == commentary + captions
+
+    # In the order they are loaded, so the last game has the highest ids
+    game_dirs = [root for root, *_ in find_game_dirs(corpus)]
+    # A changed caption of the last game
+    caption_path = os.path.join(game_dirs[-1], "Labels-caption.json")
+    with open(caption_path) as file:
+        caption = json.load(file)
+    caption["annotations"][0]["description"] = "a changed description"
+    with open(caption_path, "w") as file:
+        json.dump(caption, file)
+    # And a removed commentary file
+    os.remove(os.path.join(game_dirs[0], "1_half-ASR.json"))
+    bulk_process_json_files(corpus, engine)
+
+    refreshed = text_counts(path)
+    assert refreshed[0] == commentary - 50
+    assert refreshed[1] == captions
+    assert refreshed[2] == refreshed[0] + refreshed[1]
+    connection = sqlite3.connect(path)
+    hits = connection.execute("SELECT COUNT(*) FROM text_search WHERE text_search MATCH 'changed'").fetchone()[0]
+    connection.close()
+    assert hits == 1
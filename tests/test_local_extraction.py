@@ -0,0 +1,41 @@
+import pytest
+
+from src.local_extraction import LocalExtractor
+
+
+class StubRetriever:
+    def __init__(self, values=(), numeric=False):
+        self.values = list(values)
+        self.numeric = numeric
+        self.augmented_table = None
+
+    def query_as_list(self):
+        return self.values
+
+
+@pytest.fixture
+def extractor():
+    return LocalExtractor({
+        "person_name": StubRetriever(["Lionel Messi", "Cristiano Ronaldo"]),
+        "team_name": StubRetriever(["Real Madrid", "Barcelona"]),
+        "in_game_event": StubRetriever(["Goal", "Yellow card"]),
+        "year_season": StubRetriever(numeric=True),
+    })
+
+
+def test_known_entities_are_certain(extractor):
+    assert extractor.extract("How many goals did Lionel Messi score against Real Madrid in 2015-2016?") == (
+        [{"in_game_event": ["goals"], "person_name": ["Lionel Messi"], "team_name": ["Real Madrid"],
+          "year_season": ["2015-2016"]}], True)
+
+
+def test_lowercase_unknown_name_is_uncertain(extractor):
+    properties, certain = extractor.extract("how many goals did messi score in 2015-2016")
+    assert properties == [{"in_game_event": ["goals"], "year_season": ["2015-2016"]}]
+    assert not certain
+
+
+def test_unmatched_opponent_is_uncertain(extractor):
+    properties, certain = extractor.extract("how many goals did Lionel Messi score vs atletico madrid")
+    assert properties == [{"in_game_event": ["goals"], "person_name": ["Lionel Messi"]}]
+    assert not certain
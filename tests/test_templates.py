@@ -0,0 +1,46 @@
+from copy import deepcopy
+
+from src.templates import bind
+
+EXAMPLE = "How many goals did <player> score in <season>?"
+QUERY = "SELECT COUNT(*) FROM goals g JOIN players p ON p.id = g.player_id WHERE p.name = '<player>' AND g.season = '<season>'"
+
+
+def bindings(question):
+    return {"question": question, "values": {"player": "Lionel Messi", "season": "2015-2016"},
+            "counts": {"person_name": 1, "year_season": 1},
+            "written": {"person_name": ["Messi"], "year_season": ["2015-2016"]}}
+
+
+def test_template_needs_the_wording_of_the_example():
+    statement, parameters = bind(QUERY, bindings("how many goals did <player> score in the <season> season"), EXAMPLE)
+    assert ":player" in statement and parameters == {"player": "Lionel Messi", "season": "2015-2016"}
+    # As close as it gets in embeddings, but another question
+    assert bind(QUERY, bindings("How many assists did <player> score in <season>?"), EXAMPLE) is None
+
+
+def test_cleaner_returns_the_bindings_of_each_prompt(tmp_path):
+    from benchmarks.bench_local_extraction import create_database
+    from src.extractor import PromptCleaner, load_json
+    from src.sql_database import get_database
+
+    path = str(tmp_path / "questions.db")
+    create_database(path, players=10)
+    db = get_database(f"sqlite:///{path}")
+    cleaner = PromptCleaner(db, load_json("src/conf/schema.json"), extraction="local", cache=False)
+    try:
+        # Two sessions of the Chainlit app, the second extracted before the first builds its prompt
+        first, second = "How many goals did Adnan Januzaj score?", "How many goals did Eden Hazard score?"
+        first_extracted = cleaner.extract_chainlit(first)
+        second_extracted = cleaner.extract_chainlit(second)
+        validated, _ = cleaner.validate_chainlit(deepcopy(first_extracted))
+        prompt, bindings = cleaner.build_prompt_chainlit([validated], first, first_extracted, return_bindings=True)
+        assert bindings["values"]["player"] == "Adnan Januzaj"
+        assert bindings["question"] == "How many goals did <player> score?"
+        assert second_extracted != first_extracted
+
+        (clean, _), bindings = cleaner.clean(second, verbose=True, return_bindings=True)
+        assert bindings["values"]["player"] == "Eden Hazard"
+        assert not hasattr(cleaner, "last_bindings")
+    finally:
+        db._engine.dispose()